@@ -0,0 +1,45 @@
+"""user quiz status
+
+Revision ID: 8c51f2a7d3e9
+Revises: f6b6be1468d7
+Create Date: 2026-10-17 12:00:12.418305
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8c51f2a7d3e9'
+down_revision = 'f6b6be1468d7'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table('user_quiz_status',
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('quiz_id', sa.Integer(), nullable=False),
+    sa.Column('last_attempt_at', sa.DateTime(timezone=True), nullable=False),
+    sa.Column('due_at', sa.DateTime(timezone=True), nullable=False),
+    sa.ForeignKeyConstraint(['quiz_id'], ['quizzes.id'], ),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('user_id', 'quiz_id')
+    )
+    op.create_index(op.f('ix_user_quiz_status_due_at'), 'user_quiz_status', ['due_at'], unique=False)
+
+    # Backfill from the existing attempts
+    op.execute("""
+        INSERT INTO user_quiz_status (user_id, quiz_id, last_attempt_at, due_at)
+        SELECT attempts.user_id, attempts.quiz_id, max(attempts.created_at),
+            max(attempts.created_at) + make_interval(days => quizzes.frequency + 1)
+        FROM attempts
+        JOIN quizzes ON quizzes.id = attempts.quiz_id
+        WHERE attempts.created_at IS NOT NULL
+        GROUP BY attempts.user_id, attempts.quiz_id, quizzes.frequency
+    """)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_user_quiz_status_due_at'), table_name='user_quiz_status')
+    op.drop_table('user_quiz_status')
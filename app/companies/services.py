@@ -7,6 +7,7 @@ from app.users.models import Users
 from app.users.utils import serialize_user
 from app.users.exceptions import UserNotFoundException
 from app.users.services import user_service
+from app.users.cache import company_role_cache
 from app.users.constants import ExceptionDetails as UserExceptionDetails
 
 from app.companies.models import Companies, CompanyMembers
@@ -48,7 +49,8 @@ class CompanyService:
             )
             await database.fetch_one(add_owner_to_members_query)
 
-            return serialize_company(company)
+        await company_role_cache.invalidate(company.id)
+        return serialize_company(company)
 
     async def get_company_by_id(self, company_id: int) -> CompanyResponse:
         company = await self._get_db_company_by_id(company_id)
@@ -79,7 +81,7 @@ class CompanyService:
         if company is None:
             raise CompanyNotFoundException(ExceptionDetails.COMPANY_WITH_ID_NOT_FOUND(company_id))
 
-        async with database.transaction():
+        async with company_role_cache.invalidating(company_id), database.transaction():
             delete_members_query = delete(CompanyMembers).where(CompanyMembers.company_id == company_id)
             await database.fetch_all(delete_members_query)
             delete_company_query = delete(Companies).where(Companies.id == company_id)
@@ -120,14 +122,16 @@ class CompanyService:
             CompanyMembers.company_id == company_id,
             CompanyMembers.user_id == member_id
         ))
-        await database.fetch_one(kick_query)
+        async with company_role_cache.invalidating(company_id):
+            await database.fetch_one(kick_query)
 
     async def leave_company(self, company_id: int, current_user_id: int) -> None:
         leave_query = delete(CompanyMembers).where(and_(
             CompanyMembers.company_id == company_id,
             CompanyMembers.user_id == current_user_id
         ))
-        await database.fetch_one(leave_query)
+        async with company_role_cache.invalidating(company_id):
+            await database.fetch_one(leave_query)
 
     async def _get_db_company_by_id(self, company_id: int) -> Companies:
         query = select(Companies).where(Companies.id == company_id)
@@ -150,6 +154,7 @@ class CompanyService:
             role='admin'
         ).returning(CompanyMembers)
         await database.fetch_one(add_query)
+        await company_role_cache.invalidate(company_id)
 
     async def get_company_admins(self, company_id: int) -> AdminListResponse:
         company = await self._get_db_company_by_id(company_id=company_id)
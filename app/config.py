@@ -26,17 +26,90 @@ class Settings(BaseSettings):
     POSTGRES_URL_TEST: PostgresDsn = None
     REDIS_URL: RedisDsn
     REDIS_URL_TEST: RedisDsn = None
+    REDIS_MAX_CONNECTIONS: int = 50
+    REDIS_POOL_TIMEOUT_IN_SECONDS: float = 5
+    REDIS_SOCKET_TIMEOUT_IN_SECONDS: float = 5
+    REDIS_SOCKET_CONNECT_TIMEOUT_IN_SECONDS: float = 5
+    REDIS_HEALTH_CHECK_INTERVAL_IN_SECONDS: int = 30
+
+    # Caches
+    USER_CACHE_TTL_IN_SECONDS: int = 300
+    USER_CACHE_LOCAL_TTL_IN_SECONDS: int = 10
+    USER_CACHE_LOCAL_SIZE: int = 10000
+    COMPANY_ROLE_CACHE_TTL_IN_SECONDS: int = 300
+    COMPANY_ROLE_CACHE_LOCAL_TTL_IN_SECONDS: int = 5
+    COMPANY_ROLE_CACHE_LOCAL_SIZE: int = 50000
+    QUIZ_CACHE_TTL_IN_SECONDS: int = 60 * 60 * 24
+    QUIZ_CACHE_LOCAL_SIZE: int = 1000
+
+    # Listings
+    STREAM_CHUNK_SIZE: int = 500
+
+    # Attempts
+    ATTEMPT_REDIS_TTL_IN_SECONDS: int = 60 * 60 * 48
+    # Stores the whole attempt under one key instead of one hash per answer
+    ATTEMPT_REDIS_COMPACT_STORAGE: bool = False
+    # Attempts are acknowledged once queued in Redis and inserted in batches by a background flusher
+    ATTEMPTS_WRITE_BEHIND: bool = False
+    ATTEMPTS_FLUSH_BATCH_SIZE: int = 500
+    ATTEMPTS_FLUSH_INTERVAL_IN_MILLISECONDS: int = 200
+    ATTEMPTS_ID_BLOCK_SIZE: int = 100
+    ATTEMPT_IDEMPOTENCY_TTL_IN_SECONDS: int = 60 * 60 * 24
+    # How long a key stays locked by a request that is still being processed (or crashed)
+    ATTEMPT_IDEMPOTENCY_PENDING_TTL_IN_SECONDS: int = 30
+
+    # Notifications
+    # Rows per COPY when notifications are sent to many users at once
+    NOTIFICATIONS_FANOUT_CHUNK_SIZE: int = 5000
+
+    # Reminders
+    # Due (user, quiz) pairs are popped from a Redis sorted set in small batches every poll interval
+    REMINDERS_POLL_INTERVAL_IN_SECONDS: int = 15
+    REMINDERS_BATCH_SIZE: int = 100
+    # Popped entries come back after the lease if the reminder wasn't sent (e.g. the process died)
+    REMINDERS_LEASE_IN_SECONDS: int = 300
+    # Reminders are repeated while the attempt stays outdated
+    REMINDERS_REPEAT_IN_SECONDS: int = 60 * 60 * 24
+    REMINDERS_RECONCILE_INTERVAL_IN_HOURS: int = 24
+
+    # Scheduler
+    # Jobs run only on the node holding the leader lease, a dead leader is replaced once the lease expires
+    SCHEDULER_LEADER_TTL_IN_SECONDS: int = 30
+    SCHEDULER_LEADER_RENEW_INTERVAL_IN_SECONDS: int = 10
+    # Sharded jobs split the work in user id ranges that any node can claim, progress is checkpointed per chunk
+    SCHEDULER_SHARD_SIZE: int = 10000
+    SCHEDULER_SHARD_LOCK_TTL_IN_SECONDS: int = 60
+    SCHEDULER_SHARDS_POLL_INTERVAL_IN_SECONDS: int = 30
+    SCHEDULER_SHARDS_STATE_TTL_IN_SECONDS: int = 60 * 60 * 24 * 7
+
+    # Events
+    EVENTS_CONSUMERS_ENABLED: bool = True
+    # Streams are trimmed by age if it's set, otherwise by length (both approximately)
+    EVENTS_STREAM_MAXLEN: int = 100000
+    EVENTS_STREAM_MAX_AGE_IN_SECONDS: int | None = None
+    EVENTS_READ_BATCH_SIZE: int = 100
+    # Has to stay below REDIS_SOCKET_TIMEOUT_IN_SECONDS
+    EVENTS_READ_BLOCK_IN_MILLISECONDS: int = 2000
+    # Entries pending for longer than that (e.g. their consumer died) are claimed by other consumers
+    EVENTS_CLAIM_IDLE_IN_MILLISECONDS: int = 60000
 
     # Auth
     JWT_ALGORITHM: str
     JWT_SECRET_KEY: str
     JWT_ACCESS_TOKEN_EXPIRE_IN_SECONDS: int
+    JWT_REFRESH_TOKEN_EXPIRE_IN_SECONDS: int = 60 * 60 * 24 * 30
+    VERIFIED_TOKENS_CACHE_SIZE: int = 10000
+    PASSWORD_HASHING_WORKERS: int = 2
 
     AUTH0_ALGORITHMS: str
     AUTH0_AUDIENCE: str
     AUTH0_DOMAIN: str
     AUTH0_ISSUER: str
     AUTH0_RULE_NAMESPACE: str
+    AUTH0_JWKS_CACHE_TTL_IN_SECONDS: int = 3600
+    AUTH0_JWKS_MIN_REFRESH_INTERVAL_IN_SECONDS: int = 30
+    AUTH0_JWKS_REQUEST_TIMEOUT_IN_SECONDS: float = 5
+    AUTH0_REGISTRATION_LOCK_TIMEOUT_IN_SECONDS: int = 10
 
 
 settings = Settings()
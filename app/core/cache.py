@@ -0,0 +1,131 @@
+import json
+import time
+from collections import OrderedDict
+from typing import Any, Hashable
+
+from redis.exceptions import RedisError
+
+from app.database import get_redis
+from app.logging import file_logger
+
+
+_MISSING = object()
+
+
+class LRUCache:
+    # In-process cache with a size bound and optional per-entry expiry.
+    # Expiry times are unix timestamps, so entries can be bound to things like token's 'exp' claim.
+    def __init__(self, maxsize: int, ttl: float | None = None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: OrderedDict[Hashable, tuple[Any, float | None]] = OrderedDict()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        item = self._data.get(key)
+        if item is None:
+            return default
+
+        value, expires_at = item
+        if expires_at is not None and expires_at <= time.time():
+            del self._data[key]
+            return default
+
+        self._data.move_to_end(key)
+        return value
+
+    def set(self, key: Hashable, value: Any, ttl: float | None = None, expires_at: float | None = None) -> None:
+        if expires_at is None:
+            ttl = ttl if ttl is not None else self.ttl
+            expires_at = time.time() + ttl if ttl is not None else None
+
+        self._data[key] = (value, expires_at)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def delete(self, key: Hashable) -> None:
+        self._data.pop(key, None)
+
+    def clear(self) -> None:
+        self._data.clear()
+
+    def __contains__(self, key: Hashable) -> bool:
+        return self.get(key, _MISSING) is not _MISSING
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+
+class TwoLevelCache:
+    # In-process LRUCache in front of Redis, values have to be json serializable.
+    # The local level is kept short-lived since other workers can't invalidate it,
+    #   Redis is the shared level and is invalidated on writes by bumping versions.
+    # Redis errors are logged and treated as cache misses, so callers fall back to the db.
+    # Versions work like QuizCache ones: bumping a scope's version makes its old entries unreachable,
+    #   so a reader that loaded from the db before the bump can't put a stale value back.
+    def __init__(self, namespace: str, local_maxsize: int, local_ttl: float, redis_ttl: int):
+        self.namespace = namespace
+        self.redis_ttl = redis_ttl
+        self.local = LRUCache(maxsize=local_maxsize, ttl=local_ttl)
+
+    def make_key(self, key: str) -> str:
+        return f'{self.namespace}:{key}'
+
+    async def get_version(self, scope: str) -> int | None:
+        # Versions are cached locally like values, other workers see a bump within local_ttl
+        key = f'version:{scope}'
+        version = self.local.get(key)
+        if version is not None:
+            return version
+
+        try:
+            redis = await get_redis()
+            version = int(await redis.get(self.make_key(key)) or 0)
+        except RedisError as e:
+            file_logger.error(f'{self.namespace} cache get_version error --> {e}')
+            return None
+
+        self.local.set(key, version)
+        return version
+
+    async def bump_version(self, scope: str) -> None:
+        # Raises RedisError, callers decide whether a missed bump is acceptable
+        key = f'version:{scope}'
+        self.local.delete(key)
+        redis = await get_redis()
+        await redis.incr(self.make_key(key))
+
+    async def get(self, key: str, default: Any = None) -> Any:
+        value = self.local.get(key, _MISSING)
+        if value is not _MISSING:
+            return value
+
+        try:
+            redis = await get_redis()
+            raw_value = await redis.get(self.make_key(key))
+        except RedisError as e:
+            file_logger.error(f'{self.namespace} cache get error --> {e}')
+            return default
+
+        if raw_value is None:
+            return default
+
+        value = json.loads(raw_value)
+        self.local.set(key, value)
+        return value
+
+    async def set(self, key: str, value: Any) -> None:
+        await self.set_many({key: value})
+
+    async def set_many(self, mapping: dict[str, Any]) -> None:
+        for key, value in mapping.items():
+            self.local.set(key, value)
+        try:
+            redis = await get_redis()
+            async with redis.pipeline(transaction=False) as pipe:
+                for key, value in mapping.items():
+                    pipe.set(self.make_key(key), json.dumps(value), ex=self.redis_ttl)
+                await pipe.execute()
+        except RedisError as e:
+            file_logger.error(f'{self.namespace} cache set error --> {e}')
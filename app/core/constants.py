@@ -3,6 +3,8 @@ class ExceptionDetails:
     SOMETHING_WENT_WRONG = 'Something went wrong'
     NOT_ALLOWED = 'You are not allowed to perform this action'
     ENTITY_WITH_ID_NOT_FOUND = lambda entity, id: f"{entity} with id {id} not found"
+    IDEMPOTENCY_KEY_IN_PROGRESS = 'A request with this Idempotency-Key is still being processed'
+    IDEMPOTENCY_KEY_REUSED = 'This Idempotency-Key was already used with a different request'
 
 
 class SuccessDetails:
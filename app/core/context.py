@@ -0,0 +1,60 @@
+import functools
+import inspect
+from contextvars import ContextVar
+from typing import Callable
+
+
+# Memo of the current request, None outside of requests (e.g. in scheduler jobs)
+_request_memo: ContextVar[dict | None] = ContextVar('request_memo', default=None)
+
+
+def start_request_memo():
+    return _request_memo.set({})
+
+
+def end_request_memo(token) -> None:
+    _request_memo.reset(token)
+
+
+def clear_request_memo() -> None:
+    # Used by writes that change what memoized lookups would return, e.g. membership changes
+    memo = _request_memo.get()
+    if memo is not None:
+        memo.clear()
+
+
+def request_memoized(*exceptions: type[Exception]) -> Callable:
+    # Memoizes an async method for the lifetime of the current request, so the same
+    #   lookup (e.g. a role check) is not repeated within one request.
+    # Given exception types are memoized as well and re-raised on every call.
+    def decorator(func: Callable) -> Callable:
+        signature = inspect.signature(func)
+
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            memo = _request_memo.get()
+            if memo is None:
+                return await func(*args, **kwargs)
+
+            # Normalize positional/keyword arguments and skip self
+            bound = signature.bind(*args, **kwargs)
+            bound.apply_defaults()
+            key = (func.__qualname__, tuple(bound.arguments.items())[1:])
+
+            if key in memo:
+                result, error = memo[key]
+                if error is not None:
+                    raise error
+                return result
+
+            try:
+                result = await func(*args, **kwargs)
+            except exceptions as e:
+                memo[key] = (None, e)
+                raise
+            memo[key] = (result, None)
+            return result
+
+        return wrapper
+
+    return decorator
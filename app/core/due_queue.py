@@ -0,0 +1,39 @@
+from app.database import get_redis
+
+
+# Moves due members to now + lease in the same script, so concurrent pollers never get the same member
+POP_DUE_SCRIPT = """
+local members = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1], 'LIMIT', 0, ARGV[2])
+for _, member in ipairs(members) do
+    redis.call('ZADD', KEYS[1], ARGV[3], member)
+end
+return members
+"""
+
+
+class DueQueue:
+    # Redis sorted set of members scored by the unix timestamp they are due at.
+    # Popped members are leased instead of removed, the caller has to schedule or remove them
+    #   once they are processed, otherwise they are popped again after the lease
+    def __init__(self, key: str):
+        self.key = key
+        self._pop_due_script = None
+
+    async def schedule(self, mapping: dict[str, float], only_new: bool = False) -> None:
+        if not mapping:
+            return
+        redis = await get_redis()
+        await redis.zadd(self.key, mapping, nx=only_new)
+
+    async def remove(self, *members: str) -> None:
+        if not members:
+            return
+        redis = await get_redis()
+        await redis.zrem(self.key, *members)
+
+    async def pop_due(self, now: float, limit: int, lease: float) -> list[str]:
+        redis = await get_redis()
+        if self._pop_due_script is None:
+            self._pop_due_script = redis.register_script(POP_DUE_SCRIPT)
+        members = await self._pop_due_script(keys=[self.key], args=[now, limit, now + lease], client=redis)
+        return [member.decode() if isinstance(member, bytes) else member for member in members]
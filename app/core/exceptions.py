@@ -32,6 +32,18 @@ class ForbiddenHTTPException(HTTPException):
         self.detail = detail
 
 
+class ConflictHTTPException(HTTPException):
+    def __init__(self, detail='Conflict'):
+        self.status_code = status.HTTP_409_CONFLICT
+        self.detail = detail
+
+
+class ServiceUnavailableHTTPException(HTTPException):
+    def __init__(self, detail='Service unavailable'):
+        self.status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+        self.detail = detail
+
+
 class NotFoundException(Exception):
     pass
 
@@ -42,3 +54,7 @@ class ForbiddenException(Exception):
 
 class BadRequestException(Exception):
     pass
+
+
+class ConflictException(Exception):
+    pass
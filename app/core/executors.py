@@ -0,0 +1,64 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Callable, TypeVar
+
+
+T = TypeVar("T")
+
+
+class BoundedExecutor:
+    # Runs blocking cpu-bound calls (e.g. bcrypt) in a dedicated, fixed size thread pool
+    #   so they don't block the event loop or eat the default executor.
+    # At most max_workers calls are handed to the pool, the rest wait on the semaphore,
+    #   which is what 'queued' in the snapshot shows.
+    def __init__(self, name: str, max_workers: int):
+        self.name = name
+        self.max_workers = max_workers
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=name)
+        self._semaphore = asyncio.Semaphore(max_workers)
+
+        self.queued = 0
+        self.running = 0
+        self.max_queued = 0
+        self.completed = 0
+        self._total_wait_seconds = 0.0
+        self._total_run_seconds = 0.0
+
+    async def run(self, func: Callable[..., T], *args, **kwargs) -> T:
+        loop = asyncio.get_running_loop()
+
+        self.queued += 1
+        self.max_queued = max(self.max_queued, self.queued)
+        queued_at = time.perf_counter()
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self.queued -= 1
+
+        started_at = time.perf_counter()
+        self._total_wait_seconds += started_at - queued_at
+        self.running += 1
+        try:
+            return await loop.run_in_executor(self._executor, partial(func, *args, **kwargs))
+        finally:
+            self.running -= 1
+            self.completed += 1
+            self._total_run_seconds += time.perf_counter() - started_at
+            self._semaphore.release()
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def snapshot(self) -> dict:
+        completed = self.completed or 1
+        return {
+            'max_workers': self.max_workers,
+            'queued': self.queued,
+            'running': self.running,
+            'max_queued': self.max_queued,
+            'completed': self.completed,
+            'avg_wait_ms': round(self._total_wait_seconds * 1000 / completed, 3),
+            'avg_run_ms': round(self._total_run_seconds * 1000 / completed, 3),
+        }
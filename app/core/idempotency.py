@@ -0,0 +1,64 @@
+import json
+
+from redis.exceptions import RedisError
+
+from app.database import get_redis
+from app.logging import file_logger
+from app.core.constants import ExceptionDetails
+from app.core.exceptions import ConflictException
+
+
+class IdempotencyStore:
+    # Remembers the response of the first request made with a client supplied key.
+    # begin() locks the key with a short pending TTL (SET NX), complete() stores the response for the full TTL,
+    #   abort() releases the key so a failed request can be retried.
+    # The fingerprint of the request is stored too, reusing a key for another request is a conflict.
+    # Redis errors are logged and the request just goes through without idempotency
+    def __init__(self, namespace: str, ttl: int, pending_ttl: int):
+        self.namespace = namespace
+        self.ttl = ttl
+        self.pending_ttl = pending_ttl
+
+    async def begin(self, scope: str, key: str, fingerprint: str) -> str | None:
+        # Returns the stored response, or None if the caller has to process the request
+        redis_key = self.make_key(scope, key)
+        try:
+            redis = await get_redis()
+            pending_value = json.dumps({'fingerprint': fingerprint, 'response': None})
+            # second try covers the key expiring between SET NX and GET
+            for _ in range(2):
+                if await redis.set(redis_key, pending_value, nx=True, ex=self.pending_ttl):
+                    return None
+                raw_value = await redis.get(redis_key)
+                if raw_value is not None:
+                    break
+            else:
+                return None
+        except RedisError as e:
+            file_logger.error(f'{self.namespace} idempotency begin error --> {e}')
+            return None
+
+        value = json.loads(raw_value)
+        if value['fingerprint'] != fingerprint:
+            raise ConflictException(ExceptionDetails.IDEMPOTENCY_KEY_REUSED)
+        if value['response'] is None:
+            raise ConflictException(ExceptionDetails.IDEMPOTENCY_KEY_IN_PROGRESS)
+        return value['response']
+
+    async def complete(self, scope: str, key: str, fingerprint: str, response: str) -> None:
+        value = json.dumps({'fingerprint': fingerprint, 'response': response})
+        try:
+            redis = await get_redis()
+            await redis.set(self.make_key(scope, key), value, ex=self.ttl)
+        except RedisError as e:
+            file_logger.error(f'{self.namespace} idempotency complete error --> {e}')
+
+    async def abort(self, scope: str, key: str) -> None:
+        try:
+            redis = await get_redis()
+            await redis.delete(self.make_key(scope, key))
+        except RedisError as e:
+            file_logger.error(f'{self.namespace} idempotency abort error --> {e}')
+
+    def make_key(self, scope: str, key: str) -> str:
+        return f'idempotency:{self.namespace}:{scope}:{key}'
@@ -0,0 +1,50 @@
+import time
+from contextlib import contextmanager
+from typing import Protocol
+
+
+class MetricsSource(Protocol):
+    def snapshot(self) -> dict: ...
+
+
+class TimingCounter:
+    # Counts calls and total time spent per name, e.g. per token verifier
+    def __init__(self):
+        self._counts: dict[str, int] = {}
+        self._total_seconds: dict[str, float] = {}
+
+    def record(self, name: str, seconds: float) -> None:
+        self._counts[name] = self._counts.get(name, 0) + 1
+        self._total_seconds[name] = self._total_seconds.get(name, 0.0) + seconds
+
+    @contextmanager
+    def time(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - start)
+
+    def snapshot(self) -> dict:
+        return {
+            name: {
+                'count': count,
+                'total_ms': round(self._total_seconds[name] * 1000, 3),
+                'avg_ms': round(self._total_seconds[name] * 1000 / count, 3),
+            }
+            for name, count in self._counts.items()
+        }
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._sources: dict[str, MetricsSource] = {}
+
+    def register(self, name: str, source: MetricsSource) -> None:
+        self._sources[name] = source
+
+    def snapshot(self) -> dict:
+        return {name: source.snapshot() for name, source in self._sources.items()}
+
+
+metrics_registry = MetricsRegistry()
@@ -2,6 +2,7 @@ import json
 from fastapi import Request, Response
 from starlette.background import BackgroundTask
 
+from app.core.context import start_request_memo, end_request_memo
 from app.logging import file_logger
 
 
@@ -36,3 +37,19 @@ async def log_writes_middleware(request: Request, call_next):
         )
 
     return response
+
+
+class RequestContextMiddleware:
+    # Pure asgi middleware, so the request memo is set in the same context the endpoint runs in
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            return await self.app(scope, receive, send)
+
+        token = start_request_memo()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            end_request_memo(token)
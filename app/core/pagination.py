@@ -1,8 +1,12 @@
-from typing import Sequence, TypeVar, Optional, Callable, Any
+from typing import Sequence, TypeVar, Optional, Callable, Any, Generic, AsyncIterator, Awaitable
 
+from fastapi import Query
 from fastapi_pagination import paginate as _paginate
 from fastapi_pagination.bases import AbstractParams
 from fastapi_pagination.types import AdditionalData
+from pydantic import BaseModel
+from pydantic.generics import GenericModel
+from sqlalchemy import asc
 
 
 T = TypeVar("T")
@@ -24,3 +28,70 @@ def paginate(
     if items_name:
         pagination[items_name] = pagination.pop('items')
     return pagination
+
+
+class CursorParams(BaseModel):
+    # Keyset pagination, cursor is the last id of the previous page
+    cursor: int | None = Query(None, ge=0)
+    size: int = Query(50, ge=1, le=100)
+    include_total: bool = Query(False)
+
+
+class CursorPage(GenericModel, Generic[T]):
+    items: Sequence[T]
+    size: int
+    next_cursor: int | None = None
+    total: int | None = None
+
+
+def cursor_paginate(
+        items: Sequence[T],
+        params: CursorParams,
+        next_cursor: int | None,
+        items_name: str = '',
+        total: int | None = None
+) -> dict:
+    pagination = vars(CursorPage[Any](
+        items=items,
+        size=params.size,
+        next_cursor=next_cursor,
+        total=total
+    ))
+    if items_name:
+        pagination[items_name] = pagination.pop('items')
+    return pagination
+
+
+def keyset_query(query, column, after_id: int | None, limit: int | None):
+    # Selects one extra row so split_keyset_page can tell whether there is a next page
+    query = query.order_by(asc(column))
+    if after_id is not None:
+        query = query.where(column > after_id)
+    if limit is not None:
+        query = query.limit(limit + 1)
+    return query
+
+
+def split_keyset_page(
+        items: Sequence[T],
+        limit: int | None,
+        get_id: Callable[[T], int] = lambda item: item.id
+) -> tuple[Sequence[T], int | None]:
+    if limit is None or len(items) <= limit:
+        return items, None
+    items = items[:limit]
+    return items, get_id(items[-1])
+
+
+async def iterate_keyset(
+        fetch_page: Callable[..., Awaitable[tuple[Sequence[T], int | None]]],
+        cursor: int | None,
+        chunk_size: int
+) -> AsyncIterator[T]:
+    # fetch_page(after_id=..., limit=...) is called chunk by chunk, so only one chunk is held at a time
+    while True:
+        items, cursor = await fetch_page(after_id=cursor, limit=chunk_size)
+        for item in items:
+            yield item
+        if cursor is None:
+            break
@@ -1,5 +1,9 @@
-from fastapi import APIRouter
-from app.core.schemas import HealthCheckSchema
+from fastapi import APIRouter, Depends
+
+from app.core.metrics import metrics_registry
+from app.core.schemas import HealthCheckSchema, MetricsResponse
+from app.core.utils import response_with_result_key
+from app.users.dependencies import get_admin_user
 
 
 router = APIRouter(tags=['General'])
@@ -8,3 +12,8 @@ router = APIRouter(tags=['General'])
 @router.get('/')
 async def health_check() -> HealthCheckSchema:
     return HealthCheckSchema()
+
+
+@router.get('/metrics/', response_model=MetricsResponse, dependencies=[Depends(get_admin_user)])
+async def get_metrics() -> MetricsResponse:
+    return response_with_result_key(MetricsResponse(metrics=metrics_registry.snapshot()))
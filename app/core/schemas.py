@@ -16,6 +16,10 @@ class HealthCheckSchema(BaseModel):
     result: str = 'working'
 
 
+class MetricsResponse(BaseModel):
+    metrics: dict
+
+
 class TimeStampSchema(BaseModel):
     created_at: datetime
     updated_at: datetime
@@ -0,0 +1,23 @@
+import asyncio
+from collections import deque
+
+from sqlalchemy import select, func
+
+from app.database import database
+
+
+class SequenceAllocator:
+    # Hands out ids from a postgres sequence, block_size of them are reserved per query.
+    # Ids are unique but not gap free, and only roughly ordered across processes
+    def __init__(self, sequence: str, block_size: int):
+        self.sequence = sequence
+        self.block_size = block_size
+        self._ids: deque[int] = deque()
+        self._lock = asyncio.Lock()
+
+    async def next(self) -> int:
+        async with self._lock:
+            if not self._ids:
+                query = select(func.nextval(self.sequence)).select_from(func.generate_series(1, self.block_size))
+                self._ids.extend(record[0] for record in await database.fetch_all(query))
+            return self._ids.popleft()
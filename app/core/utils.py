@@ -1,5 +1,8 @@
-from fastapi.responses import JSONResponse
+from typing import AsyncIterator
+
+from fastapi.responses import JSONResponse, StreamingResponse
 from fastapi.encoders import jsonable_encoder
+from pydantic import BaseModel
 
 
 # Added to match the tests e.g.:
@@ -11,6 +14,14 @@ def response_with_result_key(schema, status_code=200):
     )
 
 
+def ndjson_response(items: AsyncIterator[BaseModel]) -> StreamingResponse:
+    # One json document per line, items are serialized as they come
+    async def lines():
+        async for item in items:
+            yield item.json() + '\n'
+    return StreamingResponse(lines(), media_type='application/x-ndjson')
+
+
 def exclude_none(original: dict):
     return {k: v for k, v in original.items() if v is not None}
 
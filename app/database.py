@@ -1,6 +1,7 @@
 from redis import asyncio as aioredis
 import databases
 from app.config import settings
+from app.core.metrics import metrics_registry
 
 
 # I couldn't make it work with your setup through the dependency override in the conftest.py
@@ -21,8 +22,60 @@ def get_db() -> databases.Database:
     return database
 
 
-async def get_redis():
-    if settings.ENVIRONMENT.is_testing:
-        return await aioredis.from_url(settings.REDIS_URL_TEST)
-    else:
-        return await aioredis.from_url(settings.REDIS_URL)
+# One client (and connection pool) per process, created on startup and closed on shutdown.
+#   get_redis() still creates it lazily for code running outside the app lifecycle, e.g. tests
+_redis: aioredis.Redis | None = None
+
+
+def create_redis() -> aioredis.Redis:
+    # Blocking pool, so callers wait (up to REDIS_POOL_TIMEOUT_IN_SECONDS) for a free connection
+    #   instead of failing when all of them are taken, e.g. by stream consumers blocked on XREADGROUP
+    url = settings.REDIS_URL_TEST if settings.ENVIRONMENT.is_testing else settings.REDIS_URL
+    pool = aioredis.BlockingConnectionPool.from_url(
+        url,
+        max_connections=settings.REDIS_MAX_CONNECTIONS,
+        timeout=settings.REDIS_POOL_TIMEOUT_IN_SECONDS,
+        socket_timeout=settings.REDIS_SOCKET_TIMEOUT_IN_SECONDS,
+        socket_connect_timeout=settings.REDIS_SOCKET_CONNECT_TIMEOUT_IN_SECONDS,
+        health_check_interval=settings.REDIS_HEALTH_CHECK_INTERVAL_IN_SECONDS
+    )
+    return aioredis.Redis(connection_pool=pool)
+
+
+async def init_redis() -> aioredis.Redis:
+    global _redis
+    if _redis is None:
+        _redis = create_redis()
+    return _redis
+
+
+async def close_redis() -> None:
+    global _redis
+    if _redis is not None:
+        redis, _redis = _redis, None
+        await redis.close()
+        await redis.connection_pool.disconnect()
+
+
+# Can be used as a dependency: redis = Depends(get_redis)
+async def get_redis() -> aioredis.Redis:
+    if _redis is None:
+        return await init_redis()
+    return _redis
+
+
+class RedisPoolMetrics:
+    def snapshot(self) -> dict:
+        if _redis is None:
+            return {}
+        pool = _redis.connection_pool
+        # the pool queue holds idle connections and None placeholders for not yet created ones
+        idle = sum(1 for connection in pool.pool._queue if connection is not None)
+        return {
+            'max_connections': pool.max_connections,
+            'created': len(pool._connections),
+            'in_use': len(pool._connections) - idle,
+        }
+
+
+metrics_registry.register('redis_pool', RedisPoolMetrics())
@@ -0,0 +1,4 @@
+class Streams:
+    ATTEMPTS = 'events:attempts'
+    # Work queue of attempts waiting to be inserted (settings.ATTEMPTS_WRITE_BEHIND)
+    ATTEMPT_WRITES = 'events:attempt_writes'
@@ -0,0 +1,19 @@
+from datetime import datetime
+
+from pydantic import BaseModel
+
+
+class StreamEntrySchema(BaseModel):
+    entry_id: str
+    data: str
+
+
+class AttemptEventSchema(BaseModel):
+    attempt_id: int
+    quiz_id: int
+    user_id: int
+    company_id: int
+    questions: int
+    correct_answers: float
+    score: float
+    taken_at: datetime
@@ -0,0 +1,200 @@
+import asyncio
+import os
+import socket
+import time
+from typing import Awaitable, Callable
+
+from pydantic import BaseModel
+from redis.exceptions import RedisError, ResponseError
+
+from app.config import settings
+from app.core.metrics import metrics_registry
+from app.database import get_redis
+from app.logging import file_logger
+
+from app.events.schemas import StreamEntrySchema
+
+
+EventHandler = Callable[[list[StreamEntrySchema]], Awaitable[None]]
+
+
+class StreamConsumer:
+    # Reads a stream as a member of a consumer group. Entries are acked only after the handler
+    #   succeeds, so a failing handler or a crash means redelivery (at least once), handlers have to be idempotent.
+    # Entries pending for longer than EVENTS_CLAIM_IDLE_IN_MILLISECONDS (their consumer died)
+    #   are taken over with XAUTOCLAIM.
+    # With linger_ms the consumer waits that long after a short batch, so entries are coalesced into bigger ones
+    def __init__(
+            self,
+            stream: str,
+            group: str,
+            handler: EventHandler,
+            batch_size: int | None = None,
+            linger_ms: int = 0,
+            delete_on_ack: bool = False
+    ):
+        self.stream = stream
+        self.group = group
+        self.handler = handler
+        self.batch_size = batch_size or settings.EVENTS_READ_BATCH_SIZE
+        self.linger_ms = linger_ms
+        self.delete_on_ack = delete_on_ack
+        self.name = f'{socket.gethostname()}-{os.getpid()}'
+        self.processed = 0
+        self.failed = 0
+        self._claim_cursor = '0-0'
+        self._last_claim_at = 0.0
+
+    async def run(self) -> None:
+        while True:
+            try:
+                redis = await get_redis()
+                await self.ensure_group(redis)
+                while True:
+                    entries = await self.read(redis)
+                    if entries:
+                        await self.process(redis, entries)
+                    if self.linger_ms and len(entries) < self.batch_size:
+                        await asyncio.sleep(self.linger_ms / 1000)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # anything else would end the task for good, nothing restarts it
+                file_logger.error(f'{self.stream} {self.group} consumer error --> {e!r}')
+                await asyncio.sleep(1)
+
+    async def ensure_group(self, redis) -> None:
+        try:
+            await redis.xgroup_create(self.stream, self.group, id='0', mkstream=True)
+        except ResponseError as e:
+            if 'BUSYGROUP' not in str(e):
+                raise
+
+    async def read(self, redis) -> list[StreamEntrySchema]:
+        if time.monotonic() - self._last_claim_at >= settings.EVENTS_CLAIM_IDLE_IN_MILLISECONDS / 1000:
+            entries = await self.claim(redis)
+            if entries:
+                return entries
+
+        response = await redis.xreadgroup(
+            groupname=self.group,
+            consumername=self.name,
+            streams={self.stream: '>'},
+            count=self.batch_size,
+            block=settings.EVENTS_READ_BLOCK_IN_MILLISECONDS
+        )
+        return await self.parse_entries(redis, [entry for _, entries in response for entry in entries])
+
+    async def claim(self, redis) -> list[StreamEntrySchema]:
+        response = await redis.xautoclaim(
+            self.stream,
+            self.group,
+            self.name,
+            min_idle_time=settings.EVENTS_CLAIM_IDLE_IN_MILLISECONDS,
+            start_id=self._claim_cursor,
+            count=self.batch_size
+        )
+        self._claim_cursor, entries = response[0], response[1]
+        if self._claim_cursor in (b'0-0', '0-0'):
+            # the whole pending list was walked
+            self._last_claim_at = time.monotonic()
+
+        # entries trimmed from the stream while pending come back empty (redis 7 drops them from the pending list)
+        return await self.parse_entries(redis, [(entry_id, fields) for entry_id, fields in entries if fields])
+
+    async def process(self, redis, entries: list[StreamEntrySchema]) -> None:
+        try:
+            await self.handler(entries)
+        except Exception as e:
+            # not acked, will be claimed again after EVENTS_CLAIM_IDLE_IN_MILLISECONDS
+            self.failed += len(entries)
+            file_logger.error(f'{self.stream} {self.group} handler error --> {e}')
+            return
+
+        await self.ack(redis, [entry.entry_id for entry in entries])
+        self.processed += len(entries)
+
+    async def ack(self, redis, entry_ids: list[str | bytes]) -> None:
+        if self.delete_on_ack:
+            # for work queues, the stream itself isn't trimmed so entries are dropped once handled
+            async with redis.pipeline(transaction=True) as pipe:
+                pipe.xack(self.stream, self.group, *entry_ids)
+                pipe.xdel(self.stream, *entry_ids)
+                await pipe.execute()
+        else:
+            await redis.xack(self.stream, self.group, *entry_ids)
+
+    async def parse_entries(self, redis, raw_entries: list[tuple[bytes, dict]]) -> list[StreamEntrySchema]:
+        # Malformed entries can never be handled, they are acked and dropped instead of blocking the stream
+        entries = []
+        malformed_ids = []
+        for entry_id, fields in raw_entries:
+            try:
+                entries.append(self.parse_entry(entry_id, fields))
+            except (KeyError, UnicodeDecodeError) as e:
+                file_logger.error(f'{self.stream} {self.group} dropped malformed entry {entry_id} --> {e!r}')
+                malformed_ids.append(entry_id)
+
+        if malformed_ids:
+            await self.ack(redis, malformed_ids)
+            self.failed += len(malformed_ids)
+        return entries
+
+    def parse_entry(self, entry_id: bytes, fields: dict) -> StreamEntrySchema:
+        return StreamEntrySchema(entry_id=entry_id.decode('utf-8'), data=fields[b'data'].decode('utf-8'))
+
+
+class EventService:
+    def __init__(self):
+        self.consumers: list[StreamConsumer] = []
+        self._tasks: list[asyncio.Task] = []
+
+    async def publish(self, stream: str, event: BaseModel) -> str | None:
+        # Publishing is best effort, callers already stored their data
+        try:
+            return await self.add(stream, event)
+        except RedisError as e:
+            file_logger.error(f'{stream} publish error --> {e}')
+            return None
+
+    async def add(self, stream: str, event: BaseModel, trim: bool = True) -> str:
+        # Raises RedisError, streams used as work queues shouldn't be trimmed (trim=False)
+        redis = await get_redis()
+        trim_args = self.get_trim_args() if trim else {}
+        entry_id = await redis.xadd(stream, {'data': event.json()}, **trim_args)
+        return entry_id.decode('utf-8')
+
+    def get_trim_args(self) -> dict:
+        if settings.EVENTS_STREAM_MAX_AGE_IN_SECONDS:
+            min_timestamp = int((time.time() - settings.EVENTS_STREAM_MAX_AGE_IN_SECONDS) * 1000)
+            return {'minid': f'{min_timestamp}-0', 'approximate': True}
+        return {'maxlen': settings.EVENTS_STREAM_MAXLEN, 'approximate': True}
+
+    def register_consumer(self, stream: str, group: str, handler: EventHandler, **options) -> StreamConsumer:
+        consumer = StreamConsumer(stream=stream, group=group, handler=handler, **options)
+        self.consumers.append(consumer)
+        return consumer
+
+    async def start(self) -> None:
+        if not settings.EVENTS_CONSUMERS_ENABLED:
+            return
+        self._tasks = [asyncio.create_task(consumer.run()) for consumer in self.consumers]
+
+    async def shutdown(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def snapshot(self) -> dict:
+        return {
+            f'{consumer.stream}:{consumer.group}': {
+                'processed': consumer.processed,
+                'failed': consumer.failed,
+            }
+            for consumer in self.consumers
+        }
+
+
+event_service = EventService()
+metrics_registry.register('event_consumers', event_service)
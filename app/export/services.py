@@ -6,14 +6,16 @@ import datetime
 import json
 import csv
 import os
+import time
 
 from fastapi.responses import StreamingResponse
-from async_generator import async_generator
 
 from app.core.exceptions import BadRequestException
 from app.logging import file_logger
 from app.database import get_redis
-from app.quizzes.schemas import AttemptRedisSchema
+from app.quizzes.constants import ATTEMPT_COMPACT_KEY_PREFIX, ATTEMPT_USER_INDEX_KEY, ATTEMPT_QUIZ_INDEX_KEY, \
+    ATTEMPT_COMPANY_INDEX_KEY, ATTEMPT_COMPANY_USER_INDEX_KEY
+from app.quizzes.schemas import AttemptRedisSchema, AttemptCompactRedisSchema
 from app.quizzes.services import quiz_service
 from app.users.services import user_service
 
@@ -42,10 +44,7 @@ class ExportService:
     #     self.redis = await get_redis()
 
     async def export_my_results(self, current_user_id: int, format: str, filename: str = None) -> StreamingResponse:
-        # data = self.redis.scan_iter(f'*user_id:{current_user_id}*')
-        redis = await get_redis()
-        data = redis.scan_iter(f'*user_id:{current_user_id}*')
-        results = await self.get_results_from_iter_data(data)
+        results = await self.get_results_from_index(ATTEMPT_USER_INDEX_KEY(current_user_id))
         return await export_service.export_file(
             data=results,
             filename=filename,
@@ -65,17 +64,15 @@ class ExportService:
             company_id=company_id
         )
 
-        key = f'*company_id:{company_id}*'
+        index_key = ATTEMPT_COMPANY_INDEX_KEY(company_id)
         if user_id:
             await user_service.user_company_is_member(
                 user_id=user_id,
                 company_id=company_id
             )
-            key = f'*user_id:{user_id}-{key.replace("*", "")}*'
+            index_key = ATTEMPT_COMPANY_USER_INDEX_KEY(company_id, user_id)
 
-        redis = await get_redis()
-        data = redis.scan_iter(key)
-        results = await self.get_results_from_iter_data(data)
+        results = await self.get_results_from_index(index_key)
         return await export_service.export_file(
             data=results,
             format=format,
@@ -94,9 +91,7 @@ class ExportService:
             user_id=current_user_id,
             company_id=company_id
         )
-        redis = await get_redis()
-        data = redis.scan_iter(f'*quiz_id:{quiz_id}*')
-        results = await self.get_results_from_iter_data(data)
+        results = await self.get_results_from_index(ATTEMPT_QUIZ_INDEX_KEY(quiz_id))
         return await export_service.export_file(
             data=results,
             format=format,
@@ -155,15 +150,42 @@ class ExportService:
         with open(filename, mode='w', newline='') as json_file:
             json.dump([d.dict() for d in data], json_file, indent=4)
 
-    async def get_results_from_iter_data(self, iter_data: async_generator) -> list[AttemptRedisSchema]:
-        results = []
+    async def get_results_from_index(self, index_key: str) -> list[AttemptRedisSchema]:
+        # Index sorted sets are scored by record expiry, expired members are dropped on read
+        now = int(time.time())
         redis = await get_redis()
-        async for key in iter_data:
-            hash_value = await redis.hgetall(key)
-            results.append(AttemptRedisSchema(**{
-                key.decode('utf-8'): json.loads(value.decode('utf-8'))
-                for key, value in hash_value.items()
-            }))
+        async with redis.pipeline(transaction=False) as pipe:
+            pipe.zremrangebyscore(index_key, '-inf', now)
+            pipe.zrangebyscore(index_key, now, '+inf')
+            _, keys = await pipe.execute()
+        return await self.get_results_from_keys(keys)
+
+    async def get_results_from_keys(self, keys: list[bytes]) -> list[AttemptRedisSchema]:
+        # Reads both per answer hashes and compact attempt values, in one pipeline
+        if not keys:
+            return []
+
+        redis = await get_redis()
+        async with redis.pipeline(transaction=False) as pipe:
+            for key in keys:
+                if key.decode('utf-8').startswith(ATTEMPT_COMPACT_KEY_PREFIX):
+                    pipe.get(key)
+                else:
+                    pipe.hgetall(key)
+            values = await pipe.execute()
+
+        results = []
+        for value in values:
+            if not value:
+                # expired between index read and record read
+                continue
+            if isinstance(value, dict):
+                results.append(AttemptRedisSchema(**{
+                    field.decode('utf-8'): json.loads(field_value.decode('utf-8'))
+                    for field, field_value in value.items()
+                }))
+            else:
+                results.extend(AttemptCompactRedisSchema.parse_raw(value).to_answers())
         return results
 
 
@@ -4,6 +4,7 @@ from app.database import database
 from app.users.exceptions import UserNotFoundException, UserAlreadyAMemberException
 from app.users.constants import ExceptionDetails as UserExceptionDetails
 from app.users.services import user_service
+from app.users.cache import company_role_cache
 from app.companies.exceptions import CompanyNotFoundException, NotYourCompanyException
 from app.companies.constants import ExceptionDetails as CompanyExceptionDetails
 from app.companies.services import company_service
@@ -101,6 +102,8 @@ class InvitationService:
                 .returning(Invitations)
             await database.fetch_one(delete_invitation_query)
 
+        await company_role_cache.invalidate(invitation.from_company_id)
+
     async def decline_invitation(self, invitation_id: int, current_user_id: int) -> None:
         invitation = await self.get_invitation_by_id(invitation_id=invitation_id)
         if invitation.to_user_id != current_user_id:
@@ -205,6 +208,8 @@ class JoinRequestService:
                 .where(Invitations.id == request_id)
             await database.fetch_one(delete_invitation_query)
 
+        await company_role_cache.invalidate(request.to_company_id)
+
     async def decline_join_request(self, request_id: int, current_user_id: int) -> None:
         request = await self.get_request_by_id(request_id=request_id)
         company = await company_service.get_company_by_id(company_id=request.to_company_id)
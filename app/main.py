@@ -8,10 +8,12 @@ from fastapi.middleware.cors import CORSMiddleware
 from starlette.middleware.base import BaseHTTPMiddleware
 
 from app.config import settings
-from app.core.middlewares import log_writes_middleware
-from app.database import get_db
+from app.core.middlewares import log_writes_middleware, RequestContextMiddleware
+from app.database import get_db, init_redis, close_redis
+from app.events.services import event_service
 from app.routes import router
 from app.schedulers.services import scheduler_service
+from app.users.security import password_executor
 
 # Build paths inside the project like this: os.path.join(BASE_DIR, 'subdir').
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -41,6 +43,7 @@ app.add_middleware(
     allow_methods=("GET", "POST", "PUT", "PATCH", "DELETE", "OPTIONS")
 )
 # app.add_middleware(BaseHTTPMiddleware, dispatch=log_writes_middleware)
+app.add_middleware(RequestContextMiddleware)
 
 
 app.include_router(router)
@@ -50,13 +53,18 @@ app.include_router(router)
 @app.on_event('startup')
 async def startup():
     await get_db().connect()
+    await init_redis()
     await scheduler_service.start()
+    await event_service.start()
 
 
 @app.on_event('shutdown')
 async def shutdown():
     await get_db().disconnect()
     await scheduler_service.shutdown()
+    await event_service.shutdown()
+    await close_redis()
+    password_executor.shutdown()
 
 
 def main():
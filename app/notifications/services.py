@@ -1,8 +1,12 @@
-from sqlalchemy import select, update, insert, and_
+import datetime
+
+from sqlalchemy import select, update, and_
 
 from app.companies.models import CompanyMembers
+from app.config import settings
 from app.core.constants import ExceptionDetails, SuccessDetails
 from app.core.exceptions import ForbiddenException, NotFoundException
+from app.core.pagination import keyset_query, split_keyset_page
 from app.core.schemas import DetailResponse
 from app.database import database
 from app.logging import file_logger
@@ -32,31 +36,33 @@ class NotificationService:
             quiz_id: int,
             company_id: int,
             current_user_id: int
-    ) -> DetailResponse:
-        query = select(CompanyMembers).filter(
-            CompanyMembers.company_id == company_id
-        )
-        members = await database.fetch_all(query)
-
-        values = []
-        for member in members:
-            values.append({
-                'status': Statuses.SENT,
-                'text': ON_QUIZ_CREATED_TEXT(quiz_id),
-                'to_user_id': member.user_id,
-                'created_by': current_user_id,
-                'updated_by': current_user_id
-            })
-
-        notifications = await self.insert_notifications(values)
-
-        if not notifications:
-            file_logger.error(f'send_notification_on_quiz_create error --> values: {values}')
-
-        return DetailResponse(
-            detail=SuccessDetails.SUCCESS if notifications
-            else ExceptionDetails.SOMETHING_WENT_WRONG
-        )
+    ) -> int:
+        # Runs as a background task after the quiz is created, so errors are only logged.
+        #   Members are read and copied in chunks, returns the number of sent notifications
+        sent = 0
+        after_id = None
+        try:
+            while True:
+                query = keyset_query(
+                    select(CompanyMembers.id, CompanyMembers.user_id).filter(CompanyMembers.company_id == company_id),
+                    CompanyMembers.id,
+                    after_id=after_id,
+                    limit=settings.NOTIFICATIONS_FANOUT_CHUNK_SIZE
+                )
+                members, after_id = split_keyset_page(
+                    await database.fetch_all(query),
+                    settings.NOTIFICATIONS_FANOUT_CHUNK_SIZE
+                )
+                sent += await self.bulk_create_notifications(
+                    to_user_ids=[member.user_id for member in members],
+                    text=ON_QUIZ_CREATED_TEXT(quiz_id),
+                    created_by=current_user_id
+                )
+                if after_id is None:
+                    break
+        except Exception as e:
+            file_logger.error(f'send_notification_on_quiz_create error --> quiz_id: {quiz_id}, sent: {sent}, {e}')
+        return sent
 
     async def on_attempts_outdate_send_notification_to_all_users(
             self,
@@ -67,30 +73,49 @@ class NotificationService:
 
         app_admin_user = await user_service.get_app_admin()
 
-        values = []
-        for attempt in outdated_attempts:
-            values.append({
-                'status': Statuses.SENT,
-                'text': ON_ATTEMPT_OUTDATED_TEXT(attempt.quiz_id),
-                'to_user_id': attempt.user_id,
-                'created_by': app_admin_user.user_id,
-                'updated_by': app_admin_user.user_id,
-            })
-        notifications = await self.insert_notifications(values)
+        sent = await self.bulk_create_notifications(
+            to_user_ids=[attempt.user_id for attempt in outdated_attempts],
+            texts=[ON_ATTEMPT_OUTDATED_TEXT(attempt.quiz_id) for attempt in outdated_attempts],
+            created_by=app_admin_user.user_id
+        )
 
-        if not notifications:
-            file_logger.error(f'on_attempts_outdate_send_notification_to_all_users error --> values: {values}')
+        if not sent:
+            file_logger.error(f'on_attempts_outdate_send_notification_to_all_users error --> '
+                              f'attempts: {outdated_attempts}')
 
         return DetailResponse(
-            detail=SuccessDetails.SUCCESS if notifications
+            detail=SuccessDetails.SUCCESS if sent
             else ExceptionDetails.SOMETHING_WENT_WRONG
         )
 
-    async def insert_notifications(self, values: list):
-        query = insert(Notifications).values(
-            values
-        ).returning(Notifications)
-        return await database.fetch_all(query)
+    async def bulk_create_notifications(
+            self,
+            to_user_ids: list[int],
+            created_by: int,
+            text: str | None = None,
+            texts: list[str] | None = None
+    ) -> int:
+        # COPY through the raw asyncpg connection instead of INSERT ... RETURNING,
+        #   nothing is sent back but the number of copied rows.
+        # Either one text for everyone or one text per user
+        if not to_user_ids:
+            return 0
+
+        texts = texts if texts is not None else [text] * len(to_user_ids)
+        created_at = datetime.datetime.now(datetime.timezone.utc)
+        records = [
+            (Statuses.SENT, text, to_user_id, created_by, created_by, created_at)
+            for to_user_id, text in zip(to_user_ids, texts)
+        ]
+
+        async with database.connection() as connection:
+            result = await connection.raw_connection.copy_records_to_table(
+                Notifications.__tablename__,
+                records=records,
+                columns=['status', 'text', 'to_user_id', 'created_by', 'updated_by', 'created_at']
+            )
+        # asyncpg returns the command status, e.g. 'COPY 42'
+        return int(result.split()[-1])
 
     async def get_notification(self, current_user_id: int, notification_id: int) -> NotificationResponse:
         select_query = select(
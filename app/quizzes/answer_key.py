@@ -0,0 +1,81 @@
+from app.core.exceptions import BadRequestException
+
+from app.quizzes.constants import ExceptionDetails
+from app.quizzes.schemas import QuizAnswerKeySchema
+
+
+class QuizAnswerKey:
+    # Everything submit_attempt needs to validate and score an attempt, so it's pure cpu work.
+    # Per question answer ids are sorted and correctness is a bitmask over them,
+    #   a submission is turned into the same kind of mask (bit of each submitted answer)
+    def __init__(self, schema: QuizAnswerKeySchema):
+        self.schema = schema
+        self.quiz_id = schema.quiz_id
+        self.company_id = schema.company_id
+        self.correct_masks: dict[int, int] = {}
+        self.correct_counts: dict[int, int] = {}
+        # answer_id -> (question_id, bit)
+        self.answer_bits: dict[int, tuple[int, int]] = {}
+
+        for question_id, question in schema.questions.items():
+            self.correct_masks[question_id] = question.correct_mask
+            self.correct_counts[question_id] = bin(question.correct_mask).count('1')
+            for bit, answer_id in enumerate(question.answer_ids):
+                self.answer_bits[answer_id] = (question_id, bit)
+
+    def is_correct(self, answer_id: int) -> bool:
+        question_id, bit = self.answer_bits[answer_id]
+        return bool(self.correct_masks[question_id] >> bit & 1)
+
+    def validate_attempt(self, question_ids: list[int], answer_ids: list[list[int]]) -> dict[int, int]:
+        # Questions have to belong to the quiz and every answer to its question, at least one answer per question.
+        #   Returns submitted answers mask per question
+        if len(set(question_ids)) != len(question_ids) or \
+                any(question_id not in self.correct_masks for question_id in question_ids):
+            raise BadRequestException(ExceptionDetails.WRONG_ATTEMPT_QUESTIONS)
+
+        for question_answer_ids in answer_ids:
+            if not len(question_answer_ids) > 0:
+                raise BadRequestException(ExceptionDetails.NO_ANSWERS_FOR_QUESTION)
+
+        flat_answer_ids = [answer_id for question_answer_ids in answer_ids for answer_id in question_answer_ids]
+        submitted_question_ids = set(question_ids)
+        found_answer_ids = {
+            answer_id for answer_id in flat_answer_ids
+            if self.answer_bits.get(answer_id, (None, None))[0] in submitted_question_ids
+        }
+        if len(found_answer_ids) != len(flat_answer_ids):
+            raise BadRequestException(ExceptionDetails.WRONG_OR_DUPLICATED_ATTEMPT_ANSWERS)
+
+        submitted_masks = {}
+        for question_id, question_answer_ids in zip(question_ids, answer_ids):
+            mask = 0
+            for answer_id in question_answer_ids:
+                answer_question_id, bit = self.answer_bits[answer_id]
+                if answer_question_id != question_id:
+                    raise BadRequestException(ExceptionDetails.WRONG_ATTEMPT_ANSWERS)
+                mask |= 1 << bit
+            submitted_masks[question_id] = mask
+        return submitted_masks
+
+    def score_attempt(self, submitted_masks: dict[int, int]) -> tuple[float, float]:
+        # Per question: (correct submitted / submitted) * (correct submitted / correct total),
+        #   score is the sum over all correct answers of the submitted questions.
+        #   Questions without correct answers count as 0
+        correct_answers = 0
+        total_correct_answers = 0
+        for question_id, submitted_mask in submitted_masks.items():
+            correct_total = self.correct_counts[question_id]
+            total_correct_answers += correct_total
+            if not correct_total:
+                continue
+
+            total_submitted = bin(submitted_mask).count('1')
+            correct_submitted = bin(submitted_mask & self.correct_masks[question_id]).count('1')
+
+            submitted_dif = correct_submitted / total_submitted
+            correct_dif = correct_submitted / correct_total
+            correct_answers += submitted_dif * correct_dif
+
+        score = correct_answers / total_correct_answers if total_correct_answers else 0
+        return correct_answers, score
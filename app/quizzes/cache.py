@@ -0,0 +1,120 @@
+from redis.exceptions import RedisError
+
+from app.config import settings
+from app.core.cache import LRUCache
+from app.database import get_redis
+from app.logging import file_logger
+
+from app.quizzes.answer_key import QuizAnswerKey
+from app.quizzes.schemas import QuizFullResponse, QuizAnswerKeySchema
+
+
+class QuizCache:
+    # Fully assembled quizzes are stored under a per-quiz version,
+    #   every write to a quiz, its questions or answers bumps the version instead of deleting the docs,
+    #   so a reader that loaded the quiz before the write can only store it under an outdated version.
+    # Version keys never expire, docs do. Local entries are keyed by (quiz_id, version)
+    #   so they become unreachable on a bump just like the Redis ones
+    # Answer keys (used by submit_attempt) are versioned the same way
+    def __init__(self):
+        self.ttl = settings.QUIZ_CACHE_TTL_IN_SECONDS
+        self.local = LRUCache(maxsize=settings.QUIZ_CACHE_LOCAL_SIZE, ttl=settings.QUIZ_CACHE_TTL_IN_SECONDS)
+        self.local_answer_keys = LRUCache(maxsize=settings.QUIZ_CACHE_LOCAL_SIZE, ttl=settings.QUIZ_CACHE_TTL_IN_SECONDS)
+
+    async def get_many(self, quiz_ids: list[int]) -> tuple[dict[int, QuizFullResponse], dict[int, int]]:
+        # Returns cached quizzes and the versions that were read, missing quizzes have to be stored
+        #   under these versions (not the current ones) via set_many
+        if not quiz_ids:
+            return {}, {}
+
+        try:
+            redis = await get_redis()
+            raw_versions = await redis.mget([self._version_key(quiz_id) for quiz_id in quiz_ids])
+            versions = {quiz_id: int(version or 0) for quiz_id, version in zip(quiz_ids, raw_versions)}
+
+            quizzes = {}
+            remote_ids = []
+            for quiz_id, version in versions.items():
+                quiz = self.local.get((quiz_id, version))
+                if quiz is not None:
+                    quizzes[quiz_id] = quiz
+                else:
+                    remote_ids.append(quiz_id)
+
+            if remote_ids:
+                docs = await redis.mget([self._doc_key(quiz_id, versions[quiz_id]) for quiz_id in remote_ids])
+                for quiz_id, doc in zip(remote_ids, docs):
+                    if doc is None:
+                        continue
+                    quiz = quizzes[quiz_id] = QuizFullResponse.parse_raw(doc)
+                    self.local.set((quiz_id, versions[quiz_id]), quiz)
+        except RedisError as e:
+            file_logger.error(f'quiz cache get error --> {e}')
+            return {}, {}
+
+        return quizzes, versions
+
+    async def set_many(self, quizzes: list[QuizFullResponse], versions: dict[int, int]) -> None:
+        # Quizzes without a read version (e.g. redis was down during get_many) are not stored
+        quizzes = [quiz for quiz in quizzes if quiz.quiz_id in versions]
+        if not quizzes:
+            return
+
+        for quiz in quizzes:
+            self.local.set((quiz.quiz_id, versions[quiz.quiz_id]), quiz)
+        try:
+            redis = await get_redis()
+            async with redis.pipeline(transaction=False) as pipe:
+                for quiz in quizzes:
+                    pipe.set(self._doc_key(quiz.quiz_id, versions[quiz.quiz_id]), quiz.json(), ex=self.ttl)
+                await pipe.execute()
+        except RedisError as e:
+            file_logger.error(f'quiz cache set error --> {e}')
+
+    async def get_answer_key(self, quiz_id: int) -> tuple[QuizAnswerKey | None, int | None]:
+        # Returns the answer key (if cached) and the version it has to be stored under
+        try:
+            redis = await get_redis()
+            version = int(await redis.get(self._version_key(quiz_id)) or 0)
+
+            answer_key = self.local_answer_keys.get((quiz_id, version))
+            if answer_key is None:
+                doc = await redis.get(self._answer_key_key(quiz_id, version))
+                if doc is not None:
+                    answer_key = QuizAnswerKey(QuizAnswerKeySchema.parse_raw(doc))
+                    self.local_answer_keys.set((quiz_id, version), answer_key)
+        except RedisError as e:
+            file_logger.error(f'quiz cache get answer key error --> {e}')
+            return None, None
+
+        return answer_key, version
+
+    async def set_answer_key(self, answer_key: QuizAnswerKey, version: int | None) -> None:
+        if version is None:
+            return
+
+        self.local_answer_keys.set((answer_key.quiz_id, version), answer_key)
+        try:
+            redis = await get_redis()
+            await redis.set(self._answer_key_key(answer_key.quiz_id, version), answer_key.schema.json(), ex=self.ttl)
+        except RedisError as e:
+            file_logger.error(f'quiz cache set answer key error --> {e}')
+
+    async def bump(self, quiz_id: int) -> None:
+        try:
+            redis = await get_redis()
+            await redis.incr(self._version_key(quiz_id))
+        except RedisError as e:
+            file_logger.error(f'quiz cache bump error --> {e}')
+
+    def _version_key(self, quiz_id: int) -> str:
+        return f'quizzes:version:{quiz_id}'
+
+    def _doc_key(self, quiz_id: int, version: int) -> str:
+        return f'quizzes:doc:{quiz_id}:{version}'
+
+    def _answer_key_key(self, quiz_id: int, version: int) -> str:
+        return f'quizzes:answer_key:{quiz_id}:{version}'
+
+
+quiz_cache = QuizCache()
@@ -0,0 +1,20 @@
+class ExceptionDetails:
+    NO_ANSWERS_FOR_QUESTION = 'You need to give at least one answer per question'
+    WRONG_ATTEMPT_QUESTIONS = \
+        'You didnt submit answers to all quiz questions or some questions dont belong to this quiz'
+    WRONG_OR_DUPLICATED_ATTEMPT_ANSWERS = \
+        'Some of submitted answers dont belong to its question or you have duplicated answers'
+    WRONG_ATTEMPT_ANSWERS = 'Some of submitted answers dont belong to its question'
+
+
+# Prefix of compact attempt keys (settings.ATTEMPT_REDIS_COMPACT_STORAGE), per answer hashes have no prefix
+ATTEMPT_COMPACT_KEY_PREFIX = 'attempt:'
+
+# Sorted sets of attempt record keys scored by their expiry timestamp, used by the exports instead of SCAN
+ATTEMPT_USER_INDEX_KEY = lambda user_id: f'attempts:index:user:{user_id}'
+ATTEMPT_QUIZ_INDEX_KEY = lambda quiz_id: f'attempts:index:quiz:{quiz_id}'
+ATTEMPT_COMPANY_INDEX_KEY = lambda company_id: f'attempts:index:company:{company_id}'
+ATTEMPT_COMPANY_USER_INDEX_KEY = lambda company_id, user_id: f'attempts:index:company:{company_id}:user:{user_id}'
+
+# Sorted set of '{user_id}:{quiz_id}' reminder members scored by their due timestamp
+ATTEMPT_REMINDERS_KEY = 'attempts:reminders'
@@ -1,4 +1,4 @@
-from sqlalchemy import Integer, Column, String, ForeignKey, Boolean, UniqueConstraint, Float
+from sqlalchemy import Integer, Column, String, ForeignKey, Boolean, UniqueConstraint, Float, DateTime
 from app.core.models import Base, TimeStampModel, UserStampModel
 
 
@@ -41,3 +41,14 @@ class Attempts(TimeStampModel, Base):
     questions = Column(Integer, nullable=False)
     correct_answers = Column(Float, nullable=False)
     score = Column(Float, nullable=False)
+
+
+class UserQuizStatus(Base):
+    # Last attempt per user/quiz, kept up to date on every attempt,
+    #   due_at = last_attempt_at + (frequency + 1) days, when the attempt becomes outdated
+    __tablename__ = 'user_quiz_status'
+
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    quiz_id = Column(Integer, ForeignKey("quizzes.id"), primary_key=True)
+    last_attempt_at = Column(DateTime(timezone=True), nullable=False)
+    due_at = Column(DateTime(timezone=True), nullable=False, index=True)
@@ -1,12 +1,12 @@
-from fastapi import APIRouter, Depends, status
+from fastapi import APIRouter, BackgroundTasks, Depends, Header, status
 from fastapi.responses import Response
-from fastapi_pagination import Page, Params
 from fastapi_utils.cbv import cbv
 
-from app.core.pagination import paginate
-from app.core.utils import response_with_result_key
+from app.config import settings
+from app.core.pagination import cursor_paginate, iterate_keyset, CursorParams, CursorPage
+from app.core.utils import response_with_result_key, ndjson_response
 from app.core.exceptions import ForbiddenException, ForbiddenHTTPException, NotFoundException, NotFoundHTTPException, \
-    BadRequestException, BadRequestHTTPException
+    BadRequestException, BadRequestHTTPException, ConflictException, ConflictHTTPException
 from app.core.schemas import DetailResponse
 from app.core.constants import SuccessDetails
 from app.users.dependencies import get_current_user
@@ -30,11 +30,16 @@ class AttemptsCBV:
     current_user: UserResponse = Depends(get_current_user)
 
     @attempt_router.post('/', response_model=AttemptResponse)
-    async def submit_attempt(self, data: SubmitAttemptRequest) -> AttemptResponse:
+    async def submit_attempt(
+            self,
+            data: SubmitAttemptRequest,
+            idempotency_key: str | None = Header(None, alias='Idempotency-Key', max_length=255)
+    ) -> AttemptResponse:
         try:
             return await quiz_service.submit_attempt(
                 current_user_id=self.current_user.user_id,
-                data=data
+                data=data,
+                idempotency_key=idempotency_key
             )
         except NotFoundException as e:
             raise NotFoundHTTPException(str(e))
@@ -42,24 +47,33 @@ class AttemptsCBV:
             raise ForbiddenHTTPException(str(e))
         except BadRequestException as e:
             raise BadRequestHTTPException(str(e))
+        except ConflictException as e:
+            raise ConflictHTTPException(str(e))
 
 
 @cbv(quiz_router)
 class QuizzesCBV:
     current_user: UserResponse = Depends(get_current_user)
 
-    @quiz_router.get('/', response_model=Page[QuizFullResponse])
-    async def get_all_quizzes(self, params: Params = Depends()) -> Page[QuizFullResponse]:
-        quizzes = await quiz_service.get_quizzes()
-        pagination = paginate(quizzes, params, items_name='quizzes')
+    @quiz_router.get('/', response_model=CursorPage[QuizFullResponse])
+    async def get_all_quizzes(self, params: CursorParams = Depends()) -> CursorPage[QuizFullResponse]:
+        quizzes, next_cursor = await quiz_service.get_quizzes(after_id=params.cursor, limit=params.size)
+        total = await quiz_service.count_quizzes() if params.include_total else None
+        pagination = cursor_paginate(quizzes, params, next_cursor, items_name='quizzes', total=total)
         return response_with_result_key(pagination)
 
     @quiz_router.post('/', status_code=201, response_model=DetailResponse)
-    async def create_quiz(self, response: Response, data: QuizCreateRequest) -> DetailResponse:
+    async def create_quiz(
+            self,
+            response: Response,
+            data: QuizCreateRequest,
+            background_tasks: BackgroundTasks
+    ) -> DetailResponse:
         try:
             res = await quiz_service.create_quiz(
                 current_user_id=self.current_user.user_id,
-                data=data
+                data=data,
+                background_tasks=background_tasks
             )
             if res.detail != SuccessDetails.SUCCESS:
                 response.status_code = status.HTTP_400_BAD_REQUEST
@@ -116,10 +130,20 @@ class QuizzesCBV:
 class QuestionsCBV:
     current_user: UserResponse = Depends(get_current_user)
 
-    @question_router.get('/', response_model=list[QuestionFullResponse])
-    async def get_all_questions(self) -> list[QuestionFullResponse]:
-        questions = await quiz_service.get_questions()
-        return response_with_result_key(questions)
+    @question_router.get('/', response_model=CursorPage[QuestionFullResponse])
+    async def get_all_questions(
+            self,
+            params: CursorParams = Depends(),
+            stream: bool = False
+    ) -> CursorPage[QuestionFullResponse]:
+        # stream=true returns every question starting from the cursor as ndjson
+        if stream:
+            return ndjson_response(iterate_keyset(quiz_service.get_questions, params.cursor, settings.STREAM_CHUNK_SIZE))
+
+        questions, next_cursor = await quiz_service.get_questions(after_id=params.cursor, limit=params.size)
+        total = await quiz_service.count_questions() if params.include_total else None
+        pagination = cursor_paginate(questions, params, next_cursor, items_name='questions', total=total)
+        return response_with_result_key(pagination)
 
     @question_router.post('/', status_code=201, response_model=DetailResponse)
     async def add_question(self, response: Response, data: QuestionCreateRequest) -> DetailResponse:
@@ -185,10 +209,16 @@ class QuestionsCBV:
 class AnswersCBV:
     current_user: UserResponse = Depends(get_current_user)
 
-    @answer_router.get('/', response_model=list[AnswerResponse])
-    async def get_all_answers(self) -> list[AnswerResponse]:
-        answers = await quiz_service.get_answers()
-        return response_with_result_key(answers)
+    @answer_router.get('/', response_model=CursorPage[AnswerResponse])
+    async def get_all_answers(self, params: CursorParams = Depends(), stream: bool = False) -> CursorPage[AnswerResponse]:
+        # stream=true returns every answer starting from the cursor as ndjson
+        if stream:
+            return ndjson_response(iterate_keyset(quiz_service.get_answers, params.cursor, settings.STREAM_CHUNK_SIZE))
+
+        answers, next_cursor = await quiz_service.get_answers(after_id=params.cursor, limit=params.size)
+        total = await quiz_service.count_answers() if params.include_total else None
+        pagination = cursor_paginate(answers, params, next_cursor, items_name='answers', total=total)
+        return response_with_result_key(pagination)
 
     @answer_router.post('/', status_code=201, response_model=DetailResponse)
     async def add_answer(self, response: Response, data: AnswerCreateRequest) -> DetailResponse:
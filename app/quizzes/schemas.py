@@ -86,6 +86,23 @@ class QuizUpdateRequest(QuizBaseSchema):
     pass
 
 
+class QuizAccessSchema(BaseModel):
+    quiz_id: int
+    company_id: int
+    role: str | None = None
+
+
+class AnswerKeyQuestionSchema(BaseModel):
+    answer_ids: list[int]
+    correct_mask: int = 0
+
+
+class QuizAnswerKeySchema(BaseModel):
+    quiz_id: int
+    company_id: int
+    questions: dict[int, AnswerKeyQuestionSchema]
+
+
 # ---- Attempts ----
 class AttemptBaseSchema(BaseModel):
     quiz_id: int
@@ -104,6 +121,17 @@ class AttemptResponse(AttemptBaseSchema):
         return root_validator_round_floats(values)
 
 
+class AttemptWriteSchema(BaseModel):
+    # Attempts row queued for write-behind, fields match the Attempts columns
+    id: int
+    quiz_id: int
+    user_id: int
+    questions: int
+    correct_answers: float
+    score: float
+    created_at: datetime
+
+
 class SubmitAttemptRequest(BaseModel):
     quiz_id: int
     question_ids: list[int]
@@ -123,3 +151,24 @@ class AttemptRedisSchema(BaseModel):
     question_id: int
     answer_id: int
     correct: int
+
+
+class AttemptCompactRedisSchema(BaseModel):
+    # Whole attempt in one value, answers are (question_id, answer_id, correct) rows
+    quiz_id: int
+    user_id: int
+    company_id: int
+    answers: list[tuple[int, int, int]]
+
+    def to_answers(self) -> list[AttemptRedisSchema]:
+        return [
+            AttemptRedisSchema(
+                quiz_id=self.quiz_id,
+                user_id=self.user_id,
+                company_id=self.company_id,
+                question_id=question_id,
+                answer_id=answer_id,
+                correct=correct
+            )
+            for question_id, answer_id, correct in self.answers
+        ]
@@ -1,32 +1,71 @@
 import datetime
+import hashlib
+import time
 import uuid
 
-from sqlalchemy import insert, select, asc, update, delete, and_, func
+from asyncpg.exceptions import IntegrityConstraintViolationError
+from fastapi import BackgroundTasks
+from pydantic import ValidationError
+from redis.exceptions import RedisError
+from sqlalchemy import insert, select, asc, update, delete, and_, func, case, literal, tuple_, DateTime
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 
 from app.companies.models import CompanyMembers
+from app.config import settings
 from app.logging import file_logger
 from app.database import database, get_redis
-from app.core.exceptions import NotFoundException, BadRequestException
+from app.core.exceptions import NotFoundException
 from app.core.utils import add_model_label, exclude_none
+from app.core.pagination import keyset_query, split_keyset_page
+from app.core.sequences import SequenceAllocator
+from app.core.idempotency import IdempotencyStore
+from app.core.due_queue import DueQueue
+from app.core.context import request_memoized
 from app.core.constants import ExceptionDetails, SuccessDetails
 from app.core.schemas import DetailResponse
+from app.events.constants import Streams
+from app.events.schemas import AttemptEventSchema, StreamEntrySchema
+from app.events.services import event_service
 from app.notifications.schemas import NotificationRequest
 from app.notifications.services import notification_service
 from app.users.services import user_service
+from app.users.constants import COMPANY_ADMIN_ROLES
 
-from app.quizzes.models import Quizzes, QuizQuestions, QuizAnswers, Attempts
+from app.quizzes.models import Quizzes, QuizQuestions, QuizAnswers, Attempts, UserQuizStatus
 from app.quizzes.schemas import QuizResponse, QuizCreateRequest, QuestionResponse, AnswerResponse, QuizFullResponse, \
     QuestionFullResponse, QuizUpdateRequest, QuestionCreateRequest, QuestionUpdateRequest, AnswerCreateRequest, \
-    AnswerUpdateRequest, SubmitAttemptRequest, AttemptResponse, AttemptRedisSchema, AttemptBaseSchema
+    AnswerUpdateRequest, SubmitAttemptRequest, AttemptResponse, AttemptRedisSchema, AttemptBaseSchema, QuizAccessSchema, \
+    QuizAnswerKeySchema, AnswerKeyQuestionSchema, AttemptCompactRedisSchema, AttemptWriteSchema
+from app.quizzes.answer_key import QuizAnswerKey
+from app.quizzes.cache import quiz_cache
+from app.quizzes.constants import ATTEMPT_COMPACT_KEY_PREFIX, \
+    ATTEMPT_USER_INDEX_KEY, ATTEMPT_QUIZ_INDEX_KEY, ATTEMPT_COMPANY_INDEX_KEY, ATTEMPT_COMPANY_USER_INDEX_KEY, \
+    ATTEMPT_REMINDERS_KEY
 
 
 class QuizService:
-    async def get_quizzes(self) -> list[QuizFullResponse]:
-        query = self.select_full_quiz_query()
-        quiz_records = await database.fetch_all(query)
-        return self.serialize_quiz_full_records(quiz_records)
-
-    async def create_quiz(self, current_user_id: int, data: QuizCreateRequest) -> DetailResponse:
+    async def get_quizzes(
+            self,
+            after_id: int | None = None,
+            limit: int | None = None
+    ) -> tuple[list[QuizFullResponse], int | None]:
+        # Keyset pagination on quizzes.id, the page of ids is selected first
+        #   and only these quizzes are assembled (mostly from quiz_cache).
+        # Returns the quizzes and the cursor of the next page (None on the last page)
+        query = keyset_query(select(Quizzes.id), Quizzes.id, after_id, limit)
+        quiz_ids = [record.id for record in await database.fetch_all(query)]
+        quiz_ids, next_cursor = split_keyset_page(quiz_ids, limit, get_id=lambda quiz_id: quiz_id)
+        return await self.get_full_quizzes(quiz_ids), next_cursor
+
+    async def count_quizzes(self) -> int:
+        return await database.fetch_val(select(func.count()).select_from(Quizzes))
+
+    async def create_quiz(
+            self,
+            current_user_id: int,
+            data: QuizCreateRequest,
+            background_tasks: BackgroundTasks
+    ) -> DetailResponse:
         await user_service.user_company_is_admin(
             user_id=current_user_id,
             company_id=data.company_id
@@ -60,32 +99,40 @@ class QuizService:
                 ]
                 create_answers_query = insert(QuizAnswers).values(answer_values)
                 await database.fetch_all(create_answers_query)
-
-                await notification_service.on_quiz_create_send_notification_to_all_company_members(
-                    quiz_id=quiz.id,
-                    company_id=quiz.company_id,
-                    current_user_id=current_user_id
-                )
         except Exception as e:
             return DetailResponse(detail=f'{e}')
 
+        # Fan-out to all company members runs after the response is sent
+        background_tasks.add_task(
+            notification_service.on_quiz_create_send_notification_to_all_company_members,
+            quiz_id=quiz.id,
+            company_id=quiz.company_id,
+            current_user_id=current_user_id
+        )
         return DetailResponse(detail=SuccessDetails.SUCCESS)
 
     async def get_quiz(self, quiz_id: int) -> QuizFullResponse:
-        query = self.select_full_quiz_query().filter(
-            Quizzes.id == quiz_id
-        )
-        quiz_records = await database.fetch_all(query)
-        if not quiz_records:
+        quizzes = await self.get_full_quizzes([quiz_id])
+        if not quizzes:
             raise NotFoundException()
-        return self.serialize_quiz_full_records(quiz_records)[0]
+        return quizzes[0]
+
+    async def get_full_quizzes(self, quiz_ids: list[int]) -> list[QuizFullResponse]:
+        # Served from quiz_cache, only the missing quizzes go through select_full_quiz_query.
+        # Quizzes that don't exist (or have no questions) are skipped, order of quiz_ids is kept
+        cached_quizzes, versions = await quiz_cache.get_many(quiz_ids)
+
+        missing_ids = [quiz_id for quiz_id in quiz_ids if quiz_id not in cached_quizzes]
+        if missing_ids:
+            query = self.select_full_quiz_query().filter(Quizzes.id.in_(missing_ids))
+            loaded_quizzes = self.serialize_quiz_full_records(await database.fetch_all(query))
+            await quiz_cache.set_many(loaded_quizzes, versions)
+            cached_quizzes.update({quiz.quiz_id: quiz for quiz in loaded_quizzes})
+
+        return [cached_quizzes[quiz_id] for quiz_id in quiz_ids if quiz_id in cached_quizzes]
 
     async def update_quiz(self, quiz_id: int, current_user_id: int, data: QuizUpdateRequest) -> QuizResponse:
-        quiz_company_id = await self.get_company_id_by_quiz_id(quiz_id)
-        await user_service.user_company_is_admin(
-            user_id=current_user_id,
-            company_id=quiz_company_id
-        )
+        await self.ensure_quiz_role(quiz_id=quiz_id, user_id=current_user_id, role=COMPANY_ADMIN_ROLES)
 
         values = exclude_none({
             'name': data.name,
@@ -97,19 +144,24 @@ class QuizService:
             .where(Quizzes.id == quiz_id) \
             .values(**values) \
             .returning(Quizzes)
-        quiz = await database.fetch_one(query)
-        if quiz is None:
-            raise NotFoundException(ExceptionDetails.ENTITY_WITH_ID_NOT_FOUND('quiz', quiz_id))
+        statuses = []
+        async with database.transaction():
+            quiz = await database.fetch_one(query)
+            if quiz is None:
+                raise NotFoundException(ExceptionDetails.ENTITY_WITH_ID_NOT_FOUND('quiz', quiz_id))
+            if data.frequency is not None:
+                status_query = update(UserQuizStatus).where(UserQuizStatus.quiz_id == quiz_id).values(
+                    due_at=UserQuizStatus.last_attempt_at + func.make_interval(0, 0, 0, data.frequency + 1)
+                ).returning(UserQuizStatus.user_id, UserQuizStatus.quiz_id, UserQuizStatus.due_at)
+                statuses = await database.fetch_all(status_query)
+        await quiz_cache.bump(quiz_id)
+        await self.schedule_reminders(statuses)
 
         quiz = self.serialize_quiz(quiz)
         return quiz
 
     async def delete_quiz(self, quiz_id: int, current_user_id: int) -> DetailResponse:
-        quiz_company_id = await self.get_company_id_by_quiz_id(quiz_id)
-        await user_service.user_company_is_admin(
-            user_id=current_user_id,
-            company_id=quiz_company_id
-        )
+        await self.ensure_quiz_role(quiz_id=quiz_id, user_id=current_user_id, role=COMPANY_ADMIN_ROLES)
 
         try:
             async with database.transaction():
@@ -119,13 +171,16 @@ class QuizService:
 
                 delete_answers_query = delete(QuizAnswers).where(QuizAnswers.question_id.in_(question_ids))
                 delete_questions_query = delete(QuizQuestions).where(QuizQuestions.quiz_id == quiz_id)
+                delete_statuses_query = delete(UserQuizStatus).where(UserQuizStatus.quiz_id == quiz_id)
                 delete_quiz_query = delete(Quizzes).where(Quizzes.id == quiz_id)
 
                 await database.fetch_all(delete_answers_query)
                 await database.fetch_all(delete_questions_query)
+                await database.execute(delete_statuses_query)
                 await database.fetch_one(delete_quiz_query)
         except Exception as e:
             return DetailResponse(detail=f'{e}')
+        await quiz_cache.bump(quiz_id)
         return DetailResponse(detail=SuccessDetails.SUCCESS)
 
     async def get_quiz_questions(self, quiz_id: int) -> list[QuestionFullResponse]:
@@ -133,199 +188,346 @@ class QuizService:
         question_records = await database.fetch_all(query)
         return self.serialize_question_full_records(question_records)
 
-    async def submit_attempt(self, current_user_id: int, data: SubmitAttemptRequest) -> AttemptResponse:
-        company_id = await self.get_company_id_by_quiz_id(data.quiz_id)
-        await user_service.user_company_is_member(
-            user_id=current_user_id,
-            company_id=company_id
-        )
-
-        questions = await self.get_validated_attempt_questions(data.quiz_id, data.question_ids)
-        answers = await self.get_validated_attempt_answers(questions, data.answer_ids)
+    async def submit_attempt(
+            self,
+            current_user_id: int,
+            data: SubmitAttemptRequest,
+            idempotency_key: str | None = None
+    ) -> AttemptResponse:
+        # Retries with the same Idempotency-Key get the first response back without touching the db.
+        #   Failed attempts release the key, so they can be retried
+        if idempotency_key is None:
+            return await self.create_attempt(current_user_id, data)
+
+        scope = str(current_user_id)
+        fingerprint = hashlib.sha256(data.json().encode()).hexdigest()
+        cached_response = await attempt_idempotency.begin(scope, idempotency_key, fingerprint)
+        if cached_response is not None:
+            return AttemptResponse.parse_raw(cached_response)
 
-        total_correct_answers = await self.get_total_correct_answers_per_question(data.question_ids)
-        correct_answers = await self.calculate_correct_answers(
-            total_correct_answers=total_correct_answers,
-            question_ids=data.question_ids,
-            answers=answers
-        )
-        score = await self.get_attempt_score(
-            total_correct_answers=total_correct_answers,
-            correct_answers=correct_answers
-        )
+        try:
+            attempt = await self.create_attempt(current_user_id, data)
+        except Exception:
+            await attempt_idempotency.abort(scope, idempotency_key)
+            raise
+        await attempt_idempotency.complete(scope, idempotency_key, fingerprint, attempt.json())
+        return attempt
+
+    async def create_attempt(self, current_user_id: int, data: SubmitAttemptRequest) -> AttemptResponse:
+        # Validation and scoring go through the cached answer key,
+        #   so usually the attempt insert is the only db query here
+        answer_key = await self.get_quiz_answer_key(data.quiz_id)
+        await user_service.user_company_is_member(user_id=current_user_id, company_id=answer_key.company_id)
+
+        submitted_masks = answer_key.validate_attempt(data.question_ids, data.answer_ids)
+        correct_answers, score = answer_key.score_attempt(submitted_masks)
 
         values = {
             'quiz_id': data.quiz_id,
             'user_id': current_user_id,
-            'questions': len(questions),
+            'questions': len(data.question_ids),
             'correct_answers': correct_answers,
             'score': score
         }
 
-        insert_query = insert(Attempts).values(values).returning(Attempts)
-        attempt = await database.fetch_one(insert_query)
+        if settings.ATTEMPTS_WRITE_BEHIND:
+            attempt = await self.enqueue_attempt(values)
+        else:
+            insert_query = insert(Attempts).values(values).returning(Attempts)
+            async with database.transaction():
+                attempt = await database.fetch_one(insert_query)
+                statuses = await self.upsert_user_quiz_statuses([attempt])
+            await self.schedule_reminders(statuses)
 
-        for answer in answers:
-            await self.store_attempt_in_redis(
+        await self.store_attempt_in_redis(attempt_id=attempt.id, answers=[
+            AttemptRedisSchema(
                 quiz_id=data.quiz_id,
                 user_id=current_user_id,
-                company_id=company_id,
-                question_id=answer.question_id,
-                answer_id=answer.id,
-                correct=1 if answer.correct else 0
+                company_id=answer_key.company_id,
+                question_id=question_id,
+                answer_id=answer_id,
+                correct=1 if answer_key.is_correct(answer_id) else 0
             )
+            for question_id, question_answer_ids in zip(data.question_ids, data.answer_ids)
+            for answer_id in question_answer_ids
+        ])
+        await event_service.publish(Streams.ATTEMPTS, AttemptEventSchema(
+            attempt_id=attempt.id,
+            quiz_id=attempt.quiz_id,
+            user_id=attempt.user_id,
+            company_id=answer_key.company_id,
+            questions=attempt.questions,
+            correct_answers=attempt.correct_answers,
+            score=attempt.score,
+            taken_at=attempt.created_at
+        ))
 
         return self.serialize_attempt(attempt)
 
-    async def store_attempt_in_redis(
-            self,
-            quiz_id: int,
-            user_id: int,
-            company_id: int,
-            question_id: int,
-            answer_id: int,
-            correct: int
-    ) -> None:
-        redis = await get_redis()
+    async def enqueue_attempt(self, values: dict) -> AttemptWriteSchema:
+        # Write-behind: the id is taken from the attempts sequence up front and doubles as the idempotency key,
+        #   the row is inserted later by flush_attempts, at least once, so redelivered rows are skipped on conflict.
+        # Falls back to a direct insert if the queue is unavailable
+        attempt = AttemptWriteSchema(
+            id=await attempt_id_allocator.next(),
+            created_at=datetime.datetime.now(datetime.timezone.utc),
+            **values
+        )
+        try:
+            await event_service.add(Streams.ATTEMPT_WRITES, attempt, trim=False)
+        except RedisError as e:
+            file_logger.error(f'enqueue_attempt error --> {e}')
+            async with database.transaction():
+                await database.execute(insert(Attempts).values(**attempt.dict()))
+                statuses = await self.upsert_user_quiz_statuses([attempt])
+            await self.schedule_reminders(statuses)
+        return attempt
+
+    async def flush_attempts(self, entries: list[StreamEntrySchema]) -> None:
+        # Entries that can never be inserted (bad payload, quiz deleted before the flush) are logged and dropped,
+        #   they are acked with the batch so they don't hold back the other attempts
+        attempts = {}
+        for entry in entries:
+            try:
+                attempt = AttemptWriteSchema.parse_raw(entry.data)
+            except ValidationError as e:
+                file_logger.error(f'flush_attempts dropped entry {entry.entry_id} --> {e}')
+                continue
+            # same attempt can come twice in one batch if it was claimed after a failed flush
+            attempts[attempt.id] = attempt
+        if not attempts:
+            return
 
-        key = f'{uuid.uuid4()}-quiz_id:{quiz_id}-user_id:{user_id}-company_id:{company_id}'
-        data = AttemptRedisSchema(
-            quiz_id=quiz_id,
-            user_id=user_id,
-            company_id=company_id,
-            question_id=question_id,
-            answer_id=answer_id,
-            correct=correct
-        ).dict()
+        try:
+            await self.insert_attempts(list(attempts.values()))
+        except IntegrityConstraintViolationError:
+            # one bad row fails the whole statement, so the batch is retried row by row
+            for attempt in attempts.values():
+                try:
+                    await self.insert_attempts([attempt])
+                except IntegrityConstraintViolationError as e:
+                    file_logger.error(f'flush_attempts dropped attempt {attempt.json()} --> {e}')
+
+    async def insert_attempts(self, attempts: list[AttemptWriteSchema]) -> None:
+        query = pg_insert(Attempts).values(
+            [attempt.dict() for attempt in attempts]
+        ).on_conflict_do_nothing(index_elements=[Attempts.id])
+        async with database.transaction():
+            await database.execute(query)
+            statuses = await self.upsert_user_quiz_statuses(attempts)
+        await self.schedule_reminders(statuses)
+
+    async def upsert_user_quiz_statuses(self, attempts: list[Attempts | AttemptWriteSchema]) -> list[UserQuizStatus]:
+        # Moves user_quiz_status forward to the latest attempt, due_at is computed from the current quiz frequency.
+        #   Older (e.g. redelivered) attempts don't move it back
+        latest_attempts = {}
+        for attempt in attempts:
+            key = (attempt.user_id, attempt.quiz_id)
+            if key not in latest_attempts or attempt.created_at > latest_attempts[key]:
+                latest_attempts[key] = attempt.created_at
+
+        values = [
+            {
+                'user_id': user_id,
+                'quiz_id': quiz_id,
+                'last_attempt_at': last_attempt_at,
+                'due_at': literal(last_attempt_at, DateTime(timezone=True)) + select(
+                    func.make_interval(0, 0, 0, Quizzes.frequency + 1)
+                ).where(Quizzes.id == quiz_id).scalar_subquery()
+            }
+            for (user_id, quiz_id), last_attempt_at in latest_attempts.items()
+        ]
+        query = pg_insert(UserQuizStatus).values(values)
+        is_newer = query.excluded.last_attempt_at >= UserQuizStatus.last_attempt_at
+        query = query.on_conflict_do_update(
+            index_elements=[UserQuizStatus.user_id, UserQuizStatus.quiz_id],
+            set_={
+                'last_attempt_at': case((is_newer, query.excluded.last_attempt_at), else_=UserQuizStatus.last_attempt_at),
+                'due_at': case((is_newer, query.excluded.due_at), else_=UserQuizStatus.due_at)
+            }
+        ).returning(UserQuizStatus.user_id, UserQuizStatus.quiz_id, UserQuizStatus.due_at)
+        return await database.fetch_all(query)
+
+    async def schedule_reminders(self, statuses: list[UserQuizStatus], only_new: bool = False) -> None:
+        # The reminders queue is only a hint, pop_due_reminders checks every popped pair against user_quiz_status
+        #   and reconcile_reminders re-adds missing pairs, so redis errors here are just logged
+        try:
+            await attempt_reminders.schedule({
+                self.reminder_member(status.user_id, status.quiz_id): status.due_at.timestamp()
+                for status in statuses
+            }, only_new=only_new)
+        except RedisError as e:
+            file_logger.error(f'schedule_reminders error --> {e}')
+
+    async def pop_due_reminders(self, limit: int) -> tuple[list[AttemptBaseSchema], bool]:
+        # Returns the outdated attempts to remind about and whether the queue may have more due entries.
+        #   Popped pairs that aren't due anymore (new attempt, frequency change) are moved to their due_at,
+        #   pairs without a status (deleted quiz) are dropped
+        now = time.time()
+        members = await attempt_reminders.pop_due(now, limit=limit, lease=settings.REMINDERS_LEASE_IN_SECONDS)
+        if not members:
+            return [], False
+
+        pairs = [tuple(int(part) for part in member.split(':')) for member in members]
+        query = select(
+            UserQuizStatus.user_id,
+            UserQuizStatus.quiz_id,
+            UserQuizStatus.last_attempt_at,
+            UserQuizStatus.due_at
+        ).where(tuple_(UserQuizStatus.user_id, UserQuizStatus.quiz_id).in_(pairs))
+        statuses = {(status.user_id, status.quiz_id): status for status in await database.fetch_all(query)}
 
-        exp = datetime.timedelta(hours=48)
-        exp_seconds = int(exp.total_seconds())
+        outdated_attempts = []
+        not_due_statuses = []
+        for user_id, quiz_id in pairs:
+            status = statuses.get((user_id, quiz_id))
+            if status is None:
+                continue
+            if status.due_at.timestamp() > now:
+                not_due_statuses.append(status)
+            else:
+                outdated_attempts.append(AttemptBaseSchema(
+                    quiz_id=quiz_id,
+                    user_id=user_id,
+                    taken_at=status.last_attempt_at
+                ))
 
-        await redis.hset(key, mapping=data)
-        await redis.expire(key, exp_seconds)
+        await attempt_reminders.remove(*[
+            self.reminder_member(user_id, quiz_id) for user_id, quiz_id in pairs if (user_id, quiz_id) not in statuses
+        ])
+        await self.schedule_reminders(not_due_statuses)
+        return outdated_attempts, len(members) == limit
+
+    async def postpone_reminders(self, outdated_attempts: list[AttemptBaseSchema]) -> None:
+        # Sent reminders are repeated until the user takes the quiz again,
+        #   pairs lost to a redis error are re-added by reconcile_reminders
+        repeat_at = time.time() + settings.REMINDERS_REPEAT_IN_SECONDS
+        try:
+            await attempt_reminders.schedule({
+                self.reminder_member(attempt.user_id, attempt.quiz_id): repeat_at
+                for attempt in outdated_attempts
+            })
+        except RedisError as e:
+            file_logger.error(f'postpone_reminders error --> {e}')
 
-    async def get_attempt_score(self, total_correct_answers, correct_answers: float):
-        total_correct_answers = sum(total_correct_answers.values())
-        score = correct_answers / total_correct_answers
-        return score
+    async def get_max_status_user_id(self) -> int | None:
+        return await database.fetch_val(select(func.max(UserQuizStatus.user_id)))
 
-    async def calculate_correct_answers(
+    async def reconcile_reminders_chunk(
             self,
-            total_correct_answers,
-            question_ids:
-            list[int],
-            answers: list[QuizAnswers]
-    ) -> float:
-        correct_submitted_answers = await self.get_correct_submitted_answers_per_question(answers)
-        total_submitted_answers = await self.get_total_submitted_answers_per_question(answers)
-
-        total_score = 0
-        for question_id in question_ids:
-            correct_total = total_correct_answers[question_id]
-            total_submitted = total_submitted_answers[question_id]
-            correct_submitted = correct_submitted_answers[question_id]
-
-            submitted_dif = correct_submitted / total_submitted
-            correct_dif = correct_submitted / correct_total
-            score = submitted_dif * correct_dif
-            total_score += score
-
-        return total_score
-
-    async def get_total_answers_per_question(self, question_ids: list[int]):
-        query = select(
-            QuizAnswers.question_id,
-            func.count().label('num')
-        ).filter(
-            QuizAnswers.question_id.in_(question_ids),
-        ).group_by(QuizAnswers.question_id)
-        res = await database.fetch_all(query)
-        return {row['question_id']: row['num'] for row in res}
-
-    async def get_total_correct_answers_per_question(self, question_ids: list[int]):
+            start_user_id: int,
+            end_user_id: int,
+            after: list[int] | None
+    ) -> tuple[list[int] | None, int]:
+        # Seeds the reminders queue from user_quiz_status (e.g. after a redis flush), one chunk of a user id shard.
+        #   Pairs that are already queued keep their score so sent reminders aren't repeated early
+        query = select(UserQuizStatus.user_id, UserQuizStatus.quiz_id, UserQuizStatus.due_at).where(
+            UserQuizStatus.user_id >= start_user_id,
+            UserQuizStatus.user_id < end_user_id
+        ).order_by(
+            UserQuizStatus.user_id, UserQuizStatus.quiz_id
+        ).limit(settings.STREAM_CHUNK_SIZE)
+        if after is not None:
+            query = query.where(tuple_(UserQuizStatus.user_id, UserQuizStatus.quiz_id) > tuple_(*after))
+        statuses = await database.fetch_all(query)
+
+        await attempt_reminders.schedule({
+            self.reminder_member(status.user_id, status.quiz_id): status.due_at.timestamp()
+            for status in statuses
+        }, only_new=True)
+
+        if len(statuses) < settings.STREAM_CHUNK_SIZE:
+            return None, len(statuses)
+        return [statuses[-1].user_id, statuses[-1].quiz_id], len(statuses)
+
+    def reminder_member(self, user_id: int, quiz_id: int) -> str:
+        return f'{user_id}:{quiz_id}'
+
+    async def get_quiz_answer_key(self, quiz_id: int) -> QuizAnswerKey:
+        answer_key, version = await quiz_cache.get_answer_key(quiz_id)
+        if answer_key is None:
+            answer_key = await self.build_quiz_answer_key(quiz_id)
+            await quiz_cache.set_answer_key(answer_key, version)
+        return answer_key
+
+    async def build_quiz_answer_key(self, quiz_id: int) -> QuizAnswerKey:
+        # Outer joins so the quiz (and its company) is found even without questions
         query = select(
-            QuizAnswers.question_id,
-            func.count().label('num')
-        ).filter(
-            QuizAnswers.question_id.in_(question_ids),
-            QuizAnswers.correct == True
-        ).group_by(QuizAnswers.question_id)
-        res = await database.fetch_all(query)
-        return {row['question_id']: row['num'] for row in res}
-
-    async def get_total_submitted_answers_per_question(self, answers: list[QuizAnswers]):
-        map = {}
-        for answer in answers:
-            if answer.question_id not in map:
-                map[answer.question_id] = 1
-            else:
-                map[answer.question_id] += 1
-        return map
-
-    async def get_correct_submitted_answers_per_question(self, answers: list[QuizAnswers]):
-        map = {}
-        for answer in answers:
-            if answer.question_id not in map:
-                map[answer.question_id] = 0
-            if answer.correct:
-                map[answer.question_id] += 1
-        return map
-
-    async def get_validated_attempt_answers(
-            self,
-            questions: list[QuizQuestions],
-            answer_ids: list[list[int]]
-    ) -> list[QuizAnswers]:
-        for question_answer_ids in answer_ids:
-            if not len(question_answer_ids) > 0:
-                raise BadRequestException('You need to give at least one answer per question')
-
-        flat_answer_ids = [
-            answer_id
-            for question_answer_ids in answer_ids
-            for answer_id in question_answer_ids
-        ]
+            Quizzes.company_id,
+            QuizQuestions.id.label('question_id'),
+            QuizAnswers.id.label('answer_id'),
+            QuizAnswers.correct
+        ).select_from(Quizzes).outerjoin(
+            QuizQuestions, QuizQuestions.quiz_id == Quizzes.id
+        ).outerjoin(
+            QuizAnswers, QuizAnswers.question_id == QuizQuestions.id
+        ).where(
+            Quizzes.id == quiz_id
+        ).order_by(
+            asc(QuizQuestions.id),
+            asc(QuizAnswers.id)
+        )
+        records = await database.fetch_all(query)
+        if not records:
+            raise NotFoundException(ExceptionDetails.ENTITY_WITH_ID_NOT_FOUND('quiz', quiz_id))
 
-        quiz_question_ids = [question.id for question in questions]
-        answers_query = select(QuizAnswers).filter(and_(
-            QuizAnswers.question_id.in_(quiz_question_ids),
-            QuizAnswers.id.in_(flat_answer_ids)
+        questions: dict[int, AnswerKeyQuestionSchema] = {}
+        for record in records:
+            if record.question_id is None:
+                continue
+            question = questions.setdefault(record.question_id, AnswerKeyQuestionSchema(answer_ids=[]))
+            if record.answer_id is None:
+                continue
+            if record.correct:
+                question.correct_mask |= 1 << len(question.answer_ids)
+            question.answer_ids.append(record.answer_id)
+
+        return QuizAnswerKey(QuizAnswerKeySchema(
+            quiz_id=quiz_id,
+            company_id=records[0].company_id,
+            questions=questions
         ))
-        answers: list[QuizAnswers] = await database.fetch_all(answers_query)
 
-        if len(answers) != len(flat_answer_ids):
-            raise BadRequestException(
-                'Some of submitted answers dont belong to its question or you have duplicated answers'
-            )
+    async def store_attempt_in_redis(self, attempt_id: int, answers: list[AttemptRedisSchema]) -> None:
+        # All answers of the attempt go in one MULTI with their TTL, so there are no keys without expiry.
+        # Record keys are also added to the user/quiz/company index sorted sets (scored by expiry)
+        #   that export_service reads, indexes live as long as their latest record
+        if not answers:
+            return
 
-        question_answer_mapping = {question.id: set() for question in questions}
-        for question, question_answer_ids in zip(questions, answer_ids):
-            for answer_id in question_answer_ids:
-                question_answer_mapping[question.id].add(answer_id)
+        answer = answers[0]
+        key_suffix = f'quiz_id:{answer.quiz_id}-user_id:{answer.user_id}-company_id:{answer.company_id}'
+        ttl = settings.ATTEMPT_REDIS_TTL_IN_SECONDS
+        expires_at = int(time.time()) + ttl
 
-        for answer in answers:
-            if answer.id not in question_answer_mapping[answer.question_id]:
-                raise BadRequestException(
-                    'Some of submitted answers dont belong to its question'
+        redis = await get_redis()
+        async with redis.pipeline(transaction=True) as pipe:
+            if settings.ATTEMPT_REDIS_COMPACT_STORAGE:
+                data = AttemptCompactRedisSchema(
+                    quiz_id=answer.quiz_id,
+                    user_id=answer.user_id,
+                    company_id=answer.company_id,
+                    answers=[(answer.question_id, answer.answer_id, answer.correct) for answer in answers]
                 )
-
-        return answers
-
-    async def get_validated_attempt_questions(self, quiz_id: int, question_ids: list[int]) -> list[QuizQuestions]:
-        questions_query = select(
-            QuizQuestions,
-        ).filter(and_(
-            QuizQuestions.quiz_id == quiz_id,
-            QuizQuestions.id.in_(question_ids)
-        ))
-        questions = await database.fetch_all(questions_query)
-
-        if len(questions) != len(question_ids):
-            raise BadRequestException(
-                'You didnt submit answers to all quiz questions or some questions dont belong to this quiz'
-            )
-
-        return questions
+                keys = [f'{ATTEMPT_COMPACT_KEY_PREFIX}{attempt_id}-{key_suffix}']
+                pipe.set(keys[0], data.json(), ex=ttl)
+            else:
+                keys = []
+                for answer in answers:
+                    key = f'{uuid.uuid4()}-{key_suffix}'
+                    pipe.hset(key, mapping=answer.dict())
+                    pipe.expire(key, ttl)
+                    keys.append(key)
+
+            for index_key in (
+                    ATTEMPT_USER_INDEX_KEY(answer.user_id),
+                    ATTEMPT_QUIZ_INDEX_KEY(answer.quiz_id),
+                    ATTEMPT_COMPANY_INDEX_KEY(answer.company_id),
+                    ATTEMPT_COMPANY_USER_INDEX_KEY(answer.company_id, answer.user_id)
+            ):
+                pipe.zadd(index_key, {key: expires_at for key in keys})
+                pipe.expire(index_key, ttl)
+            await pipe.execute()
 
     def serialize_attempt(self, attempt: Attempts) -> AttemptResponse:
         return AttemptResponse(
@@ -339,11 +541,11 @@ class QuizService:
         )
 
     async def get_company_quizzes(self, company_id: int) -> list[QuizFullResponse]:
-        query = self.select_full_quiz_query().filter(
+        query = select(Quizzes.id).filter(
             Quizzes.company_id == company_id
-        )
-        quiz_records = await database.fetch_all(query)
-        return self.serialize_quiz_full_records(quiz_records)
+        ).order_by(asc(Quizzes.id))
+        quiz_ids = [record.id for record in await database.fetch_all(query)]
+        return await self.get_full_quizzes(quiz_ids)
 
     async def get_quiz_by_id(self, quiz_id: int) -> QuizResponse:
         query = select(Quizzes).where(Quizzes.id == quiz_id)
@@ -353,6 +555,7 @@ class QuizService:
             raise NotFoundException(ExceptionDetails.ENTITY_WITH_ID_NOT_FOUND('quiz', quiz_id))
         return self.serialize_quiz(quiz)
 
+    @request_memoized(NotFoundException)
     async def get_company_id_by_quiz_id(self, quiz_id: int):
         record = await database.fetch_one(
             select(Quizzes.company_id).filter(
@@ -363,6 +566,67 @@ class QuizService:
             raise NotFoundException(ExceptionDetails.ENTITY_WITH_ID_NOT_FOUND('quiz', quiz_id))
         return record['company_id']
 
+    # ---- Permissions ----
+    # Each resolver returns the quiz and company owning the entity together with
+    #   the user's role in that company (None if not a member) in one statement
+    @request_memoized(NotFoundException)
+    async def get_quiz_access_by_quiz_id(self, quiz_id: int, user_id: int) -> QuizAccessSchema:
+        query = self.select_quiz_access_query()\
+            .select_from(Quizzes)\
+            .where(Quizzes.id == quiz_id)
+        return await self._fetch_quiz_access(query, user_id, 'quiz', quiz_id)
+
+    @request_memoized(NotFoundException)
+    async def get_quiz_access_by_question_id(self, question_id: int, user_id: int) -> QuizAccessSchema:
+        query = self.select_quiz_access_query()\
+            .select_from(QuizQuestions)\
+            .join(Quizzes, Quizzes.id == QuizQuestions.quiz_id)\
+            .where(QuizQuestions.id == question_id)
+        return await self._fetch_quiz_access(query, user_id, 'question', question_id)
+
+    @request_memoized(NotFoundException)
+    async def get_quiz_access_by_answer_id(self, answer_id: int, user_id: int) -> QuizAccessSchema:
+        query = self.select_quiz_access_query()\
+            .select_from(QuizAnswers)\
+            .join(QuizQuestions, QuizQuestions.id == QuizAnswers.question_id)\
+            .join(Quizzes, Quizzes.id == QuizQuestions.quiz_id)\
+            .where(QuizAnswers.id == answer_id)
+        return await self._fetch_quiz_access(query, user_id, 'answer', answer_id)
+
+    def select_quiz_access_query(self):
+        return select(
+            Quizzes.id.label('quiz_id'),
+            Quizzes.company_id,
+            CompanyMembers.role
+        )
+
+    async def _fetch_quiz_access(self, query, user_id: int, entity: str, entity_id: int) -> QuizAccessSchema:
+        # NOTE: query has to have Quizzes joined already, membership is outer joined last
+        #   so the entity is still found when the user isn't a member
+        query = query.outerjoin(CompanyMembers, and_(
+            CompanyMembers.company_id == Quizzes.company_id,
+            CompanyMembers.user_id == user_id
+        ))
+        record = await database.fetch_one(query)
+        if not record:
+            raise NotFoundException(ExceptionDetails.ENTITY_WITH_ID_NOT_FOUND(entity, entity_id))
+        return QuizAccessSchema(quiz_id=record.quiz_id, company_id=record.company_id, role=record.role)
+
+    async def ensure_quiz_role(self, quiz_id: int, user_id: int, role: list[str]) -> QuizAccessSchema:
+        access = await self.get_quiz_access_by_quiz_id(quiz_id=quiz_id, user_id=user_id)
+        user_service.ensure_role(user_role=access.role, role=role)
+        return access
+
+    async def ensure_question_role(self, question_id: int, user_id: int, role: list[str]) -> QuizAccessSchema:
+        access = await self.get_quiz_access_by_question_id(question_id=question_id, user_id=user_id)
+        user_service.ensure_role(user_role=access.role, role=role)
+        return access
+
+    async def ensure_answer_role(self, answer_id: int, user_id: int, role: list[str]) -> QuizAccessSchema:
+        access = await self.get_quiz_access_by_answer_id(answer_id=answer_id, user_id=user_id)
+        user_service.ensure_role(user_role=access.role, role=role)
+        return access
+
     def select_full_quiz_query(self):
         return select(
             add_model_label(Quizzes) +
@@ -448,21 +712,31 @@ class QuizService:
         )
 
     # ---- Questions ----
-    async def get_questions(self) -> list[QuestionFullResponse]:
-        query = self.select_full_question_query()
+    async def get_questions(
+            self,
+            after_id: int | None = None,
+            limit: int | None = None
+    ) -> tuple[list[QuestionFullResponse], int | None]:
+        # Keyset pagination on quiz_questions.id, answers are joined for the selected page only
+        query = keyset_query(select(QuizQuestions.id), QuizQuestions.id, after_id, limit)
+        question_ids = [record.id for record in await database.fetch_all(query)]
+        question_ids, next_cursor = split_keyset_page(question_ids, limit, get_id=lambda question_id: question_id)
+        if not question_ids:
+            return [], next_cursor
+
+        query = self.select_full_question_query().filter(QuizQuestions.id.in_(question_ids))
         question_records = await database.fetch_all(query)
-        return self.serialize_question_full_records(question_records)
+        return self.serialize_question_full_records(question_records), next_cursor
+
+    async def count_questions(self) -> int:
+        return await database.fetch_val(select(func.count()).select_from(QuizQuestions))
 
     async def add_question(
             self,
             current_user_id: int,
             data: QuestionCreateRequest
     ) -> DetailResponse:
-        quiz_company_id = await self.get_company_id_by_quiz_id(data.quiz_id)
-        await user_service.user_company_is_admin(
-            user_id=current_user_id,
-            company_id=quiz_company_id
-        )
+        await self.ensure_quiz_role(quiz_id=data.quiz_id, user_id=current_user_id, role=COMPANY_ADMIN_ROLES)
 
         try:
             async with database.transaction():
@@ -483,6 +757,7 @@ class QuizService:
                 await database.fetch_all(create_answers_query)
         except Exception as e:
             return DetailResponse(detail=f'{e}')
+        await quiz_cache.bump(data.quiz_id)
         return DetailResponse(detail=SuccessDetails.SUCCESS)
 
     async def get_question(self, question_id: int) -> QuestionFullResponse:
@@ -500,10 +775,10 @@ class QuizService:
             current_user_id: int,
             data: QuestionUpdateRequest
     ) -> QuestionResponse:
-        company_id = await self.get_company_id_by_question_id(question_id)
-        await user_service.user_company_is_admin(
+        access = await self.ensure_question_role(
+            question_id=question_id,
             user_id=current_user_id,
-            company_id=company_id
+            role=COMPANY_ADMIN_ROLES
         )
 
         values = exclude_none({'content': data.content})
@@ -514,14 +789,15 @@ class QuizService:
         question = await database.fetch_one(query)
         if question is None:
             raise NotFoundException(ExceptionDetails.ENTITY_WITH_ID_NOT_FOUND('question', question_id))
+        await quiz_cache.bump(access.quiz_id)
 
         return self.serialize_question(question)
 
     async def delete_question(self, question_id: int, current_user_id: int) -> DetailResponse:
-        company_id = await self.get_company_id_by_question_id(question_id)
-        await user_service.user_company_is_admin(
+        access = await self.ensure_question_role(
+            question_id=question_id,
             user_id=current_user_id,
-            company_id=company_id
+            role=COMPANY_ADMIN_ROLES
         )
 
         try:
@@ -536,6 +812,7 @@ class QuizService:
                 await database.fetch_one(delete_question_query)
         except Exception as e:
             return DetailResponse(detail=f'{e}')
+        await quiz_cache.bump(access.quiz_id)
         return DetailResponse(detail=SuccessDetails.SUCCESS)
 
     async def get_question_answers(self, question_id: int) -> list[AnswerResponse]:
@@ -543,10 +820,11 @@ class QuizService:
         answers = await database.fetch_all(query)
         return [self.serialize_answer(answer) for answer in answers]
 
+    @request_memoized(NotFoundException)
     async def get_company_id_by_question_id(self, question_id: int):
         query = select(Quizzes.company_id).join(
             QuizQuestions, QuizQuestions.quiz_id == Quizzes.id
-        )
+        ).where(QuizQuestions.id == question_id)
         record = await database.fetch_one(query)
         if not record:
             raise NotFoundException()
@@ -602,20 +880,28 @@ class QuizService:
         )
 
     # ---- Answers ----
-    async def get_answers(self) -> list[AnswerResponse]:
-        query = select(QuizAnswers)
+    async def get_answers(
+            self,
+            after_id: int | None = None,
+            limit: int | None = None
+    ) -> tuple[list[AnswerResponse], int | None]:
+        query = keyset_query(select(QuizAnswers), QuizAnswers.id, after_id, limit)
         answers = await database.fetch_all(query)
-        return [self.serialize_answer(answer) for answer in answers]
+        answers, next_cursor = split_keyset_page(answers, limit)
+        return [self.serialize_answer(answer) for answer in answers], next_cursor
+
+    async def count_answers(self) -> int:
+        return await database.fetch_val(select(func.count()).select_from(QuizAnswers))
 
     async def add_answer(
             self,
             current_user_id: int,
             data: AnswerCreateRequest
     ) -> DetailResponse:
-        quiz_company_id = await self.get_company_id_by_question_id(data.question_id)
-        await user_service.user_company_is_admin(
+        access = await self.ensure_question_role(
+            question_id=data.question_id,
             user_id=current_user_id,
-            company_id=quiz_company_id
+            role=COMPANY_ADMIN_ROLES
         )
 
         try:
@@ -629,6 +915,7 @@ class QuizService:
                 await database.fetch_one(create_answers_query)
         except Exception as e:
             return DetailResponse(detail=f'{e}')
+        await quiz_cache.bump(access.quiz_id)
         return DetailResponse(detail=SuccessDetails.SUCCESS)
 
     async def get_answer(self, answer_id: int) -> AnswerResponse:
@@ -646,11 +933,7 @@ class QuizService:
             current_user_id: int,
             data: AnswerUpdateRequest
     ) -> AnswerResponse:
-        company_id = await self.get_company_id_by_answer_id(answer_id)
-        await user_service.user_company_is_admin(
-            user_id=current_user_id,
-            company_id=company_id
-        )
+        access = await self.ensure_answer_role(answer_id=answer_id, user_id=current_user_id, role=COMPANY_ADMIN_ROLES)
 
         values = exclude_none({
             'content': data.content,
@@ -663,55 +946,28 @@ class QuizService:
         answer = await database.fetch_one(query)
         if answer is None:
             raise NotFoundException(ExceptionDetails.ENTITY_WITH_ID_NOT_FOUND('answer', answer_id))
+        await quiz_cache.bump(access.quiz_id)
 
         return self.serialize_answer(answer)
 
     async def delete_answer(self, answer_id: int, current_user_id: int) -> DetailResponse:
-        company_id = await self.get_company_id_by_answer_id(answer_id)
-        await user_service.user_company_is_admin(
-            user_id=current_user_id,
-            company_id=company_id
-        )
+        access = await self.ensure_answer_role(answer_id=answer_id, user_id=current_user_id, role=COMPANY_ADMIN_ROLES)
 
         try:
             query = delete(QuizAnswers).where(QuizAnswers.id == answer_id)
             await database.fetch_one(query)
         except Exception as e:
             return DetailResponse(detail=f'{e}')
+        await quiz_cache.bump(access.quiz_id)
         return DetailResponse(detail=SuccessDetails.SUCCESS)
 
-    async def get_all_outdated_attempts(self) -> list[AttemptBaseSchema]:
-        latest_attempts_query = select(
-            Attempts.quiz_id,
-            Attempts.user_id,
-            func.max(Attempts.created_at).label('latest_attempt_date'),
-            Quizzes.frequency
-        ).join(
-            Quizzes, Quizzes.id == Attempts.quiz_id
-        ).group_by(
-            Attempts.user_id,
-            Attempts.quiz_id,
-            Quizzes.frequency
-        )
-        latest_attempts = await database.fetch_all(latest_attempts_query)
-
-        outdated_attempts = []
-        for attempt in latest_attempts:
-            days_dif = (datetime.datetime.now(datetime.timezone.utc) - attempt.latest_attempt_date).days
-            if days_dif > attempt.frequency:
-                outdated_attempts.append(AttemptBaseSchema(
-                    quiz_id=attempt.quiz_id,
-                    user_id=attempt.user_id,
-                    taken_at=attempt.latest_attempt_date
-                ))
-        return outdated_attempts
-
+    @request_memoized(NotFoundException)
     async def get_company_id_by_answer_id(self, answer_id: int):
         query = select(Quizzes.company_id).join(
             QuizQuestions, QuizQuestions.quiz_id == Quizzes.id
         ).join(
-            QuizAnswers, QuizAnswers.id == answer_id
-        )
+            QuizAnswers, QuizAnswers.question_id == QuizQuestions.id
+        ).where(QuizAnswers.id == answer_id)
         record = await database.fetch_one(query)
         if not record:
             raise NotFoundException()
@@ -726,4 +982,21 @@ class QuizService:
         )
 
 
+attempt_idempotency = IdempotencyStore(
+    namespace='attempts',
+    ttl=settings.ATTEMPT_IDEMPOTENCY_TTL_IN_SECONDS,
+    pending_ttl=settings.ATTEMPT_IDEMPOTENCY_PENDING_TTL_IN_SECONDS
+)
+attempt_reminders = DueQueue(ATTEMPT_REMINDERS_KEY)
+attempt_id_allocator = SequenceAllocator('attempts_id_seq', block_size=settings.ATTEMPTS_ID_BLOCK_SIZE)
 quiz_service = QuizService()
+
+# Registered even with write-behind off, so entries queued before it was switched off are still flushed
+event_service.register_consumer(
+    Streams.ATTEMPT_WRITES,
+    group='attempt_writer',
+    handler=quiz_service.flush_attempts,
+    batch_size=settings.ATTEMPTS_FLUSH_BATCH_SIZE,
+    linger_ms=settings.ATTEMPTS_FLUSH_INTERVAL_IN_MILLISECONDS,
+    delete_on_ack=True
+)
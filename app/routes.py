@@ -10,6 +10,7 @@ from app.quizzes.routes import quiz_router, question_router, answer_router, atte
 from app.analytics.routes import router as analytics_router
 from app.export.routes import router as export_router
 from app.notifications.routes import router as notification_router
+from app.schedulers.routes import router as scheduler_router
 
 
 router = APIRouter()
@@ -35,3 +36,5 @@ router.include_router(analytics_router, prefix='/analytics')
 router.include_router(export_router, prefix='/export')
 
 router.include_router(notification_router, prefix='/notifications')
+
+router.include_router(scheduler_router, prefix='/schedulers')
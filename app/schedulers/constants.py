@@ -0,0 +1,11 @@
+SCHEDULER_LEADER_KEY = 'scheduler:leader'
+SCHEDULER_JOB_STATUS_KEY = lambda name: f'scheduler:jobs:{name}'
+SCHEDULER_SHARDS_RUN_KEY = lambda name: f'scheduler:shards:{name}'
+SCHEDULER_SHARDS_DONE_KEY = lambda name, run_id: f'scheduler:shards:{name}:{run_id}:done'
+SCHEDULER_SHARDS_CHECKPOINTS_KEY = lambda name, run_id: f'scheduler:shards:{name}:{run_id}:checkpoints'
+SCHEDULER_SHARD_LOCK_KEY = lambda name, run_id, shard: f'scheduler:shards:{name}:{run_id}:lock:{shard}'
+
+
+class JobStatuses:
+    SUCCESS = 'success'
+    FAILED = 'failed'
@@ -0,0 +1,66 @@
+import os
+import socket
+import time
+import uuid
+
+from app.database import get_redis
+
+
+# Takes the lease if it's free or renews it if this node already holds it
+ELECT_SCRIPT = """
+local current = redis.call('GET', KEYS[1])
+if not current then
+    redis.call('SET', KEYS[1], ARGV[1], 'PX', ARGV[2])
+    return 1
+end
+if current == ARGV[1] then
+    redis.call('PEXPIRE', KEYS[1], ARGV[2])
+    return 1
+end
+return 0
+"""
+
+RELEASE_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+
+class LeaderElection:
+    # Redis lease held by one node at a time, elect() has to be called well within the ttl to keep it.
+    # Leadership is also bound to a local deadline (counted from before the request),
+    #   so a node that can't reach redis stops acting as the leader before another one can take over
+    def __init__(self, key: str, ttl: float):
+        self.key = key
+        self.ttl = ttl
+        self.node_id = f'{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}'
+        self._leader_until = 0.0
+        self._elect_script = None
+        self._release_script = None
+
+    @property
+    def is_leader(self) -> bool:
+        return time.monotonic() < self._leader_until
+
+    async def elect(self) -> bool:
+        started = time.monotonic()
+        redis = await get_redis()
+        if self._elect_script is None:
+            self._elect_script = redis.register_script(ELECT_SCRIPT)
+        elected = await self._elect_script(keys=[self.key], args=[self.node_id, int(self.ttl * 1000)], client=redis)
+        self._leader_until = started + self.ttl if elected else 0.0
+        return bool(elected)
+
+    async def release(self) -> None:
+        self._leader_until = 0.0
+        redis = await get_redis()
+        if self._release_script is None:
+            self._release_script = redis.register_script(RELEASE_SCRIPT)
+        await self._release_script(keys=[self.key], args=[self.node_id], client=redis)
+
+    async def get_leader(self) -> str | None:
+        redis = await get_redis()
+        leader = await redis.get(self.key)
+        return leader.decode() if leader is not None else None
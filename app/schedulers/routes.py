@@ -0,0 +1,15 @@
+from fastapi import APIRouter, Depends
+
+from app.core.utils import response_with_result_key
+from app.users.dependencies import get_admin_user
+
+from app.schedulers.schemas import JobStatusesResponse
+from app.schedulers.services import scheduler_service
+
+
+router = APIRouter(tags=['Schedulers'])
+
+
+@router.get('/jobs/', response_model=JobStatusesResponse, dependencies=[Depends(get_admin_user)])
+async def get_job_statuses() -> JobStatusesResponse:
+    return response_with_result_key(await scheduler_service.get_job_statuses())
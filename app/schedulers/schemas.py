@@ -0,0 +1,18 @@
+from datetime import datetime
+
+from pydantic import BaseModel
+
+
+class JobStatusSchema(BaseModel):
+    name: str
+    node: str
+    status: str
+    last_run_at: datetime
+    duration_ms: float
+    rows: int | None = None
+    error: str | None = None
+
+
+class JobStatusesResponse(BaseModel):
+    leader: str | None
+    jobs: list[JobStatusSchema]
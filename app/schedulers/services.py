@@ -1,19 +1,58 @@
-from datetime import datetime
+import time
+from datetime import datetime, timezone
+from typing import Awaitable, Callable
 
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
+from redis.exceptions import RedisError
 
+from app.config import settings
+from app.database import get_redis
 from app.logging import file_logger
 from app.notifications.services import notification_service
 from app.quizzes.services import quiz_service
 
+from app.schedulers.constants import SCHEDULER_LEADER_KEY, SCHEDULER_JOB_STATUS_KEY, JobStatuses
+from app.schedulers.leader import LeaderElection
+from app.schedulers.sharding import ShardedJob
+from app.schedulers.schemas import JobStatusSchema, JobStatusesResponse
+
 
 class SchedulerService:
+    # Every process runs the scheduler, but jobs only do work on the elected leader,
+    #   except for the shard workers that share the shards planned by the leader
     def __init__(self):
         self.scheduler = AsyncIOScheduler()
+        self.leader = LeaderElection(SCHEDULER_LEADER_KEY, ttl=settings.SCHEDULER_LEADER_TTL_IN_SECONDS)
+        self.jobs: dict[str, Callable[[], Awaitable[int]]] = {}
+        self.leader_only_jobs: set[str] = set()
+        self.reminders_reconciler = ShardedJob(
+            name='reconcile_reminders',
+            node_id=self.leader.node_id,
+            get_max_id=quiz_service.get_max_status_user_id,
+            process_chunk=quiz_service.reconcile_reminders_chunk,
+            shard_size=settings.SCHEDULER_SHARD_SIZE,
+            lock_ttl=settings.SCHEDULER_SHARD_LOCK_TTL_IN_SECONDS,
+            state_ttl=settings.SCHEDULER_SHARDS_STATE_TTL_IN_SECONDS
+        )
         self.add_core_jobs()
 
     def add_core_jobs(self):
-        self.scheduler.add_job(**self.check_outdated_attempts_job())
+        self.scheduler.add_job(**self.elect_leader_job())
+        self.add_job('send_due_reminders', self.send_due_reminders, **self.send_due_reminders_job())
+        self.add_job('reconcile_reminders', self.reminders_reconciler.plan, **self.reconcile_reminders_job())
+        self.add_job(
+            'reconcile_reminders_shards',
+            self.reminders_reconciler.work,
+            leader_only=False,
+            **self.shards_job()
+        )
+
+    def add_job(self, name: str, func: Callable[[], Awaitable[int]], leader_only: bool = True, **options):
+        # Jobs return the number of rows they produced, it's stored with the job status
+        self.jobs[name] = func
+        if leader_only:
+            self.leader_only_jobs.add(name)
+        self.scheduler.add_job(self.run_job, args=[name], id=name, **options)
 
     async def start(self):
         self.scheduler.start()
@@ -21,19 +60,104 @@ class SchedulerService:
     async def shutdown(self):
         if self.scheduler.running:
             self.scheduler.shutdown(wait=False)
+        if self.leader.is_leader:
+            try:
+                await self.leader.release()
+            except RedisError as e:
+                file_logger.error(f'leader release error --> {e}')
+
+    async def elect_leader(self):
+        was_leader = self.leader.is_leader
+        try:
+            is_leader = await self.leader.elect()
+        except RedisError as e:
+            file_logger.error(f'leader election error --> {e}')
+            return
+
+        # New leader reseeds the reminders queue right away, the previous one could have died mid-way
+        if is_leader and not was_leader:
+            self.scheduler.modify_job('reconcile_reminders', next_run_time=datetime.now())
 
-    async def check_outdated_attempts(self):
-        outdated_attempts = await quiz_service.get_all_outdated_attempts()
-        await notification_service.on_attempts_outdate_send_notification_to_all_users(
-            outdated_attempts
+    def elect_leader_job(self):
+        return {
+            'func': self.elect_leader,
+            'trigger': 'interval',
+            'seconds': settings.SCHEDULER_LEADER_RENEW_INTERVAL_IN_SECONDS,
+            'next_run_time': datetime.now(),
+            'max_instances': 1,
+            'coalesce': True,
+        }
+
+    async def run_job(self, name: str):
+        if name in self.leader_only_jobs and not self.leader.is_leader:
+            return
+
+        status = JobStatusSchema(
+            name=name,
+            node=self.leader.node_id,
+            status=JobStatuses.SUCCESS,
+            last_run_at=datetime.now(timezone.utc),
+            duration_ms=0
         )
+        started = time.perf_counter()
+        try:
+            status.rows = await self.jobs[name]()
+        except Exception as e:
+            file_logger.error(f'{name} job error --> {e}')
+            status.status = JobStatuses.FAILED
+            status.error = str(e)
+        status.duration_ms = round((time.perf_counter() - started) * 1000, 3)
+
+        try:
+            redis = await get_redis()
+            await redis.set(SCHEDULER_JOB_STATUS_KEY(name), status.json())
+        except RedisError as e:
+            file_logger.error(f'{name} job status error --> {e}')
+
+    async def get_job_statuses(self) -> JobStatusesResponse:
+        redis = await get_redis()
+        raw_statuses = await redis.mget([SCHEDULER_JOB_STATUS_KEY(name) for name in self.jobs])
+        return JobStatusesResponse(
+            leader=await self.leader.get_leader(),
+            jobs=[JobStatusSchema.parse_raw(status) for status in raw_statuses if status is not None]
+        )
+
+    async def send_due_reminders(self) -> int:
+        # Keeps popping while full batches come back, so a backlog is drained in one run
+        sent = 0
+        has_more = True
+        while has_more:
+            outdated_attempts, has_more = await quiz_service.pop_due_reminders(limit=settings.REMINDERS_BATCH_SIZE)
+            if not outdated_attempts:
+                continue
+            await notification_service.on_attempts_outdate_send_notification_to_all_users(
+                outdated_attempts
+            )
+            await quiz_service.postpone_reminders(outdated_attempts)
+            sent += len(outdated_attempts)
+        return sent
+
+    def send_due_reminders_job(self):
+        return {
+            'trigger': 'interval',
+            'seconds': settings.REMINDERS_POLL_INTERVAL_IN_SECONDS,
+            'max_instances': 1,
+            'coalesce': True,
+        }
+
+    def reconcile_reminders_job(self):
+        # Only plans the shards, also runs whenever this node becomes the leader
+        return {
+            'trigger': 'interval',
+            'hours': settings.REMINDERS_RECONCILE_INTERVAL_IN_HOURS,
+        }
 
-    def check_outdated_attempts_job(self):
+    def shards_job(self):
         return {
-            'func': self.check_outdated_attempts,
             'trigger': 'interval',
-            'days': 1,
-            'start_date': datetime.now().replace(hour=0, minute=0, second=0),
+            'seconds': settings.SCHEDULER_SHARDS_POLL_INTERVAL_IN_SECONDS,
+            'max_instances': 1,
+            'coalesce': True,
         }
 
 
@@ -0,0 +1,141 @@
+import json
+import time
+from typing import Any, Awaitable, Callable
+
+from app.database import get_redis
+from app.logging import file_logger
+
+from app.schedulers.constants import SCHEDULER_SHARDS_RUN_KEY, SCHEDULER_SHARDS_DONE_KEY, \
+    SCHEDULER_SHARDS_CHECKPOINTS_KEY, SCHEDULER_SHARD_LOCK_KEY
+
+
+# Extends the shard lock only if this node still holds it
+REFRESH_LOCK_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('PEXPIRE', KEYS[1], ARGV[2])
+end
+return 0
+"""
+
+
+class ShardLostException(Exception):
+    pass
+
+
+class ShardedJob:
+    # Splits a job over [0, max_id] in id ranges of shard_size.
+    # plan() (leader only) starts a run unless the previous one has unfinished shards,
+    #   work() (any node) claims free shards of the current run and processes them chunk by chunk.
+    # process_chunk(start_id, end_id, cursor) handles one bounded chunk of [start_id, end_id)
+    #   and returns the cursor to continue from (None once the shard is done) and the number of rows,
+    #   the cursor is checkpointed after every chunk, so a crashed shard is resumed by whoever claims it next
+    def __init__(
+            self,
+            name: str,
+            node_id: str,
+            get_max_id: Callable[[], Awaitable[int | None]],
+            process_chunk: Callable[[int, int, Any], Awaitable[tuple[Any, int]]],
+            shard_size: int,
+            lock_ttl: float,
+            state_ttl: int
+    ):
+        self.name = name
+        self.node_id = node_id
+        self.get_max_id = get_max_id
+        self.process_chunk = process_chunk
+        self.shard_size = shard_size
+        self.lock_ttl = lock_ttl
+        self.state_ttl = state_ttl
+        self._refresh_lock_script = None
+
+    async def plan(self) -> int:
+        # Returns the number of shards of the started run, 0 if the previous run isn't finished yet
+        redis = await get_redis()
+        run = await self.get_run()
+        if run is not None:
+            run_id, shards = run
+            if await redis.scard(SCHEDULER_SHARDS_DONE_KEY(self.name, run_id)) < shards:
+                return 0
+
+        max_id = await self.get_max_id()
+        if max_id is None:
+            return 0
+
+        run_id = str(time.time_ns())
+        shards = max_id // self.shard_size + 1
+        await redis.hset(SCHEDULER_SHARDS_RUN_KEY(self.name), mapping={'run_id': run_id, 'shards': shards})
+        await redis.expire(SCHEDULER_SHARDS_RUN_KEY(self.name), self.state_ttl)
+        return shards
+
+    async def work(self) -> int:
+        # Processes every free shard of the current run, returns the number of processed rows
+        run = await self.get_run()
+        if run is None:
+            return 0
+
+        run_id, shards = run
+        redis = await get_redis()
+        done = {int(shard) for shard in await redis.smembers(SCHEDULER_SHARDS_DONE_KEY(self.name, run_id))}
+
+        rows = 0
+        for shard in range(shards):
+            if shard in done:
+                continue
+            lock_key = SCHEDULER_SHARD_LOCK_KEY(self.name, run_id, shard)
+            if not await redis.set(lock_key, self.node_id, nx=True, px=int(self.lock_ttl * 1000)):
+                continue
+            try:
+                rows += await self.run_shard(run_id, shard, lock_key)
+            except ShardLostException:
+                file_logger.error(f'{self.name} shard {shard} lock lost')
+            else:
+                await redis.delete(lock_key)
+        return rows
+
+    async def run_shard(self, run_id: str, shard: int, lock_key: str) -> int:
+        redis = await get_redis()
+        done_key = SCHEDULER_SHARDS_DONE_KEY(self.name, run_id)
+        checkpoints_key = SCHEDULER_SHARDS_CHECKPOINTS_KEY(self.name, run_id)
+        start_id = shard * self.shard_size
+        end_id = start_id + self.shard_size
+
+        checkpoint = await redis.hget(checkpoints_key, shard)
+        cursor = json.loads(checkpoint) if checkpoint is not None else None
+
+        rows = 0
+        while True:
+            cursor, chunk_rows = await self.process_chunk(start_id, end_id, cursor)
+            rows += chunk_rows
+            if cursor is None:
+                break
+            await self.refresh_lock(lock_key)
+            async with redis.pipeline(transaction=True) as pipe:
+                pipe.hset(checkpoints_key, shard, json.dumps(cursor))
+                pipe.expire(checkpoints_key, self.state_ttl)
+                await pipe.execute()
+
+        async with redis.pipeline(transaction=True) as pipe:
+            pipe.sadd(done_key, shard)
+            pipe.expire(done_key, self.state_ttl)
+            pipe.hdel(checkpoints_key, shard)
+            await pipe.execute()
+        return rows
+
+    async def refresh_lock(self, lock_key: str) -> None:
+        redis = await get_redis()
+        if self._refresh_lock_script is None:
+            self._refresh_lock_script = redis.register_script(REFRESH_LOCK_SCRIPT)
+        refreshed = await self._refresh_lock_script(
+            keys=[lock_key],
+            args=[self.node_id, int(self.lock_ttl * 1000)],
+            client=redis
+        )
+        if not refreshed:
+            raise ShardLostException()
+
+    async def get_run(self) -> tuple[str, int] | None:
+        redis = await get_redis()
+        run = await redis.hgetall(SCHEDULER_SHARDS_RUN_KEY(self.name))
+        if not run:
+            return None
+        return run[b'run_id'].decode(), int(run[b'shards'])
@@ -0,0 +1,103 @@
+from contextlib import asynccontextmanager
+from typing import AsyncIterator
+
+from redis.exceptions import RedisError
+
+from app.config import settings
+from app.core.cache import TwoLevelCache
+from app.core.context import clear_request_memo
+from app.logging import file_logger
+
+from app.users.schemas import UserResponse
+
+
+class UserCache:
+    # Users are cached by email (used by get_current_user) and by id, each lookup has its own version
+    #   and fills only its own entry, see CompanyRoleCache.set_role for why the version is passed back
+    def __init__(self):
+        self.cache = TwoLevelCache(
+            namespace='users',
+            local_maxsize=settings.USER_CACHE_LOCAL_SIZE,
+            local_ttl=settings.USER_CACHE_LOCAL_TTL_IN_SECONDS,
+            redis_ttl=settings.USER_CACHE_TTL_IN_SECONDS
+        )
+
+    async def get_by_email(self, email: str) -> tuple[UserResponse | None, int | None]:
+        return await self._get(f'email:{email}')
+
+    async def get_by_id(self, user_id: int) -> tuple[UserResponse | None, int | None]:
+        return await self._get(f'id:{user_id}')
+
+    async def set_by_email(self, user: UserResponse, version: int | None) -> None:
+        await self._set(f'email:{user.user_email}', user, version)
+
+    async def set_by_id(self, user: UserResponse, version: int | None) -> None:
+        await self._set(f'id:{user.user_id}', user, version)
+
+    async def invalidate(self, user: UserResponse) -> None:
+        for scope in (f'email:{user.user_email}', f'id:{user.user_id}'):
+            try:
+                await self.cache.bump_version(scope)
+            except RedisError as e:
+                file_logger.error(f'users invalidate error --> {e}')
+
+    async def _get(self, scope: str) -> tuple[UserResponse | None, int | None]:
+        version = await self.cache.get_version(scope)
+        if version is None:
+            return None, None
+        return self._deserialize(await self.cache.get(f'{scope}:{version}')), version
+
+    async def _set(self, scope: str, user: UserResponse, version: int | None) -> None:
+        if version is not None:
+            await self.cache.set(f'{scope}:{version}', user.dict())
+
+    def _deserialize(self, data: dict | None) -> UserResponse | None:
+        return UserResponse(**data) if data is not None else None
+
+
+class CompanyRoleCache:
+    # (user_id, company_id) -> role, an empty string means the user is not a member.
+    # Local entries live for a few seconds only, as other workers can't invalidate them
+    def __init__(self):
+        self.cache = TwoLevelCache(
+            namespace='company_roles',
+            local_maxsize=settings.COMPANY_ROLE_CACHE_LOCAL_SIZE,
+            local_ttl=settings.COMPANY_ROLE_CACHE_LOCAL_TTL_IN_SECONDS,
+            redis_ttl=settings.COMPANY_ROLE_CACHE_TTL_IN_SECONDS
+        )
+
+    async def get_role(self, user_id: int, company_id: int) -> tuple[str | None, int | None]:
+        # Returns the company's version as well, set_role has to be given the same one
+        version = await self.cache.get_version(str(company_id))
+        if version is None:
+            return None, None
+        return await self.cache.get(self._key(user_id, company_id, version)), version
+
+    async def set_role(self, user_id: int, company_id: int, role: str | None, version: int | None) -> None:
+        # Stored under the version read before the db, so a role loaded before an invalidation
+        #   is never served after it
+        if version is not None:
+            await self.cache.set(self._key(user_id, company_id, version), role or '')
+
+    async def invalidate(self, company_id: int) -> None:
+        clear_request_memo()
+        try:
+            await self.cache.bump_version(str(company_id))
+        except RedisError as e:
+            file_logger.error(f'company_roles invalidate error --> {e}')
+
+    @asynccontextmanager
+    async def invalidating(self, company_id: int) -> AsyncIterator[None]:
+        # For writes that revoke roles: the version is also bumped before the write,
+        #   if Redis is unavailable the write fails instead of the old role staying cached
+        clear_request_memo()
+        await self.cache.bump_version(str(company_id))
+        yield
+        await self.invalidate(company_id)
+
+    def _key(self, user_id: int, company_id: int, version: int) -> str:
+        return f'{company_id}:{version}:{user_id}'
+
+
+user_cache = UserCache()
+company_role_cache = CompanyRoleCache()
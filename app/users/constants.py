@@ -2,6 +2,9 @@ class ExceptionDetails:
     PASSWORDS_DONT_MATCH = 'Passwords do not match.'
     WEAK_PASSWORD = 'Password must be longer than 4 characters.'
     INVALID_TOKEN = "Invalid token."
+    INVALID_KID = 'Invalid kid header (wrong tenant or rotated public key)'
+    JWKS_UNAVAILABLE = 'Could not load the signing keys'
+    TOKEN_STORE_UNAVAILABLE = 'Refresh tokens are temporarily unavailable, try again later'
     EMAIL_TAKEN = "Email is already taken."
     USER_NOT_FOUND = 'This user not found'
     USER_WITH_ID_NOT_FOUND = lambda user_id: f"user with id {user_id} not found"
@@ -10,3 +13,7 @@ class ExceptionDetails:
     INVALID_CREDENTIALS = "Incorrect username or password"
     USER_ALREADY_A_MEMBER = "User is already a member of the company"
     ACTION_NOT_ALLOWED = 'You are not allowed to perform this action'
+
+
+COMPANY_ADMIN_ROLES = ['owner', 'admin']
+COMPANY_MEMBER_ROLES = ['owner', 'admin', 'member']
@@ -13,7 +13,7 @@ from app.users.services import user_service
 
 async def get_current_user(token: str = Depends(token_scheme)) -> UserResponse:
     try:
-        token_data = decode_token(token.credentials)  # type: ignore
+        token_data = await decode_token(token.credentials)  # type: ignore
     except InvalidTokenException:
         raise UnauthorizedHTTPException(ExceptionDetails.INVALID_TOKEN)
 
@@ -21,7 +21,7 @@ async def get_current_user(token: str = Depends(token_scheme)) -> UserResponse:
         return await user_service.get_user_by_email(email=token_data.user_email)
     except UserNotFoundException:
         if token_data.type == 'auth0':
-            return await user_service.register_user_from_3party(
+            return await user_service.get_or_register_user_from_3party(
                 email=token_data.user_email
             )
 
@@ -14,5 +14,9 @@ class InvalidTokenException(Exception):
     pass
 
 
+class TokenStoreUnavailableException(Exception):
+    pass
+
+
 class UserAlreadyAMemberException(Exception):
     pass
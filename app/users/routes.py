@@ -4,19 +4,23 @@ from fastapi_pagination import Page, Params
 from fastapi_utils.cbv import cbv
 
 from app.core.utils import response_with_result_key
+from app.core.schemas import DetailResponse
+from app.core.constants import SuccessDetails
 from app.core.exceptions import \
     NotFoundHTTPException, \
     BadRequestHTTPException, \
-    UnauthorizedHTTPException, ForbiddenHTTPException
+    UnauthorizedHTTPException, ForbiddenHTTPException, ServiceUnavailableHTTPException
 from app.core.pagination import paginate
 
-from app.users.services import user_service
+from app.users.services import user_service, refresh_token_service
 from app.users.schemas import \
     UserResponse, \
     UserSignUpRequest, \
     UserUpdateRequest, \
-    TokenResponse
-from app.users.exceptions import UserNotFoundException, EmailTakenException, InvalidCredentialsException
+    TokenResponse, \
+    RefreshTokenRequest
+from app.users.exceptions import UserNotFoundException, EmailTakenException, InvalidCredentialsException, \
+    InvalidTokenException, TokenStoreUnavailableException
 from app.users.constants import ExceptionDetails
 from app.users.dependencies import get_current_user, UserSignInRequestForm
 from app.users.security import create_access_token
@@ -39,11 +43,36 @@ class AuthCBV:
             raise UnauthorizedHTTPException(ExceptionDetails.INVALID_CREDENTIALS)
 
         access_token = create_access_token(email=user.user_email)
+        refresh_token = await refresh_token_service.create_refresh_token(email=user.user_email)
         return response_with_result_key(TokenResponse(
             access_token=access_token,
-            token_type='Bearer'
+            token_type='Bearer',
+            refresh_token=refresh_token
         ))
 
+    @auth_router.post('/refresh/', response_model=TokenResponse)
+    async def refresh_token(self, data: RefreshTokenRequest) -> TokenResponse:
+        try:
+            email, refresh_token = await refresh_token_service.rotate_refresh_token(data.refresh_token)
+        except InvalidTokenException:
+            raise UnauthorizedHTTPException(ExceptionDetails.INVALID_TOKEN)
+        except TokenStoreUnavailableException:
+            raise ServiceUnavailableHTTPException(ExceptionDetails.TOKEN_STORE_UNAVAILABLE)
+
+        return response_with_result_key(TokenResponse(
+            access_token=create_access_token(email=email),
+            token_type='Bearer',
+            refresh_token=refresh_token
+        ))
+
+    @auth_router.post('/sign-out/', response_model=DetailResponse)
+    async def sign_out_user(self, data: RefreshTokenRequest) -> DetailResponse:
+        try:
+            await refresh_token_service.revoke_refresh_token(data.refresh_token)
+        except TokenStoreUnavailableException:
+            raise ServiceUnavailableHTTPException(ExceptionDetails.TOKEN_STORE_UNAVAILABLE)
+        return DetailResponse(detail=SuccessDetails.SUCCESS)
+
     @auth_router.post('/sign-up/', response_model=UserResponse)
     async def sign_up_user(self, user_data: UserSignUpRequest) -> UserResponse:
         try:
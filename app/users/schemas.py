@@ -70,11 +70,17 @@ class UserUpdateRequest(BaseModel):
 class TokenResponse(BaseModel):
     access_token: str
     token_type: str
+    refresh_token: str | None = None
+
+
+class RefreshTokenRequest(BaseModel):
+    refresh_token: str
 
 
 class TokenDataSchema(BaseModel):
     user_email: EmailStr | None = None
     type: Literal['jwt', 'auth0'] = 'jwt'
+    exp: int | None = None
 
 
 class JwksKeySchema(BaseModel):
@@ -1,13 +1,20 @@
-import json
+import asyncio
+import hashlib
+import time
 from datetime import timedelta, datetime
-from urllib.request import urlopen
+from typing import Literal
 
+import httpx
 from fastapi.security import HTTPBearer
 from passlib.context import CryptContext
 from jose import jwt, JWTError
 from pydantic import EmailStr
 
 from app.config import settings
+from app.core.cache import LRUCache
+from app.core.executors import BoundedExecutor
+from app.core.metrics import TimingCounter, metrics_registry
+from app.logging import file_logger
 
 from app.users.constants import ExceptionDetails
 from app.users.exceptions import InvalidCredentialsException, InvalidTokenException
@@ -15,19 +22,32 @@ from app.users.schemas import TokenDataSchema, JwksSchema, JwksKeySchema
 
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
+password_executor = BoundedExecutor('password-hashing', max_workers=settings.PASSWORD_HASHING_WORKERS)
+metrics_registry.register('password_hashing', password_executor)
+
 token_scheme = HTTPBearer(
     bearerFormat='Bearer',
     scheme_name='Token Auth',
     description='Auth with JWT or Auth0 Tokens'
 )
 
+# Tokens that already passed signature verification, keyed by sha256 of the token
+#   and kept until the token's own expiry
+verified_tokens_cache = LRUCache(maxsize=settings.VERIFIED_TOKENS_CACHE_SIZE)
+
+token_verifier_timings = TimingCounter()
+metrics_registry.register('token_verifiers', token_verifier_timings)
+
+AUTH0_TOKEN_ISSUER = f'https://{settings.AUTH0_DOMAIN}/'
+AUTH0_TOKEN_ALGORITHMS = [alg.strip() for alg in settings.AUTH0_ALGORITHMS.split(',')]
+
 
-def verify_password(plain_password: str, hashed_password: str) -> bool:
-    return pwd_context.verify(plain_password, hashed_password)
+async def verify_password(plain_password: str, hashed_password: str) -> bool:
+    return await password_executor.run(pwd_context.verify, plain_password, hashed_password)
 
 
-def hash_password(password: str) -> str:
-    return pwd_context.hash(password)
+async def hash_password(password: str) -> str:
+    return await password_executor.run(pwd_context.hash, password)
 
 
 def create_access_token(email: EmailStr, expires_delta: timedelta | None = None) -> str:
@@ -48,17 +68,48 @@ def create_access_token(email: EmailStr, expires_delta: timedelta | None = None)
     return encoded_jwt
 
 
-def decode_token(token: str) -> TokenDataSchema:
-    try:
-        return decode_jwt_token(token)
-    except (JWTError, InvalidTokenException):
-        pass
+async def decode_token(token: str) -> TokenDataSchema:
+    cache_key = hashlib.sha256(token.encode()).hexdigest()
+    token_data = verified_tokens_cache.get(cache_key)
+    if token_data is not None:
+        return token_data
+
+    token_data = await verify_token(token)
+    if token_data.exp is not None:
+        verified_tokens_cache.set(cache_key, token_data, expires_at=token_data.exp)
+    return token_data
+
 
+async def verify_token(token: str) -> TokenDataSchema:
     try:
-        return decode_auth0_token(token)
-    except (JWTError, InvalidTokenException):
+        header = jwt.get_unverified_header(token)
+        claims = jwt.get_unverified_claims(token)
+    except JWTError:
+        raise InvalidTokenException(ExceptionDetails.INVALID_TOKEN)
+
+    verifier = get_token_verifier(header=header, claims=claims)
+    if verifier is None:
         raise InvalidTokenException(ExceptionDetails.INVALID_TOKEN)
 
+    with token_verifier_timings.time(verifier):
+        try:
+            if verifier == 'auth0':
+                return await decode_auth0_token(token, kid=header.get('kid', ''))
+            return decode_jwt_token(token)
+        except (JWTError, InvalidTokenException):
+            raise InvalidTokenException(ExceptionDetails.INVALID_TOKEN)
+
+
+def get_token_verifier(header: dict, claims: dict) -> Literal['jwt', 'auth0'] | None:
+    # Picks the only verifier that can accept the token based on its unverified header and claims,
+    #   the chosen verifier still checks the signature, issuer and expiry itself
+    alg = header.get('alg')
+    if claims.get('iss') == AUTH0_TOKEN_ISSUER and alg in AUTH0_TOKEN_ALGORITHMS:
+        return 'auth0'
+    if 'iss' not in claims and alg == settings.JWT_ALGORITHM:
+        return 'jwt'
+    return None
+
 
 def decode_jwt_token(token: str) -> TokenDataSchema:
     try:
@@ -71,42 +122,107 @@ def decode_jwt_token(token: str) -> TokenDataSchema:
         email = payload.get("sub")
         if email is None:
             raise InvalidCredentialsException(ExceptionDetails.INVALID_CREDENTIALS)
-        return TokenDataSchema(user_email=email)
+        return TokenDataSchema(user_email=email, exp=payload.get('exp'))
 
     except JWTError:
         raise InvalidTokenException(ExceptionDetails.INVALID_TOKEN)
 
 
-def get_rsa_key(token: str) -> JwksKeySchema:
-    r = urlopen(f'https://{settings.AUTH0_DOMAIN}/.well-known/jwks.json')
-    keys = json.loads(r.read())['keys']
-    jwks = JwksSchema(keys=[JwksKeySchema(**key) for key in keys])
+class JwksKeyStore:
+    # Keeps the Auth0 signing keys in memory indexed by kid, so verifying a token
+    #   doesn't cost a request to the jwks endpoint.
+    # Keys are reloaded once the ttl is over, and an unknown kid triggers a forced reload
+    #   (at most once per min_refresh_interval) to pick up rotated keys.
+    def __init__(self, url: str, ttl: int, min_refresh_interval: int, timeout: float):
+        self.url = url
+        self.ttl = ttl
+        self.min_refresh_interval = min_refresh_interval
+        self.timeout = timeout
+
+        self._keys: dict[str, JwksKeySchema] = {}
+        self._expires_at = 0.0
+        self._last_refresh_at = 0.0
+        self._lock = asyncio.Lock()
+
+    async def get_key(self, kid: str) -> JwksKeySchema:
+        if self.is_expired():
+            await self.refresh()
+
+        key = self._keys.get(kid)
+        if key is None and self.can_force_refresh():
+            await self.refresh(force=True)
+            key = self._keys.get(kid)
+
+        if key is None:
+            raise InvalidTokenException(ExceptionDetails.INVALID_KID)
+        return key
+
+    async def refresh(self, force: bool = False) -> None:
+        async with self._lock:
+            # Someone else could have reloaded the keys while we were waiting for the lock
+            if not force and not self.is_expired():
+                return
+            if force and not self.can_force_refresh():
+                return
+
+            self._last_refresh_at = time.monotonic()
+            try:
+                keys = await self.fetch_keys()
+            except (httpx.HTTPError, ValueError, KeyError) as e:
+                file_logger.error(f'JwksKeyStore.refresh error --> {e}')
+                if not self._keys:
+                    raise InvalidTokenException(ExceptionDetails.JWKS_UNAVAILABLE)
+                # Keep serving the old keys and retry a bit later instead of on every request
+                self._expires_at = time.monotonic() + self.min_refresh_interval
+                return
+
+            self._keys = {key.kid: key for key in keys}
+            self._expires_at = time.monotonic() + self.ttl
+
+    async def fetch_keys(self) -> list[JwksKeySchema]:
+        async with httpx.AsyncClient(timeout=self.timeout) as client:
+            response = await client.get(self.url)
+            response.raise_for_status()
+        jwks = JwksSchema(keys=[JwksKeySchema(**key) for key in response.json()['keys']])
+        return jwks.keys
+
+    def is_expired(self) -> bool:
+        return time.monotonic() >= self._expires_at
+
+    def can_force_refresh(self) -> bool:
+        return time.monotonic() - self._last_refresh_at >= self.min_refresh_interval
+
+
+jwks_key_store = JwksKeyStore(
+    url=f'https://{settings.AUTH0_DOMAIN}/.well-known/jwks.json',
+    ttl=settings.AUTH0_JWKS_CACHE_TTL_IN_SECONDS,
+    min_refresh_interval=settings.AUTH0_JWKS_MIN_REFRESH_INTERVAL_IN_SECONDS,
+    timeout=settings.AUTH0_JWKS_REQUEST_TIMEOUT_IN_SECONDS
+)
 
-    unverified_header = jwt.get_unverified_header(token)
-    for key in jwks.keys:
-        if key.kid == unverified_header.get('kid', ''):
-            return key
 
-    msg = 'Invalid kid header (wrong tenant or rotated public key)'
-    raise InvalidTokenException(msg)
+async def get_rsa_key(token: str, kid: str | None = None) -> JwksKeySchema:
+    if kid is None:
+        kid = jwt.get_unverified_header(token).get('kid', '')
+    return await jwks_key_store.get_key(kid)
 
 
-def decode_auth0_token(token: str) -> TokenDataSchema:
+async def decode_auth0_token(token: str, kid: str | None = None) -> TokenDataSchema:
     try:
-        rsa_key = get_rsa_key(token)
+        rsa_key = await get_rsa_key(token, kid=kid)
 
         payload = jwt.decode(
             token,
             rsa_key.dict(),
-            algorithms=settings.AUTH0_ALGORITHMS,
+            algorithms=AUTH0_TOKEN_ALGORITHMS,
             audience=settings.AUTH0_AUDIENCE,
-            issuer=f'https://{settings.AUTH0_DOMAIN}/'
+            issuer=AUTH0_TOKEN_ISSUER
         )
 
         email = payload.get(f'{settings.AUTH0_RULE_NAMESPACE}/email')
         if email is None:
             raise InvalidCredentialsException(ExceptionDetails.INVALID_CREDENTIALS)
-        return TokenDataSchema(user_email=email, type='auth0')
+        return TokenDataSchema(user_email=email, type='auth0', exp=payload.get('exp'))
 
     except JWTError:
         raise InvalidTokenException(ExceptionDetails.INVALID_TOKEN)
@@ -1,12 +1,21 @@
+import hashlib
+import secrets
+
+from asyncpg.exceptions import UniqueViolationError
 from pydantic import EmailStr
+from redis.exceptions import RedisError
 from sqlalchemy import select, insert, update, delete, and_
 
 from app.config import settings
-from app.database import database
+from app.database import database, get_redis
+from app.core.concurrency import SingleFlight
+from app.core.context import request_memoized
+from app.logging import file_logger
 from app.core.utils import exclude_none
 from app.core.exceptions import NotFoundException, ForbiddenException
 from app.companies.models import CompanyMembers
 
+from app.users.cache import user_cache, company_role_cache
 from app.users.models import Users
 from app.users.schemas import \
     UserListResponse, \
@@ -18,11 +27,104 @@ from app.users.utils import serialize_user, generate_random_password, get_userna
 from app.users.exceptions import \
     UserNotFoundException, \
     EmailTakenException, \
-    InvalidCredentialsException
-from app.users.constants import ExceptionDetails
+    InvalidCredentialsException, \
+    InvalidTokenException, \
+    TokenStoreUnavailableException
+from app.users.constants import ExceptionDetails, COMPANY_ADMIN_ROLES, COMPANY_MEMBER_ROLES
+
+
+class RefreshTokenService:
+    # Refresh tokens are opaque random strings, only their sha256 is kept in Redis:
+    #   refresh_tokens:{digest} -> email, refresh_tokens:user:{email} -> set of user's digests.
+    # Every refresh rotates the token. A rotated token that is used again revokes
+    #   all tokens of the user, as it most likely leaked.
+    namespace = 'refresh_tokens'
+
+    async def create_refresh_token(self, email: str) -> str | None:
+        token = secrets.token_urlsafe(32)
+        digest = self._digest(token)
+        ttl = settings.JWT_REFRESH_TOKEN_EXPIRE_IN_SECONDS
+
+        try:
+            redis = await get_redis()
+            async with redis.pipeline(transaction=True) as pipe:
+                pipe.set(self._token_key(digest), email, ex=ttl)
+                pipe.sadd(self._user_key(email), digest)
+                pipe.expire(self._user_key(email), ttl)
+                await pipe.execute()
+        except RedisError as e:
+            # Sign in still works without a refresh token, the client just has to sign in again later
+            file_logger.error(f'create_refresh_token error --> {e}')
+            return None
+        return token
+
+    async def rotate_refresh_token(self, token: str) -> tuple[str, str]:
+        digest = self._digest(token)
+
+        try:
+            redis = await get_redis()
+            email = await redis.getdel(self._token_key(digest))
+            if email is None:
+                reused_by = await redis.get(self._rotated_key(digest))
+                if reused_by is not None:
+                    await self.revoke_user_refresh_tokens(reused_by.decode())
+                raise InvalidTokenException(ExceptionDetails.INVALID_TOKEN)
+
+            email = email.decode()
+            async with redis.pipeline(transaction=True) as pipe:
+                pipe.srem(self._user_key(email), digest)
+                pipe.set(self._rotated_key(digest), email, ex=settings.JWT_REFRESH_TOKEN_EXPIRE_IN_SECONDS)
+                await pipe.execute()
+        except RedisError as e:
+            file_logger.error(f'rotate_refresh_token error --> {e}')
+            raise TokenStoreUnavailableException(ExceptionDetails.TOKEN_STORE_UNAVAILABLE)
+
+        new_token = await self.create_refresh_token(email)
+        if new_token is None:
+            raise TokenStoreUnavailableException(ExceptionDetails.TOKEN_STORE_UNAVAILABLE)
+        return email, new_token
+
+    async def revoke_refresh_token(self, token: str) -> None:
+        digest = self._digest(token)
+
+        try:
+            redis = await get_redis()
+            email = await redis.getdel(self._token_key(digest))
+            if email is not None:
+                await redis.srem(self._user_key(email.decode()), digest)
+        except RedisError as e:
+            file_logger.error(f'revoke_refresh_token error --> {e}')
+            raise TokenStoreUnavailableException(ExceptionDetails.TOKEN_STORE_UNAVAILABLE)
+
+    async def revoke_user_refresh_tokens(self, email: str) -> None:
+        try:
+            redis = await get_redis()
+            digests = await redis.smembers(self._user_key(email))
+            await redis.delete(
+                self._user_key(email),
+                *[self._token_key(digest.decode()) for digest in digests]
+            )
+        except RedisError as e:
+            file_logger.error(f'revoke_user_refresh_tokens error --> {e}')
+            raise TokenStoreUnavailableException(ExceptionDetails.TOKEN_STORE_UNAVAILABLE)
+
+    def _digest(self, token: str) -> str:
+        return hashlib.sha256(token.encode()).hexdigest()
+
+    def _token_key(self, digest: str) -> str:
+        return f'{self.namespace}:{digest}'
+
+    def _rotated_key(self, digest: str) -> str:
+        return f'{self.namespace}:rotated:{digest}'
+
+    def _user_key(self, email: str) -> str:
+        return f'{self.namespace}:user:{email}'
 
 
 class UserService:
+    def __init__(self):
+        self._3party_registrations = SingleFlight()
+
     async def get_users(self) -> UserListResponse:
         query = select(Users)
         users = await database.fetch_all(query)
@@ -32,17 +134,31 @@ class UserService:
         ])
 
     async def get_user_by_id(self, user_id: int) -> UserResponse:
+        cached_user, version = await user_cache.get_by_id(user_id)
+        if cached_user is not None:
+            return cached_user
+
         query = select(Users).where(Users.id == user_id)
         user = await database.fetch_one(query)
         if user is None:
             raise UserNotFoundException(ExceptionDetails.USER_WITH_ID_NOT_FOUND(user_id))
-        return serialize_user(user)
+
+        user = serialize_user(user)
+        await user_cache.set_by_id(user, version)
+        return user
 
     async def get_user_by_email(self, email: str) -> UserResponse:
+        cached_user, version = await user_cache.get_by_email(email)
+        if cached_user is not None:
+            return cached_user
+
         user = await self._get_db_user_by_email(email=email)
         if user is None:
             raise UserNotFoundException(ExceptionDetails.USER_WITH_EMAIL_NOT_FOUND(email))
-        return serialize_user(user)
+
+        user = serialize_user(user)
+        await user_cache.set_by_email(user, version)
+        return user
 
     async def register_user(self, user_data: UserSignUpRequest) -> UserResponse:
         user = await self._get_db_user_by_email(email=user_data.user_email)
@@ -52,7 +168,7 @@ class UserService:
         query = insert(Users).values(
             email=user_data.user_email,
             username=user_data.user_name,
-            hashed_password=hash_password(user_data.user_password)
+            hashed_password=await hash_password(user_data.user_password)
         ).returning(Users)
 
         user = await database.fetch_one(query)
@@ -60,7 +176,7 @@ class UserService:
 
     async def update_user(self, user_id: int, user_data: UserUpdateRequest) -> UserResponse:
         password = user_data.user_password
-        hashed_password = hash_password(password) if password else Users.hashed_password
+        hashed_password = await hash_password(password) if password else Users.hashed_password
 
         values = exclude_none({
             'username': user_data.user_name,
@@ -77,6 +193,13 @@ class UserService:
             raise UserNotFoundException(ExceptionDetails.USER_WITH_ID_NOT_FOUND(user_id))
 
         user = serialize_user(user)
+        await user_cache.invalidate(user)
+        if password:
+            try:
+                await refresh_token_service.revoke_user_refresh_tokens(user.user_email)
+            except TokenStoreUnavailableException:
+                # The change is already committed, the old tokens still expire on their own
+                pass
         return user
 
     async def delete_user(self, user_id: int) -> None:
@@ -84,6 +207,12 @@ class UserService:
         user = await database.fetch_one(query)
         if user is None:
             raise UserNotFoundException(ExceptionDetails.USER_WITH_ID_NOT_FOUND(user_id))
+        await user_cache.invalidate(serialize_user(user))
+        try:
+            await refresh_token_service.revoke_user_refresh_tokens(user.email)
+        except TokenStoreUnavailableException:
+            # Tokens of a deleted user are useless, get_current_user rejects the access tokens they give
+            pass
 
     async def authenticate_user(self, email: str, password: str) -> UserResponse:
         user = await self._get_db_user_by_email(email=email)
@@ -91,7 +220,7 @@ class UserService:
             raise UserNotFoundException(
                 ExceptionDetails.USER_WITH_EMAIL_NOT_FOUND(email)
             )
-        if not verify_password(
+        if not await verify_password(
                 plain_password=password,
                 hashed_password=user.hashed_password):
             raise InvalidCredentialsException(ExceptionDetails.INVALID_CREDENTIALS)
@@ -107,7 +236,40 @@ class UserService:
             user_password=password,
             user_password_repeat=password
         )
-        return await self.register_user(user_data)
+        try:
+            return await self.register_user(user_data)
+        except (EmailTakenException, UniqueViolationError):
+            # lost the race to another request, either before or on the insert
+            return await self.get_user_by_email(email=email)
+
+    async def get_or_register_user_from_3party(self, email: EmailStr) -> UserResponse:
+        # First login of a 3party user usually comes as a burst of parallel requests,
+        #   only one of them (per worker) registers the user and the rest await its result
+        return await self._3party_registrations.do(
+            email,
+            lambda: self._get_or_register_user_from_3party_locked(email)
+        )
+
+    async def _get_or_register_user_from_3party_locked(self, email: EmailStr) -> UserResponse:
+        # The Redis lock does the same across workers, if Redis is unavailable
+        #   we still register, register_user_from_3party handles a lost race on the email
+        try:
+            redis = await get_redis()
+            async with redis.lock(
+                    f'locks:register_user_from_3party:{email}',
+                    timeout=settings.AUTH0_REGISTRATION_LOCK_TIMEOUT_IN_SECONDS,
+                    blocking_timeout=settings.AUTH0_REGISTRATION_LOCK_TIMEOUT_IN_SECONDS
+            ):
+                return await self._get_or_register_user_from_3party(email)
+        except RedisError as e:
+            file_logger.error(f'get_or_register_user_from_3party lock error --> {e}')
+            return await self._get_or_register_user_from_3party(email)
+
+    async def _get_or_register_user_from_3party(self, email: EmailStr) -> UserResponse:
+        try:
+            return await self.get_user_by_email(email=email)
+        except UserNotFoundException:
+            return await self.register_user_from_3party(email=email)
 
     async def get_user_company_role(self, user_id: int, company_id: int) -> str:
         query = select(CompanyMembers.role).where(and_(
@@ -120,31 +282,48 @@ class UserService:
 
         return user.role
 
-    async def user_company_has_role(self, user_id: int, company_id: int, role: str | list[str]) -> bool:
-        if isinstance(role, str):
-            role = [role]
+    @request_memoized(NotFoundException)
+    async def get_cached_user_company_role(self, user_id: int, company_id: int) -> str:
+        role, version = await company_role_cache.get_role(user_id=user_id, company_id=company_id)
+        if role is None:
+            try:
+                role = await self.get_user_company_role(user_id=user_id, company_id=company_id)
+            except NotFoundException:
+                role = ''
+            await company_role_cache.set_role(user_id=user_id, company_id=company_id, role=role, version=version)
+
+        if not role:
+            raise NotFoundException('Not found')
+        return role
 
+    async def user_company_has_role(self, user_id: int, company_id: int, role: str | list[str]) -> bool:
         try:
-            user_role = await self.get_user_company_role(
+            user_role = await self.get_cached_user_company_role(
                 company_id=company_id,
                 user_id=user_id
             )
         except NotFoundException:
             raise ForbiddenException(ExceptionDetails.ACTION_NOT_ALLOWED)
-        if user_role.lower() not in role:
+        return self.ensure_role(user_role=user_role, role=role)
+
+    def ensure_role(self, user_role: str | None, role: str | list[str]) -> bool:
+        if isinstance(role, str):
+            role = [role]
+
+        if not user_role or user_role.lower() not in role:
             raise ForbiddenException(ExceptionDetails.ACTION_NOT_ALLOWED)
         return True
 
     async def user_company_is_admin(self, user_id: int, company_id: int) -> bool:
         return await self.user_company_has_role(
             user_id=user_id,
-            company_id=company_id, role=['owner', 'admin']
+            company_id=company_id, role=COMPANY_ADMIN_ROLES
         )
 
     async def user_company_is_member(self, user_id: int, company_id: int) -> bool:
         return await self.user_company_has_role(
             user_id=user_id,
-            company_id=company_id, role=['owner', 'admin', 'member']
+            company_id=company_id, role=COMPANY_MEMBER_ROLES
         )
 
     async def get_app_admin(self) -> UserResponse:
@@ -156,4 +335,5 @@ class UserService:
         return await database.fetch_one(query)
 
 
+refresh_token_service = RefreshTokenService()
 user_service = UserService()
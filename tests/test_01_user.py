@@ -155,6 +155,44 @@ async def test_try_login_five(ac: AsyncClient, login_user):
     assert response.json().get('result').get('token_type') == 'Bearer'
 
 
+async def test_refresh_token_rotation(ac: AsyncClient):
+    payload = {
+        "user_email": "test4@test.com",
+        "user_password": "test4",
+    }
+    response = await ac.post("/users/sign-in/", data=payload)
+    refresh_token = response.json().get('result').get('refresh_token')
+    assert refresh_token
+
+    response = await ac.post("/users/refresh/", json={"refresh_token": refresh_token})
+    assert response.status_code == 200
+    assert response.json().get('result').get('access_token')
+    new_refresh_token = response.json().get('result').get('refresh_token')
+    assert new_refresh_token != refresh_token
+
+    response = await ac.post("/users/refresh/", json={"refresh_token": refresh_token})
+    assert response.status_code == 401
+
+    # reusing a rotated token revokes the whole family
+    response = await ac.post("/users/refresh/", json={"refresh_token": new_refresh_token})
+    assert response.status_code == 401
+
+
+async def test_sign_out_revokes_refresh_token(ac: AsyncClient):
+    payload = {
+        "user_email": "test4@test.com",
+        "user_password": "test4",
+    }
+    response = await ac.post("/users/sign-in/", data=payload)
+    refresh_token = response.json().get('result').get('refresh_token')
+
+    response = await ac.post("/users/sign-out/", json={"refresh_token": refresh_token})
+    assert response.status_code == 200
+
+    response = await ac.post("/users/refresh/", json={"refresh_token": refresh_token})
+    assert response.status_code == 401
+
+
 async def test_auth_me_one(ac: AsyncClient, users_tokens):
     headers = {
         "Authorization": f"Bearer {users_tokens['test1@test.com']}",
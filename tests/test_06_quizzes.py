@@ -1,3 +1,5 @@
+import json
+
 from httpx import AsyncClient
 
 
@@ -139,6 +141,55 @@ async def test_get_all_quizzes(users_tokens, ac: AsyncClient):
     assert len(response.json().get("result").get('quizzes')) == 3
 
 
+async def test_get_all_quizzes_cursor_pages(users_tokens, ac: AsyncClient):
+    headers = {
+        "Authorization": f"Bearer {users_tokens['test1@test.com']}",
+    }
+    response = await ac.get("/quizzes/?size=2&include_total=true", headers=headers)
+    assert response.status_code == 200
+    result = response.json().get("result")
+    assert len(result.get('quizzes')) == 2
+    assert result.get('total') == 3
+    assert result.get('next_cursor') == result.get('quizzes')[-1]['quiz_id']
+
+    response = await ac.get(f"/quizzes/?size=2&cursor={result.get('next_cursor')}", headers=headers)
+    assert response.status_code == 200
+    result = response.json().get("result")
+    assert len(result.get('quizzes')) == 1
+    assert result.get('next_cursor') is None
+    assert result.get('total') is None
+
+
+async def test_get_all_answers_cursor_pages(users_tokens, ac: AsyncClient):
+    headers = {
+        "Authorization": f"Bearer {users_tokens['test1@test.com']}",
+    }
+    response = await ac.get("/answers/?size=2", headers=headers)
+    assert response.status_code == 200
+    result = response.json().get("result")
+    assert len(result.get('answers')) == 2
+    assert result.get('next_cursor') == result.get('answers')[-1]['answer_id']
+
+    response = await ac.get(f"/answers/?size=2&cursor={result.get('next_cursor')}", headers=headers)
+    assert response.status_code == 200
+    assert response.json().get("result").get('answers')[0]['answer_id'] > result.get('next_cursor')
+
+
+async def test_get_all_questions_stream(users_tokens, ac: AsyncClient):
+    headers = {
+        "Authorization": f"Bearer {users_tokens['test1@test.com']}",
+    }
+    response = await ac.get("/questions/?include_total=true", headers=headers)
+    total = response.json().get("result").get('total')
+
+    response = await ac.get("/questions/?stream=true", headers=headers)
+    assert response.status_code == 200
+    assert response.headers['content-type'] == 'application/x-ndjson'
+    questions = [json.loads(line) for line in response.text.splitlines()]
+    assert len(questions) == total
+    assert all(question['answers'] for question in questions)
+
+
 async def test_get_company_one_quizzes(users_tokens, ac: AsyncClient):
     headers = {
         "Authorization": f"Bearer {users_tokens['test1@test.com']}",
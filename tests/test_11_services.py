@@ -1,18 +1,53 @@
 # Hope its enough :D Anyway most of the logic is tested in other test files
 #   added some mocking in here as you asked on the meetings
+import asyncio
+import datetime
+import json
+import time
 from unittest.mock import AsyncMock, patch, MagicMock
 import pytest
-
-from app.core.exceptions import NotFoundException, BadRequestException
+from asyncpg.exceptions import ForeignKeyViolationError, UniqueViolationError
+from redis.exceptions import RedisError
+from sqlalchemy.dialects import postgresql
+
+from app import database
+from app.config import settings
+from app.core.cache import LRUCache, TwoLevelCache
+from app.core.concurrency import SingleFlight
+from app.core.context import request_memoized, start_request_memo, end_request_memo
+from app.core.executors import BoundedExecutor
+from app.core.pagination import iterate_keyset
+from app.core.sequences import SequenceAllocator
+from app.core.exceptions import NotFoundException, BadRequestException, ForbiddenException, ConflictException
+from app.core.idempotency import IdempotencyStore
+from app.core.due_queue import DueQueue
+from app.events.schemas import StreamEntrySchema
+from app.events.services import StreamConsumer, event_service
+from app.export.services import export_service
 from app.logging import file_logger
-from app.quizzes.models import QuizAnswers
+from app.notifications.services import notification_service
+from app.quizzes.answer_key import QuizAnswerKey
+from app.quizzes.schemas import QuizFullResponse, QuizAnswerKeySchema, AnswerKeyQuestionSchema, \
+    AttemptRedisSchema, AttemptCompactRedisSchema, AttemptWriteSchema, SubmitAttemptRequest, AttemptResponse, \
+    AttemptBaseSchema
 from app.quizzes.services import quiz_service
-from app.users.services import user_service
+from app.schedulers.leader import LeaderElection
+from app.schedulers.schemas import JobStatusSchema
+from app.schedulers.sharding import ShardedJob
+from app.schedulers.services import scheduler_service
+from app.users.exceptions import InvalidTokenException, TokenStoreUnavailableException
+from app.users.cache import CompanyRoleCache, UserCache
+from app.users.schemas import JwksKeySchema, UserResponse
+from app.users import security
+from app.users.security import JwksKeyStore, create_access_token, decode_token, hash_password, verify_password
+from app.users.services import user_service, refresh_token_service
+from app.users.constants import COMPANY_ADMIN_ROLES, COMPANY_MEMBER_ROLES
 
 
 @pytest.fixture
 def db():
     mock_db = AsyncMock()
+    mock_db.transaction = MagicMock()
     yield mock_db
 
 
@@ -36,126 +71,824 @@ async def test_get_user_company_role_not_found(db):
         await user_service.get_user_company_role(user_id=1, company_id=1)
 
 
+async def test_get_cached_user_company_role_skips_db_on_hit(db):
+    role_cache = AsyncMock()
+    role_cache.get_role.return_value = ('admin', 0)
+
+    with patch('app.users.services.database', db), patch('app.users.services.company_role_cache', role_cache):
+        user_role = await user_service.get_cached_user_company_role(user_id=1, company_id=1)
+
+    db.fetch_one.assert_not_called()
+    assert user_role == 'admin'
+
+
+async def test_get_cached_user_company_role_caches_non_members(db):
+    role_cache = AsyncMock()
+    role_cache.get_role.return_value = (None, 3)
+    db.fetch_one.return_value = None
+
+    with patch('app.users.services.database', db), patch('app.users.services.company_role_cache', role_cache), \
+            pytest.raises(NotFoundException):
+        await user_service.get_cached_user_company_role(user_id=1, company_id=1)
+
+    role_cache.set_role.assert_called_once_with(user_id=1, company_id=1, role='', version=3)
+
+
+async def test_rotate_refresh_token_reports_unavailable_token_store():
+    redis = AsyncMock()
+    redis.getdel.side_effect = RedisError('down')
+
+    with patch('app.users.services.get_redis', AsyncMock(return_value=redis)), \
+            pytest.raises(TokenStoreUnavailableException):
+        await refresh_token_service.rotate_refresh_token('token')
+
+
+async def test_delete_user_succeeds_when_refresh_tokens_can_not_be_revoked(db):
+    db.fetch_one.return_value = MagicMock(id=1, email='user@example.com', username='user', full_name=None, bio=None)
+    redis = AsyncMock()
+    redis.smembers.side_effect = RedisError('down')
+
+    with patch('app.users.services.database', db), patch('app.users.services.user_cache', AsyncMock()), \
+            patch('app.users.services.get_redis', AsyncMock(return_value=redis)):
+        await user_service.delete_user(user_id=1)
+
+    redis.smembers.assert_called_once_with('refresh_tokens:user:user@example.com')
+
+
+async def test_company_role_cache_drops_roles_loaded_before_invalidation():
+    redis, pipe = make_redis_pipeline()
+    redis.get = AsyncMock(side_effect=[None, None, b'1', None])
+    redis.incr = AsyncMock()
+    role_cache = CompanyRoleCache()
+
+    with patch('app.core.cache.get_redis', AsyncMock(return_value=redis)):
+        _, version = await role_cache.get_role(user_id=1, company_id=1)
+        await role_cache.invalidate(1)
+        await role_cache.set_role(user_id=1, company_id=1, role='admin', version=version)
+        role, new_version = await role_cache.get_role(user_id=1, company_id=1)
+
+    pipe.set.assert_called_once_with('company_roles:1:0:1', '"admin"', ex=settings.COMPANY_ROLE_CACHE_TTL_IN_SECONDS)
+    assert (role, new_version) == (None, 1)
+
+
+async def test_user_cache_drops_users_loaded_before_invalidation():
+    redis, pipe = make_redis_pipeline()
+    redis.get = AsyncMock(side_effect=[None, None, b'1', None])
+    redis.incr = AsyncMock()
+    user = UserResponse(user_id=1, user_email='user@example.com', user_name='user')
+    cache = UserCache()
+
+    with patch('app.core.cache.get_redis', AsyncMock(return_value=redis)):
+        _, version = await cache.get_by_email(user.user_email)
+        await cache.invalidate(user)
+        await cache.set_by_email(user, version)
+        cached_user, new_version = await cache.get_by_email(user.user_email)
+
+    assert redis.incr.call_count == 2
+    pipe.set.assert_called_once()
+    assert pipe.set.call_args.args[0] == 'users:email:user@example.com:0'
+    assert (cached_user, new_version) == (None, 1)
+
+
+async def test_company_role_cache_invalidating_fails_the_write_without_redis():
+    redis = AsyncMock()
+    redis.incr.side_effect = RedisError('down')
+    write = AsyncMock()
+    role_cache = CompanyRoleCache()
+
+    with patch('app.core.cache.get_redis', AsyncMock(return_value=redis)), pytest.raises(RedisError):
+        async with role_cache.invalidating(1):
+            await write()
+
+    write.assert_not_called()
+
+
+async def test_register_user_from_3party_returns_user_after_losing_insert_race(db):
+    user = UserResponse(user_id=1, user_email='user@example.com', user_name='user')
+    db.fetch_one.side_effect = [None, UniqueViolationError('duplicate key')]
+
+    with patch('app.users.services.database', db), \
+            patch('app.users.services.hash_password', AsyncMock(return_value='hash')), \
+            patch.object(user_service, 'get_user_by_email', AsyncMock(return_value=user)):
+        assert await user_service.register_user_from_3party('user@example.com') == user
+
+
+# ---- Core ----
+def test_lru_cache_evicts_least_recently_used():
+    cache = LRUCache(maxsize=2)
+    cache.set('a', 1)
+    cache.set('b', 2)
+    cache.get('a')
+    cache.set('c', 3)
+
+    assert 'a' in cache
+    assert 'b' not in cache
+    assert cache.get('c') == 3
+
+
+def test_lru_cache_drops_expired_entries():
+    cache = LRUCache(maxsize=2)
+    cache.set('a', 1, expires_at=0)
+    cache.set('b', 2, ttl=60)
+
+    assert cache.get('a') is None
+    assert cache.get('b') == 2
+
+
+async def test_two_level_cache_serves_repeated_reads_locally():
+    redis = AsyncMock()
+    redis.get.return_value = b'{"user_id": 1}'
+    cache = TwoLevelCache(namespace='test', local_maxsize=10, local_ttl=60, redis_ttl=60)
+
+    with patch('app.core.cache.get_redis', AsyncMock(return_value=redis)):
+        first = await cache.get('id:1')
+        second = await cache.get('id:1')
+
+    redis.get.assert_called_once_with('test:id:1')
+    assert first == second == {'user_id': 1}
+
+
+async def test_bounded_executor_caps_running_calls():
+    executor = BoundedExecutor('test', max_workers=1)
+    running = []
+
+    def work():
+        running.append(executor.running)
+
+    await asyncio.gather(*[executor.run(work) for _ in range(3)])
+    executor.shutdown()
+
+    assert running == [1, 1, 1]
+    assert executor.snapshot()['completed'] == 3
+    assert executor.snapshot()['queued'] == 0
+
+
+async def test_single_flight_runs_concurrent_calls_once():
+    single_flight = SingleFlight()
+    calls = []
+
+    async def register():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return 'user'
+
+    results = await asyncio.gather(*[single_flight.do('key', register) for _ in range(5)])
+
+    assert calls == [1]
+    assert results == ['user'] * 5
+    assert len(single_flight) == 0
+
+
+async def test_single_flight_waiters_retry_when_leader_is_cancelled():
+    single_flight = SingleFlight()
+    calls = []
+
+    async def register():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return 'user'
+
+    leader = asyncio.create_task(single_flight.do('key', register))
+    await asyncio.sleep(0)
+    waiters = [asyncio.create_task(single_flight.do('key', register)) for _ in range(3)]
+    await asyncio.sleep(0)
+    leader.cancel()
+
+    assert await asyncio.gather(*waiters) == ['user'] * 3
+    assert leader.cancelled()
+    assert calls == [1, 1]
+
+
+class MemoizedLookups:
+    def __init__(self):
+        self.calls = 0
+
+    @request_memoized(NotFoundException)
+    async def get_company_id(self, quiz_id: int):
+        self.calls += 1
+        if quiz_id == 0:
+            raise NotFoundException()
+        return quiz_id * 10
+
+
+async def test_request_memoized_repeats_no_lookups_within_request():
+    lookups = MemoizedLookups()
+
+    token = start_request_memo()
+    try:
+        assert await lookups.get_company_id(1) == 10
+        assert await lookups.get_company_id(quiz_id=1) == 10
+        for _ in range(2):
+            with pytest.raises(NotFoundException):
+                await lookups.get_company_id(0)
+    finally:
+        end_request_memo(token)
+
+    assert lookups.calls == 2
+
+
+async def test_request_memoized_passes_through_outside_request():
+    lookups = MemoizedLookups()
+
+    await lookups.get_company_id(1)
+    await lookups.get_company_id(1)
+
+    assert lookups.calls == 2
+
+
+async def test_get_redis_shares_one_client():
+    with patch('app.database._redis', None):
+        redis = await database.get_redis()
+        assert await database.get_redis() is redis
+        assert redis.connection_pool.max_connections == settings.REDIS_MAX_CONNECTIONS
+
+        await database.close_redis()
+        assert database._redis is None
+
+
+async def test_iterate_keyset_fetches_chunk_by_chunk():
+    pages = {None: ([1, 2], 2), 2: ([3, 4], 4), 4: ([5], None)}
+    fetch_page = AsyncMock(side_effect=lambda after_id, limit: pages[after_id])
+
+    items = [item async for item in iterate_keyset(fetch_page, cursor=None, chunk_size=2)]
+
+    assert items == [1, 2, 3, 4, 5]
+    assert fetch_page.call_count == 3
+
+
+# ---- Events ----
+async def test_stream_consumer_acks_only_after_handler_succeeds():
+    redis = AsyncMock()
+    handler = AsyncMock(side_effect=[None, ValueError('boom')])
+    consumer = StreamConsumer(stream='events:test', group='test', handler=handler)
+    entries = [StreamEntrySchema(entry_id='1-0', data='{}')]
+
+    await consumer.process(redis, entries)
+    await consumer.process(redis, entries)
+
+    redis.xack.assert_awaited_once_with('events:test', 'test', '1-0')
+    assert (consumer.processed, consumer.failed) == (1, 1)
+
+
+async def test_stream_consumer_drops_malformed_entries():
+    redis = AsyncMock()
+    redis.xreadgroup.return_value = [(b'events:test', [(b'1-0', {b'data': b'{}'}), (b'2-0', {b'other': b''})])]
+    consumer = StreamConsumer(stream='events:test', group='test', handler=AsyncMock())
+    consumer._last_claim_at = time.monotonic()
+
+    entries = await consumer.read(redis)
+
+    assert [entry.entry_id for entry in entries] == ['1-0']
+    redis.xack.assert_awaited_once_with('events:test', 'test', b'2-0')
+    assert consumer.failed == 1
+
+
+async def test_publish_trims_stream_by_age_when_set():
+    redis = AsyncMock()
+    redis.xadd.return_value = b'1-0'
+
+    with patch('app.events.services.get_redis', AsyncMock(return_value=redis)), \
+            patch.object(settings, 'EVENTS_STREAM_MAX_AGE_IN_SECONDS', 60):
+        entry_id = await event_service.publish('events:test', StreamEntrySchema(entry_id='', data=''))
+
+    assert entry_id == '1-0'
+    assert 'minid' in redis.xadd.call_args.kwargs
+    assert 'maxlen' not in redis.xadd.call_args.kwargs
+
+
+# ---- Auth ----
+async def test_hash_and_verify_password():
+    hashed_password = await hash_password('secret')
+
+    assert await verify_password('secret', hashed_password)
+    assert not await verify_password('wrong', hashed_password)
+
+
+def test_get_token_verifier_routes_by_header_and_issuer():
+    jwt_alg = settings.JWT_ALGORITHM
+    auth0_alg = security.AUTH0_TOKEN_ALGORITHMS[0]
+
+    assert security.get_token_verifier(header={'alg': jwt_alg}, claims={'sub': 'a@a.com'}) == 'jwt'
+    assert security.get_token_verifier(
+        header={'alg': auth0_alg, 'kid': 'kid1'},
+        claims={'iss': security.AUTH0_TOKEN_ISSUER}
+    ) == 'auth0'
+    assert security.get_token_verifier(header={'alg': auth0_alg}, claims={'iss': 'https://other/'}) is None
+
+
+async def test_decode_token_verifies_token_once():
+    token = create_access_token(email='cached@test.com')
+    verify = MagicMock(wraps=security.decode_jwt_token)
+
+    with patch('app.users.security.decode_jwt_token', verify):
+        first = await decode_token(token)
+        second = await decode_token(token)
+
+    verify.assert_called_once()
+    assert first.user_email == second.user_email == 'cached@test.com'
+
+
+def make_jwks_key(kid: str) -> JwksKeySchema:
+    return JwksKeySchema(kid=kid, kty='RSA', use='sig', n='n', e='AQAB')
+
+
+@pytest.fixture
+def jwks_store():
+    return JwksKeyStore(url='https://test/.well-known/jwks.json', ttl=3600, min_refresh_interval=30, timeout=1)
+
+
+async def test_jwks_store_fetches_keys_once(jwks_store):
+    fetch = AsyncMock(return_value=[make_jwks_key('kid1')])
+    with patch.object(jwks_store, 'fetch_keys', fetch):
+        await jwks_store.get_key('kid1')
+        key = await jwks_store.get_key('kid1')
+
+    fetch.assert_called_once()
+    assert key.kid == 'kid1'
+
+
+async def test_jwks_store_unknown_kid_forces_refresh(jwks_store):
+    fetch = AsyncMock(side_effect=[[make_jwks_key('kid1')], [make_jwks_key('kid2')]])
+    with patch.object(jwks_store, 'fetch_keys', fetch):
+        await jwks_store.get_key('kid1')
+        jwks_store._last_refresh_at -= jwks_store.min_refresh_interval
+        key = await jwks_store.get_key('kid2')
+
+    assert fetch.call_count == 2
+    assert key.kid == 'kid2'
+
+
+async def test_jwks_store_forced_refresh_is_rate_limited(jwks_store):
+    fetch = AsyncMock(return_value=[make_jwks_key('kid1')])
+    with patch.object(jwks_store, 'fetch_keys', fetch), pytest.raises(InvalidTokenException):
+        await jwks_store.get_key('kid1')
+        await jwks_store.get_key('unknown')
+
+    fetch.assert_called_once()
+
+
 # ---- Quizzes ----
-async def test_get_attempt_score():
-    total_correct_answers = {'v1': 10, 'v2': 5, 'v3': 8}
-    correct_answers = 12.5
-    result = round(await quiz_service.get_attempt_score(total_correct_answers, correct_answers), 1)
-    assert result == 0.5
-
-
-async def test_get_total_answers_per_question(db):
-    expected_question_ids = [1, 2, 3]
-    data = [
-        {'question_id': 1, 'num': 5},
-        {'question_id': 2, 'num': 10},
-        {'question_id': 3, 'num': 15},
-    ]
-    db.fetch_all.return_value = data
+async def test_ensure_quiz_role_resolves_company_and_role_in_one_query(db):
+    db.fetch_one.return_value = MagicMock(quiz_id=1, company_id=3, role='member')
 
     with patch('app.quizzes.services.database', db):
-        result = await quiz_service.get_total_answers_per_question(expected_question_ids)
+        access = await quiz_service.ensure_quiz_role(quiz_id=1, user_id=1, role=COMPANY_MEMBER_ROLES)
+        with pytest.raises(ForbiddenException):
+            await quiz_service.ensure_quiz_role(quiz_id=1, user_id=1, role=COMPANY_ADMIN_ROLES)
 
-    assert result == {1: 5, 2: 10, 3: 15}
+    assert access.company_id == 3
+    assert db.fetch_one.call_count == 2
 
 
-async def test_get_total_submitted_answers_per_question(db):
-    answers = [
-        QuizAnswers(question_id=1),
-        QuizAnswers(question_id=1),
-        QuizAnswers(question_id=1),
-        QuizAnswers(question_id=2),
-        QuizAnswers(question_id=2),
-        QuizAnswers(question_id=3)
-    ]
-    expected_result = {1: 3, 2: 2, 3: 1}
+async def test_ensure_question_role_not_found(db):
+    db.fetch_one.return_value = None
 
-    with patch('app.quizzes.services.database', db):
-        result = await quiz_service.get_total_submitted_answers_per_question(answers)
-    assert result == expected_result
+    with patch('app.quizzes.services.database', db), pytest.raises(NotFoundException):
+        await quiz_service.ensure_question_role(question_id=1, user_id=1, role=COMPANY_ADMIN_ROLES)
+
+
+def make_full_quiz(quiz_id: int) -> QuizFullResponse:
+    return QuizFullResponse(quiz_id=quiz_id, company_id=1, name='q', created_by=1, updated_by=1, questions=[])
+
+
+async def test_get_full_quizzes_loads_only_missing_quizzes(db):
+    cache = AsyncMock()
+    cache.get_many.return_value = ({2: make_full_quiz(2)}, {1: 0, 2: 4})
+
+    with patch('app.quizzes.services.database', db), patch('app.quizzes.services.quiz_cache', cache), \
+            patch.object(quiz_service, 'serialize_quiz_full_records', return_value=[make_full_quiz(1)]):
+        quizzes = await quiz_service.get_full_quizzes([1, 2, 3])
+
+    db.fetch_all.assert_called_once()
+    cache.set_many.assert_called_once_with([make_full_quiz(1)], {1: 0, 2: 4})
+    assert [quiz.quiz_id for quiz in quizzes] == [1, 2]
+
+
+async def test_get_quizzes_limits_ids_before_assembling(db):
+    db.fetch_all.return_value = [MagicMock(id=4), MagicMock(id=5), MagicMock(id=6)]
+
+    with patch('app.quizzes.services.database', db), \
+            patch.object(quiz_service, 'get_full_quizzes', AsyncMock(return_value=[])) as get_full_quizzes:
+        _, next_cursor = await quiz_service.get_quizzes(after_id=3, limit=2)
+
+    get_full_quizzes.assert_called_once_with([4, 5])
+    assert next_cursor == 5
 
 
 @pytest.fixture
-def questions():
-    return [
-        MagicMock(id=1),
-        MagicMock(id=2),
-        MagicMock(id=3),
+def answer_key():
+    return QuizAnswerKey(QuizAnswerKeySchema(quiz_id=1, company_id=1, questions={
+        1: AnswerKeyQuestionSchema(answer_ids=[1, 2], correct_mask=0b01),
+        2: AnswerKeyQuestionSchema(answer_ids=[3, 4], correct_mask=0b01),
+    }))
+
+
+@pytest.mark.parametrize('answer_ids, expected_score', [
+    ([[1], [3]], 1.0),
+    ([[1], [4]], 0.5),
+    ([[1, 2], [3]], 0.75),
+])
+def test_answer_key_scores_attempt(answer_key, answer_ids, expected_score):
+    submitted_masks = answer_key.validate_attempt([1, 2], answer_ids)
+    _, score = answer_key.score_attempt(submitted_masks)
+    assert score == expected_score
+
+
+@pytest.mark.parametrize('question_ids, answer_ids, error', [
+    ([1, 100], [[1], [3]], 'some questions dont belong to this quiz'),
+    ([1, 2], [[], [3]], 'You need to give at least one answer per question'),
+    ([1, 2], [[1], [3, 3]], 'you have duplicated answers'),
+    ([1, 2], [[3], [1]], 'Some of submitted answers dont belong to its question'),
+])
+def test_answer_key_validation_errors(answer_key, question_ids, answer_ids, error):
+    with pytest.raises(BadRequestException, match=error):
+        answer_key.validate_attempt(question_ids, answer_ids)
+
+
+def test_answer_key_scores_multiple_correct_answers():
+    answer_key = QuizAnswerKey(QuizAnswerKeySchema(quiz_id=1, company_id=1, questions={
+        1: AnswerKeyQuestionSchema(answer_ids=[1], correct_mask=0b1),
+        2: AnswerKeyQuestionSchema(answer_ids=[2, 3], correct_mask=0b11),
+        3: AnswerKeyQuestionSchema(answer_ids=[4, 5], correct_mask=0b01),
+    }))
+
+    submitted_masks = answer_key.validate_attempt([1, 2, 3], [[1], [2, 3], [4, 5]])
+    correct_answers, score = answer_key.score_attempt(submitted_masks)
+
+    assert submitted_masks == {1: 0b1, 2: 0b11, 3: 0b11}
+    # 1 + 1 + 0.5 out of 4 correct answers
+    assert (correct_answers, score) == (2.5, 0.625)
+
+
+async def test_build_quiz_answer_key(db):
+    db.fetch_all.return_value = [
+        MagicMock(company_id=2, question_id=1, answer_id=1, correct=False),
+        MagicMock(company_id=2, question_id=1, answer_id=2, correct=True),
     ]
+    with patch('app.quizzes.services.database', db):
+        answer_key = await quiz_service.build_quiz_answer_key(quiz_id=1)
+
+    assert answer_key.company_id == 2
+    assert answer_key.correct_masks == {1: 0b10}
+    assert answer_key.is_correct(2) and not answer_key.is_correct(1)
+
+
+def make_redis_pipeline():
+    pipe = MagicMock()
+    pipe.execute = AsyncMock()
+    pipe.__aenter__ = AsyncMock(return_value=pipe)
+    pipe.__aexit__ = AsyncMock(return_value=None)
+    redis = MagicMock()
+    redis.pipeline.return_value = pipe
+    return redis, pipe
+
 
 @pytest.fixture
-def answer_ids():
+def attempt_answers():
     return [
-        [1],
-        [2, 3],
-        [4, 5],
+        AttemptRedisSchema(quiz_id=1, user_id=2, company_id=3, question_id=1, answer_id=1, correct=1),
+        AttemptRedisSchema(quiz_id=1, user_id=2, company_id=3, question_id=2, answer_id=4, correct=0),
     ]
 
+
+async def test_store_attempt_in_redis_writes_answers_in_one_transaction(attempt_answers):
+    redis, pipe = make_redis_pipeline()
+
+    with patch('app.quizzes.services.get_redis', AsyncMock(return_value=redis)):
+        await quiz_service.store_attempt_in_redis(attempt_id=5, answers=attempt_answers)
+
+    redis.pipeline.assert_called_once_with(transaction=True)
+    assert pipe.hset.call_count == 2
+    # 2 records + 4 index sorted sets
+    assert pipe.expire.call_count == 6
+    assert pipe.zadd.call_count == 4
+    pipe.execute.assert_awaited_once()
+
+
+async def test_export_reads_records_from_index():
+    redis, pipe = make_redis_pipeline()
+    pipe.execute.side_effect = [(0, [b'attempt:5-quiz_id:1']), [b'{"quiz_id":1,"user_id":2,"company_id":3,"answers":[]}']]
+
+    with patch('app.export.services.get_redis', AsyncMock(return_value=redis)):
+        await export_service.get_results_from_index('attempts:index:user:2')
+
+    redis.scan_iter.assert_not_called()
+    pipe.zrangebyscore.assert_called_once()
+    pipe.get.assert_called_once_with(b'attempt:5-quiz_id:1')
+
+
+async def test_store_attempt_in_redis_compact(attempt_answers):
+    redis, pipe = make_redis_pipeline()
+
+    with patch('app.quizzes.services.get_redis', AsyncMock(return_value=redis)), \
+            patch.object(settings, 'ATTEMPT_REDIS_COMPACT_STORAGE', True):
+        await quiz_service.store_attempt_in_redis(attempt_id=5, answers=attempt_answers)
+
+    pipe.hset.assert_not_called()
+    key, value = pipe.set.call_args.args
+    assert key == 'attempt:5-quiz_id:1-user_id:2-company_id:3'
+    assert AttemptCompactRedisSchema.parse_raw(value).to_answers() == attempt_answers
+
+
 @pytest.fixture
-def answers():
-    return [
-        MagicMock(id=1, question_id=1),
-        MagicMock(id=2, question_id=2),
-        MagicMock(id=3, question_id=2),
-        MagicMock(id=4, question_id=3),
-        MagicMock(id=5, question_id=3),
-    ]
+def attempt_values():
+    return {'quiz_id': 1, 'user_id': 2, 'questions': 2, 'correct_answers': 1.5, 'score': 0.75}
 
 
-async def test_get_validated_attempt_answers(questions, answer_ids, answers, db):
-    db.fetch_all.return_value = answers
+async def test_enqueue_attempt_falls_back_to_insert(db, attempt_values):
+    allocator = AsyncMock()
+    allocator.next.return_value = 7
+    events = AsyncMock()
+    events.add.side_effect = RedisError('down')
+
+    with patch('app.quizzes.services.database', db), patch('app.quizzes.services.event_service', events), \
+            patch('app.quizzes.services.attempt_id_allocator', allocator):
+        attempt = await quiz_service.enqueue_attempt(attempt_values)
+
+    assert attempt.id == 7
+    db.execute.assert_awaited_once()
+    db.transaction.assert_called_once()
+    # attempt goes through the user_quiz_status upsert, same as the direct insert
+    upsert_query = str(db.fetch_all.call_args.args[0].compile(dialect=postgresql.dialect()))
+    assert 'INSERT INTO user_quiz_status' in upsert_query
+
+
+async def test_flush_attempts_inserts_batch_once_per_attempt(db, attempt_values):
+    attempt = AttemptWriteSchema(id=7, created_at='2023-01-01T00:00:00+00:00', **attempt_values)
+    entries = [StreamEntrySchema(entry_id=f'{i}-0', data=attempt.json()) for i in range(2)]
+
     with patch('app.quizzes.services.database', db):
-        validated_answers = await quiz_service.get_validated_attempt_answers(questions, answer_ids)
-    assert validated_answers == answers
+        await quiz_service.flush_attempts(entries)
 
+    query = db.execute.call_args_list[0].args[0]
+    assert 'ON CONFLICT (id) DO NOTHING' in str(query.compile(dialect=postgresql.dialect()))
+    assert len(query.compile().params) == len(attempt.dict())
 
-async def test_get_validated_attempt_answers_missing_answer(questions, answer_ids, answers, db):
-    del answers[2] # remove one answer
-    db.fetch_all.return_value = answers
-    with pytest.raises(BadRequestException, match="Some of submitted answers dont belong to its question"), \
-            patch('app.quizzes.services.database', db):
-        await quiz_service.get_validated_attempt_answers(questions, answer_ids)
 
+async def test_flush_attempts_drops_only_rows_that_cant_be_inserted(db, attempt_values):
+    attempts = [
+        AttemptWriteSchema(id=attempt_id, created_at='2023-01-01T00:00:00+00:00', **attempt_values)
+        for attempt_id in (7, 8)
+    ]
+    entries = [StreamEntrySchema(entry_id=f'{attempt.id}-0', data=attempt.json()) for attempt in attempts]
+    entries.append(StreamEntrySchema(entry_id='9-0', data='not json'))
+    # whole batch fails on attempt 8, then 7 and 8 are retried one by one
+    db.execute.side_effect = [ForeignKeyViolationError('fk'), None, ForeignKeyViolationError('fk')]
 
-async def test_get_validated_attempt_answers_duplicate_answer(questions, answer_ids, answers, db):
-    answer_ids[1].append(3) # add duplicate answer
-    db.fetch_all.return_value = answers
-    with pytest.raises(BadRequestException, match="you have duplicated answers"), \
-            patch('app.quizzes.services.database', db):
-        await quiz_service.get_validated_attempt_answers(questions, answer_ids)
+    with patch('app.quizzes.services.database', db):
+        await quiz_service.flush_attempts(entries)
 
+    assert [len(call.args[0].compile().params) for call in db.execute.call_args_list] == [
+        2 * len(attempts[0].dict()), len(attempts[0].dict()), len(attempts[0].dict())
+    ]
+    assert db.fetch_all.await_count == 1
 
-async def test_get_validated_attempt_answers_missing_answer_per_question(questions, answer_ids, answers, db):
-    answer_ids[1] = [] # empty answer list for one question
-    db.fetch_all.return_value = answers
-    with pytest.raises(BadRequestException, match="You need to give at least one answer per question"), \
-            patch('app.quizzes.services.database', db):
-        await quiz_service.get_validated_attempt_answers(questions, answer_ids)
 
+async def test_upsert_user_quiz_statuses_keeps_latest_attempt_per_pair(db, attempt_values):
+    attempts = [
+        AttemptWriteSchema(id=7, created_at='2023-01-01T00:00:00+00:00', **attempt_values),
+        AttemptWriteSchema(id=8, created_at='2023-01-02T00:00:00+00:00', **attempt_values)
+    ]
 
-async def test_get_validated_attempt_questions_returns_questions(questions, db):
-    question_ids = [question.id for question in questions]
-    db.fetch_all.return_value = questions
     with patch('app.quizzes.services.database', db):
-        validated_questions = await quiz_service.get_validated_attempt_questions(quiz_id=1, question_ids=question_ids)
-    assert len(validated_questions) == len(questions)
-    for question in questions:
-        assert question in validated_questions
-
-
-async def test_get_validated_attempt_questions_raises_error_on_incorrect_question_ids(questions, db):
-    question_ids = [question.id for question in questions]
-    db.fetch_all.return_value = questions
-    # add a fake question id that doesn't belong to any quiz
-    question_ids.append(999)
-    with patch('app.quizzes.services.database', db), pytest.raises(BadRequestException):
-        await quiz_service.get_validated_attempt_questions(quiz_id=1, question_ids=question_ids)
-
-
-async def test_get_validated_attempt_questions_raises_error_on_missing_question_answers(questions, db):
-    question_ids = [question.id for question in questions]
-    db.fetch_all.return_value = questions
-    # remove one question id from the list
-    question_ids.pop()
-    with patch('app.quizzes.services.database', db), pytest.raises(BadRequestException):
-        await quiz_service.get_validated_attempt_questions(quiz_id=1, question_ids=question_ids)
+        await quiz_service.upsert_user_quiz_statuses(attempts)
+
+    query = db.fetch_all.call_args.args[0].compile(dialect=postgresql.dialect())
+    assert 'ON CONFLICT (user_id, quiz_id) DO UPDATE' in str(query)
+    assert attempts[1].created_at in query.params.values()
+    assert attempts[0].created_at not in query.params.values()
+
+
+async def test_due_queue_pops_with_lease():
+    script = AsyncMock(return_value=[b'2:1'])
+    redis = MagicMock()
+    redis.register_script.return_value = script
+    queue = DueQueue('reminders')
+
+    with patch('app.core.due_queue.get_redis', AsyncMock(return_value=redis)):
+        members = await queue.pop_due(100, limit=10, lease=30)
+
+    assert members == ['2:1']
+    script.assert_awaited_once_with(keys=['reminders'], args=[100, 10, 130], client=redis)
+
+
+async def test_pop_due_reminders_checks_statuses(db):
+    now = datetime.datetime.now(datetime.timezone.utc)
+    db.fetch_all.return_value = [
+        MagicMock(user_id=2, quiz_id=1, last_attempt_at=now, due_at=now - datetime.timedelta(days=1)),
+        MagicMock(user_id=2, quiz_id=3, last_attempt_at=now, due_at=now + datetime.timedelta(days=1)),
+    ]
+    reminders = AsyncMock()
+    reminders.pop_due.return_value = ['2:1', '2:3', '2:4']
+
+    with patch('app.quizzes.services.database', db), patch('app.quizzes.services.attempt_reminders', reminders):
+        outdated_attempts, has_more = await quiz_service.pop_due_reminders(limit=3)
+
+    assert [(attempt.user_id, attempt.quiz_id) for attempt in outdated_attempts] == [(2, 1)]
+    assert has_more
+    reminders.remove.assert_awaited_once_with('2:4')
+    assert reminders.schedule.call_args.args[0] == {'2:3': db.fetch_all.return_value[1].due_at.timestamp()}
+
+
+async def test_send_due_reminders_drains_full_batches():
+    attempt = AttemptBaseSchema(quiz_id=1, user_id=2, taken_at='2023-01-01T00:00:00+00:00')
+    quizzes = AsyncMock()
+    quizzes.pop_due_reminders.side_effect = [([attempt], True), ([], True), ([attempt], False)]
+    notifications = AsyncMock()
+
+    with patch('app.schedulers.services.quiz_service', quizzes), \
+            patch('app.schedulers.services.notification_service', notifications):
+        await scheduler_service.send_due_reminders()
+
+    assert quizzes.pop_due_reminders.await_count == 3
+    assert notifications.on_attempts_outdate_send_notification_to_all_users.await_count == 2
+    assert quizzes.postpone_reminders.await_count == 2
+
+
+async def test_postpone_reminders_logs_redis_errors():
+    reminders = AsyncMock()
+    reminders.schedule.side_effect = RedisError('down')
+    attempts = [AttemptBaseSchema(quiz_id=2, user_id=1, taken_at='2023-01-01T00:00:00+00:00')]
+
+    with patch('app.quizzes.services.attempt_reminders', reminders), \
+            patch('app.quizzes.services.file_logger') as logger:
+        await quiz_service.postpone_reminders(attempts)
+
+    logger.error.assert_called_once()
+
+
+async def test_leader_election_is_lost_when_lease_is_taken():
+    script = AsyncMock(side_effect=[1, 0])
+    redis = MagicMock()
+    redis.register_script.return_value = script
+    leader = LeaderElection('leader', ttl=30)
+
+    with patch('app.schedulers.leader.get_redis', AsyncMock(return_value=redis)):
+        assert await leader.elect()
+        assert leader.is_leader
+        assert not await leader.elect()
+
+    assert not leader.is_leader
+    assert script.call_args.kwargs['args'] == [leader.node_id, 30000]
+
+
+async def test_run_job_records_status_only_on_leader():
+    redis = AsyncMock()
+    job = AsyncMock(return_value=5)
+
+    with patch('app.schedulers.services.get_redis', AsyncMock(return_value=redis)), \
+            patch.dict(scheduler_service.jobs, {'test_job': job}), \
+            patch.object(scheduler_service, 'leader_only_jobs', {'test_job'}):
+        await scheduler_service.run_job('test_job')
+        job.assert_not_awaited()
+
+        with patch.object(scheduler_service.leader, '_leader_until', float('inf')):
+            await scheduler_service.run_job('test_job')
+
+    key, value = redis.set.call_args.args
+    status = JobStatusSchema.parse_raw(value)
+    assert key == 'scheduler:jobs:test_job'
+    assert (status.status, status.rows, status.node) == ('success', 5, scheduler_service.leader.node_id)
+
+
+def make_sharded_job(process_chunk, **options):
+    return ShardedJob(
+        name='test_job', node_id='node', get_max_id=AsyncMock(return_value=25), process_chunk=process_chunk,
+        shard_size=10, lock_ttl=30, state_ttl=60, **options
+    )
+
+
+async def test_sharded_job_plan_waits_for_unfinished_run():
+    redis = AsyncMock()
+    redis.hgetall.return_value = {b'run_id': b'1', b'shards': b'3'}
+    redis.scard.return_value = 2
+    job = make_sharded_job(AsyncMock())
+
+    with patch('app.schedulers.sharding.get_redis', AsyncMock(return_value=redis)):
+        assert await job.plan() == 0
+        redis.scard.return_value = 3
+        assert await job.plan() == 3
+
+    assert redis.hset.call_args.kwargs['mapping']['shards'] == 3
+
+
+async def test_sharded_job_resumes_shards_from_checkpoints():
+    _, pipe = make_redis_pipeline()
+    redis = AsyncMock()
+    redis.pipeline = MagicMock(return_value=pipe)
+    redis.hgetall.return_value = {b'run_id': b'1', b'shards': b'3'}
+    redis.smembers.return_value = {b'0'}
+    # shard 2 is claimed by another node
+    redis.set.side_effect = [True, False]
+    redis.hget.return_value = b'[12, 4]'
+    refresh_lock = AsyncMock(return_value=1)
+    redis.register_script = MagicMock(return_value=refresh_lock)
+    process_chunk = AsyncMock(side_effect=[([15, 1], 10), (None, 3)])
+    job = make_sharded_job(process_chunk)
+
+    with patch('app.schedulers.sharding.get_redis', AsyncMock(return_value=redis)):
+        rows = await job.work()
+
+    assert rows == 13
+    assert [call.args for call in process_chunk.call_args_list] == [(10, 20, [12, 4]), (10, 20, [15, 1])]
+    pipe.hset.assert_called_once_with('scheduler:shards:test_job:1:checkpoints', 1, '[15, 1]')
+    pipe.sadd.assert_called_once_with('scheduler:shards:test_job:1:done', 1)
+
+
+async def test_sequence_allocator_reserves_blocks(db):
+    db.fetch_all.return_value = [(1,), (2,)]
+    allocator = SequenceAllocator('attempts_id_seq', block_size=2)
+
+    with patch('app.core.sequences.database', db):
+        ids = [await allocator.next() for _ in range(3)]
+
+    assert ids == [1, 2, 1]
+    assert db.fetch_all.await_count == 2
+
+
+@pytest.fixture
+def attempt_request():
+    return SubmitAttemptRequest(quiz_id=1, question_ids=[1], answer_ids=[[1]])
+
+
+async def test_submit_attempt_returns_stored_response_for_retries(attempt_request):
+    response = AttemptResponse(
+        attempt_id=7, quiz_id=1, user_id=2, questions=1, correct_answers=1, score=1,
+        taken_at='2023-01-01T00:00:00+00:00'
+    )
+    idempotency = AsyncMock()
+    idempotency.begin.return_value = response.json()
+
+    with patch('app.quizzes.services.attempt_idempotency', idempotency), \
+            patch.object(quiz_service, 'create_attempt', AsyncMock()) as create_attempt:
+        result = await quiz_service.submit_attempt(2, attempt_request, idempotency_key='key')
+
+    assert result == response
+    create_attempt.assert_not_awaited()
+
+
+async def test_submit_attempt_releases_idempotency_key_on_error(attempt_request):
+    idempotency = AsyncMock()
+    idempotency.begin.return_value = None
+
+    with patch('app.quizzes.services.attempt_idempotency', idempotency), \
+            patch.object(quiz_service, 'create_attempt', AsyncMock(side_effect=BadRequestException('wrong'))):
+        with pytest.raises(BadRequestException):
+            await quiz_service.submit_attempt(2, attempt_request, idempotency_key='key')
+
+    idempotency.abort.assert_awaited_once_with('2', 'key')
+    idempotency.complete.assert_not_awaited()
+
+
+@pytest.mark.parametrize('stored_fingerprint, stored_response', [
+    ('fingerprint', None),
+    ('other', '{}'),
+])
+async def test_idempotency_store_conflicts(stored_fingerprint, stored_response):
+    redis = AsyncMock()
+    redis.set.return_value = None
+    redis.get.return_value = json.dumps({'fingerprint': stored_fingerprint, 'response': stored_response})
+    store = IdempotencyStore('attempts', ttl=60, pending_ttl=5)
+
+    with patch('app.core.idempotency.get_redis', AsyncMock(return_value=redis)):
+        with pytest.raises(ConflictException):
+            await store.begin('2', 'key', 'fingerprint')
+
+
+# ---- Notifications ----
+def make_copy_connection(db, *results):
+    connection = MagicMock()
+    connection.raw_connection.copy_records_to_table = AsyncMock(side_effect=list(results))
+    db.connection = MagicMock()
+    db.connection.return_value.__aenter__ = AsyncMock(return_value=connection)
+    db.connection.return_value.__aexit__ = AsyncMock(return_value=None)
+    return connection.raw_connection.copy_records_to_table
+
+
+async def test_bulk_create_notifications_copies_rows(db):
+    copy_records = make_copy_connection(db, 'COPY 2')
+
+    with patch('app.notifications.services.database', db):
+        sent = await notification_service.bulk_create_notifications(to_user_ids=[1, 2], text='hi', created_by=3)
+
+    assert sent == 2
+    records = copy_records.call_args.kwargs['records']
+    assert [(record[1], record[2]) for record in records] == [('hi', 1), ('hi', 2)]
+    db.fetch_all.assert_not_awaited()
+
+
+async def test_quiz_create_notifications_are_sent_in_chunks(db):
+    db.fetch_all.side_effect = [
+        [MagicMock(id=1, user_id=10), MagicMock(id=2, user_id=20), MagicMock(id=3, user_id=30)],
+        [MagicMock(id=3, user_id=30)]
+    ]
+    copy_records = make_copy_connection(db, 'COPY 2', 'COPY 1')
+
+    with patch('app.notifications.services.database', db), \
+            patch.object(settings, 'NOTIFICATIONS_FANOUT_CHUNK_SIZE', 2):
+        sent = await notification_service.on_quiz_create_send_notification_to_all_company_members(
+            quiz_id=1, company_id=2, current_user_id=3
+        )
+
+    assert sent == 3
+    assert [[record[2] for record in call.kwargs['records']] for call in copy_records.call_args_list] == [[10, 20], [30]]